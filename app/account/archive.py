@@ -0,0 +1,156 @@
+"""
+Hot/cold partitioning of user accounts.
+
+Inactive users are moved from `users` to `users_archive` in batches, keeping their ids, so the
+user list and the indexes of `users` only cover the accounts in use. Lookups by id or email fall
+back to the archive, and restoring moves rows back unchanged. The rollup counters count both
+tables, so moving users between them never changes `/account/stats/`.
+
+    python -m app.account.archive --archive --batch-size 5000
+    python -m app.account.archive --restore --ids 12,57
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app.account import database, models
+
+User = models.User
+ArchivedUser = models.ArchivedUser
+COLUMNS = tuple(column.name for column in User.__table__.columns)
+
+
+def find(db: Session, id: int = None, email: str = None):
+    """
+    This function looks a user up by id or email in `users`, then in the archive.
+
+    :param db: The database session used for the lookups
+    :type db: Session
+    :param id: The id of the user
+    :type id: int
+    :param email: The email of the user, used when no id is given
+    :type email: str
+    :return: a `User`, an `ArchivedUser` when only the archive has it, or `None`.
+    """
+    for model in (User, ArchivedUser):
+        column = model.id if id is not None else model.email
+        user = db.query(model).filter(column == (id if id is not None else email)).first()
+        if user is not None:
+            return user
+    return None
+
+
+def email_archived(email: str, db: Session):
+    """
+    This function tells whether an archived user has this email, which new users cannot take.
+    """
+    return db.query(ArchivedUser.id).filter(ArchivedUser.email == email).first() is not None
+
+
+def _move(source, target, ids, db: Session):
+    columns = [getattr(source, name) for name in COLUMNS]
+    if target is ArchivedUser:
+        rows = select(*columns, literal(datetime.utcnow())).where(source.id.in_(ids))
+        db.execute(insert(target).from_select([*COLUMNS, 'archived_at'], rows))
+    else:
+        db.execute(insert(target).from_select(COLUMNS, select(*columns).where(source.id.in_(ids))))
+    db.execute(delete(source).where(source.id.in_(ids)))
+    db.commit()
+
+
+def archive(db: Session, batch_size: int = 1000, limit: int = None, pause: float = 0.0):
+    """
+    This function moves inactive users to the archive, one committed batch at a time.
+
+    The user with the highest id always stays in `users`: SQLite gives new rows the highest id
+    plus one, so keeping it there stops new users from reusing the id of an archived one.
+
+    :param db: The database session used for the moves
+    :type db: Session
+    :param batch_size: Users moved per transaction
+    :type batch_size: int
+    :param limit: Stop after this many users
+    :type limit: int
+    :param pause: Seconds to wait between batches, leaving the database to live requests
+    :type pause: float
+    :return: the number of users archived.
+    """
+    moved = 0
+    while limit is None or moved < limit:
+        highest = db.scalar(select(func.max(User.id)))
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        ids = db.scalars(
+            select(User.id)
+            .where(func.coalesce(User.is_active, False).is_(False), User.id != highest)
+            .order_by(User.id)
+            .limit(size)
+        ).all()
+        if not ids:
+            break
+        _move(User, ArchivedUser, ids, db)
+        moved += len(ids)
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def restore(db: Session, ids=None, batch_size: int = 1000):
+    """
+    This function moves archived users back to `users`, one committed batch at a time.
+
+    :param db: The database session used for the moves
+    :type db: Session
+    :param ids: The users to restore, or `None` for the whole archive
+    :param batch_size: Users moved per transaction
+    :type batch_size: int
+    :return: the number of users restored.
+    """
+    moved = 0
+    pending = list(ids) if ids is not None else None
+    while True:
+        if pending is None:
+            batch = db.scalars(select(ArchivedUser.id).order_by(ArchivedUser.id).limit(batch_size)).all()
+        else:
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            batch = db.scalars(select(ArchivedUser.id).where(ArchivedUser.id.in_(batch))).all() if batch else []
+        if not batch and not pending:
+            break
+        if batch:
+            _move(ArchivedUser, User, batch, db)
+            moved += len(batch)
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move inactive users to the archive table and back.')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--archive', action='store_true', help='archive inactive users')
+    action.add_argument('--restore', action='store_true', help='restore archived users')
+    parser.add_argument('--ids', default=None, help='comma separated ids to restore, all by default')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=None, help='archive at most this many users')
+    parser.add_argument('--pause-ms', type=float, default=0, help='pause between batches')
+    args = parser.parse_args(argv)
+
+    ArchivedUser.__table__.create(bind=database.engine, checkfirst=True)
+    db = database.SessionLocal()
+    try:
+        started = time.perf_counter()
+        if args.archive:
+            count = archive(db, args.batch_size, args.limit, args.pause_ms / 1000)
+            print(f"archived {count} users in {time.perf_counter() - started:.1f}s")
+        else:
+            ids = [int(item) for item in args.ids.split(',')] if args.ids else None
+            count = restore(db, ids, args.batch_size)
+            print(f"restored {count} users in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,35 @@
+import os
+import time
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from app.core import instrumentation, metrics, slowlog
+
+SQLALCHAMY_DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///./misdis.db')
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a connection.
+    """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
 
-SQLALCHAMY_DATABASE_URL = 'sqlite:///./misdis.db'
+# In-memory SQLite databases are per connection and keep SQLAlchemy's default singleton pool.
+_pool_options = {} if make_url(SQLALCHAMY_DATABASE_URL).database in (None, '', ':memory:') else {'poolclass': TimedQueuePool}
 
-engine = create_engine(SQLALCHAMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(SQLALCHAMY_DATABASE_URL, connect_args={"check_same_thread": False}, **_pool_options)
+instrumentation.install(engine)
+slowlog.install(engine)
 
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
@@ -15,7 +40,9 @@ def get_db():
     This function returns a database session and ensures it is closed after use.
     """
     db = SessionLocal()
+    started = time.perf_counter()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+        metrics.DB_SESSION_LIFETIME.observe(time.perf_counter() - started)
\ No newline at end of file
@@ -1,5 +1,7 @@
 from passlib.context import CryptContext
 
+from app.core import metrics
+
 pwd_cxt = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 class Hash():
@@ -13,7 +15,8 @@ class Hash():
         :type password: str
         :return: the hashed version of the input password using the bcrypt algorithm.
         """
-        hashedPassword = pwd_cxt.hash(password)
+        with metrics.BCRYPT_DURATION.labels('hash').time():
+            hashedPassword = pwd_cxt.hash(password)
         return hashedPassword
     
     def verify(hashed_password, plain_password):
@@ -29,4 +32,5 @@ class Hash():
         :return: a boolean value indicating whether the plain password matches the hashed password. If
         the passwords match, the function will return True, otherwise it will return False.
         """
-        return pwd_cxt.verify(plain_password, hashed_password)
\ No newline at end of file
+        with metrics.BCRYPT_DURATION.labels('verify').time():
+            return pwd_cxt.verify(plain_password, hashed_password)
\ No newline at end of file
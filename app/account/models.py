@@ -2,7 +2,7 @@ from enum import Enum
 
 from sqlalchemy import Boolean, Column, Date, DateTime
 from sqlalchemy import Enum as SQLAlchemyEnum
-from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy import ForeignKey, Index, Integer, String
 
 from .database import Base
 
@@ -34,9 +34,51 @@ class User(Base):
     contact = Column(String(17))
     city = Column(String(100), nullable=True)
     city_ne = Column(String(125), nullable=True)
-    country = Column(Integer, ForeignKey('country.id', ondelete='CASCADE'), back_populates='country')
-    province = Column(Integer, ForeignKey('province.id', ondelete='SET NULL'), back_populates='province', default=None, nullable=True)
-    district = Column(Integer, ForeignKey('district.id', ondelete='SET NULL'), back_populates='district', default=None, nullable=True)
-    municipality = Column(Integer, ForeignKey('municipality.id', ondelete='SET NULL'), back_populates='municipality', default=None, nullable=True)
+    country = Column(Integer, ForeignKey('country.id', ondelete='CASCADE'), back_populates='country', index=True)
+    province = Column(Integer, ForeignKey('province.id', ondelete='SET NULL'), back_populates='province', index=True, default=None, nullable=True)
+    district = Column(Integer, ForeignKey('district.id', ondelete='SET NULL'), back_populates='district', index=True, default=None, nullable=True)
+    municipality = Column(Integer, ForeignKey('municipality.id', ondelete='SET NULL'), back_populates='municipality', index=True, default=None, nullable=True)
     is_verified = Column(Boolean, default=False)
     is_active = Column(Boolean, default=False)
+
+
+class UserRollup(Base):
+    __tablename__='user_rollup'
+    __table_args__ = (
+        Index('ix_user_rollup_group', 'province', 'district', 'municipality', 'role', 'gender', 'is_active', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    province = Column(Integer, nullable=True)
+    district = Column(Integer, nullable=True)
+    municipality = Column(Integer, nullable=True)
+    role = Column(String(15), nullable=True)
+    gender = Column(String(25), nullable=True)
+    is_active = Column(Boolean, default=False)
+    count = Column(Integer, default=0, nullable=False)
+
+
+class ArchivedUser(Base):
+    __tablename__='users_archive'
+
+    # Cold copies of inactive users moved out of `users` by `app.account.archive`. The ids are kept,
+    # and only the primary key and email are indexed since the rows are only ever read one at a time.
+    id = Column(Integer, primary_key=True)
+    first_name = Column(String(64))
+    middle_name = Column(String(64), nullable=True)
+    last_name = Column(String(64))
+    dob = Column(Date)
+    email = Column(String, unique=True, index=True)
+    position = Column(String(255), nullable=True)
+    role = Column(String(15))
+    gender = Column(String(25))
+    contact = Column(String(17))
+    city = Column(String(100), nullable=True)
+    city_ne = Column(String(125), nullable=True)
+    country = Column(Integer)
+    province = Column(Integer, nullable=True)
+    district = Column(Integer, nullable=True)
+    municipality = Column(Integer, nullable=True)
+    is_verified = Column(Boolean, default=False)
+    is_active = Column(Boolean, default=False)
+    archived_at = Column(DateTime, nullable=False)
@@ -0,0 +1,181 @@
+import argparse
+import sys
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.account import database, models
+
+GROUP_FIELDS = ('province', 'district', 'municipality', 'role', 'gender', 'is_active')
+
+
+def group_key(user: models.User):
+    """
+    This function returns the rollup group a user is counted in.
+
+    :param user: The `user` parameter is a `User` model instance (or any object exposing the same
+    attributes) whose location, role, gender and active flag decide its rollup group
+    :type user: models.User
+    :return: a tuple of the values of `GROUP_FIELDS` for the given user.
+    """
+    return tuple(
+        bool(user.is_active) if field == 'is_active' else getattr(user, field)
+        for field in GROUP_FIELDS
+    )
+
+
+def apply(key: tuple, delta: int, db: Session):
+    """
+    This function adds `delta` to the counter of a rollup group, creating the group if needed.
+
+    The update runs on the caller's session so it is committed or rolled back together with the
+    write that caused it. `None` values match with `IS NULL`, which a plain unique index cannot do
+    on SQLite, so the row is updated first and only inserted when no group matched.
+
+    :param key: The rollup group as returned by `group_key`
+    :type key: tuple
+    :param delta: The amount to add to the group counter, negative when users leave the group
+    :type delta: int
+    :param db: The database session the originating user write is running in
+    :type db: Session
+    """
+    values = dict(zip(GROUP_FIELDS, key))
+    conditions = [getattr(models.UserRollup, field) == value for field, value in values.items()]
+    result = db.execute(
+        update(models.UserRollup)
+        .where(*conditions)
+        .values(count=models.UserRollup.count + delta)
+    )
+    if result.rowcount == 0 and delta > 0:
+        db.execute(insert(models.UserRollup).values(count=delta, **values))
+
+
+def add_user(user: models.User, db: Session):
+    """
+    This function counts a newly created user in its rollup group.
+    """
+    apply(group_key(user), 1, db)
+
+
+def remove_user(user: models.User, db: Session):
+    """
+    This function stops counting a deleted user in its rollup group.
+    """
+    apply(group_key(user), -1, db)
+
+
+def move_user(previous_key: tuple, user: models.User, db: Session):
+    """
+    This function moves an updated user from the group it was counted in to its current group.
+
+    :param previous_key: The value of `group_key` taken before the user was modified
+    :type previous_key: tuple
+    :param user: The modified user
+    :type user: models.User
+    :param db: The database session the user update is running in
+    :type db: Session
+    """
+    current_key = group_key(user)
+    if current_key != previous_key:
+        apply(previous_key, -1, db)
+        apply(current_key, 1, db)
+
+
+def get_stats(db: Session, **filters):
+    """
+    This function returns the user counts per rollup group without touching the `users` table.
+
+    :param db: The database session used to read the rollup table
+    :type db: Session
+    :param filters: Optional equality filters on any of `GROUP_FIELDS`; `None` values are ignored
+    :return: a list of `UserRollup` rows with a positive count.
+    """
+    query = db.query(models.UserRollup).filter(models.UserRollup.count > 0)
+    for field, value in filters.items():
+        if value is not None:
+            query = query.filter(getattr(models.UserRollup, field) == value)
+    return query.all()
+
+
+def _count_users(db: Session):
+    # Archived users are still counted, so archiving and restoring never changes the stats.
+    counts = {}
+    for model in (models.User, models.ArchivedUser):
+        columns = [getattr(model, field) for field in GROUP_FIELDS[:-1]]
+        is_active = func.coalesce(model.is_active, False)
+        rows = db.execute(
+            select(*columns, is_active, func.count()).group_by(*columns, is_active)
+        ).all()
+        for row in rows:
+            key = (*row[:-2], bool(row[-2]))
+            counts[key] = counts.get(key, 0) + row[-1]
+    return counts
+
+
+def rebuild(db: Session):
+    """
+    This function recomputes the whole rollup table from the `users` and `users_archive` tables in one
+    transaction.
+
+    :param db: The database session used for the rebuild
+    :type db: Session
+    :return: the number of rollup groups written.
+    """
+    counts = _count_users(db)
+    db.query(models.UserRollup).delete()
+    if counts:
+        db.execute(
+            insert(models.UserRollup),
+            [dict(zip(GROUP_FIELDS, key), count=count) for key, count in counts.items()]
+        )
+    db.commit()
+    return len(counts)
+
+
+def verify(db: Session):
+    """
+    This function compares the rollup table against a fresh `GROUP BY` over the `users` and
+    `users_archive` tables.
+
+    :param db: The database session used for the comparison
+    :type db: Session
+    :return: a list of `(group, expected, stored)` tuples for every group whose counts differ. An
+    empty list means the rollup is consistent.
+    """
+    expected = _count_users(db)
+    stored = {}
+    for row in db.query(models.UserRollup).all():
+        key = group_key(row)
+        stored[key] = stored.get(key, 0) + row.count
+    return [
+        (key, expected.get(key, 0), stored.get(key, 0))
+        for key in sorted(set(expected) | set(stored), key=repr)
+        if expected.get(key, 0) != stored.get(key, 0)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild or verify the user rollup counters.')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the rollup table from users')
+    parser.add_argument('--verify', action='store_true', help='check the rollup table against users')
+    args = parser.parse_args(argv)
+
+    models.UserRollup.__table__.create(bind=database.engine, checkfirst=True)
+    db = database.SessionLocal()
+    try:
+        if args.rebuild:
+            print(f"rebuilt {rebuild(db)} rollup groups")
+        if args.verify or not args.rebuild:
+            mismatches = verify(db)
+            for key, expected, stored in mismatches:
+                print(f"mismatch {dict(zip(GROUP_FIELDS, key))}: expected {expected}, stored {stored}")
+            if mismatches:
+                return 1
+            print("rollup is consistent")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
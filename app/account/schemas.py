@@ -40,15 +40,27 @@ class ShowUser(BaseModel):
     role: str
     dob: date
     contact: str
-    city: str
+    city: Optional[str]
     city_ne: Optional[str]
-    position: str
+    position: Optional[str]
     is_active: bool
     is_verified: bool
 
     class Config():
         orm_mode = True
 
+class ShowUserStats(BaseModel):
+    province: Optional[int]
+    district: Optional[int]
+    municipality: Optional[int]
+    role: Optional[str]
+    gender: Optional[str]
+    is_active: bool
+    count: int
+
+    class Config():
+        orm_mode = True
+
 class Login(BaseModel):
     username: str
     password: str
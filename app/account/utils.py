@@ -1,7 +1,10 @@
 from fastapi import HTTPException, status
+from sqlalchemy import or_, select
 from sqlalchemy.orm import Session
 
-from app.account import models, schemas
+from app.account import archive, models, rollup, schemas
+from app.core import config
+from app.federal import closure, store
 
 
 def create(reqquest: schemas.UserCreate, db: Session):
@@ -15,8 +18,27 @@ def create(reqquest: schemas.UserCreate, db: Session):
     interact with the database. It allows the function to perform database operations such as adding a
     new user, committing changes, and refreshing the user object with the latest data from the database
     :type db: Session
-    :return: the newly created user object.
+    :return: the newly created user object. The location ids must exist and belong to each other,
+    which is checked against the federal snapshot without querying. The user's rollup counter is incremented in the same
+    transaction, so `/account/stats/` never disagrees with the `users` table. Emails of archived
+    users stay taken, so restoring them cannot clash.
     """
+    location_error = store.hierarchy_error(
+        country=reqquest.country,
+        province=reqquest.province,
+        district=reqquest.district,
+        municipality=reqquest.municipality,
+    )
+    if location_error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=location_error
+        )
+    if archive.email_archived(reqquest.email, db):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"email {reqquest.email} belongs to an archived user"
+        )
     new_user = models.User(
         first_name=reqquest.first_name,
         middle_name=reqquest.middle_name,
@@ -29,29 +51,84 @@ def create(reqquest: schemas.UserCreate, db: Session):
         contact=reqquest.contact,
         city=reqquest.city,
         city_ne=reqquest.city_ne,
-        country_id=reqquest.country_id,
-        province_id=reqquest.province_id,
-        district_id=reqquest.district_id,
-        municipality_id=reqquest.municipality_id,
+        country=reqquest.country,
+        province=reqquest.province,
+        district=reqquest.district,
+        municipality=reqquest.municipality,
         is_verified=reqquest.is_verified,
         is_active=reqquest.is_active
     )
     db.add(new_user)
+    db.flush()
+    rollup.add_user(new_user, db)
     db.commit()
     db.refresh(new_user)
     return new_user
 
-def get_all(db: Session):
+def parse_region(value: str):
+    """
+    This function parses the `region` filter of the user list, e.g. `province:3`.
+
+    :param value: The level and id of the region, separated by a colon
+    :type value: str
+    :return: the `(level, id)` of the region.
+    """
+    level, _, id = value.partition(':')
+    if level not in closure.LEVELS or not id.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"region must look like province:3, with a level among {', '.join(closure.LEVELS)}"
+        )
+    return level, int(id)
+
+def _in_region(region: tuple):
+    # A user matches through the most precise location it has, at or below the region's level.
+    level, id = region
+    return or_(*(
+        getattr(models.User, column).in_(closure.within(level, id, column))
+        for column in closure.LEVELS[closure.LEVELS.index(level):]
+    ))
+
+def get_all(db: Session, region: tuple = None):
     """
     The function retrieves all users from a database using SQLAlchemy.
     
     :param db: Session
     :type db: Session
+    :param region: Only return users located in this `(level, id)` region or anywhere inside it
+    :type region: tuple
     :return: The function `get_all` returns a list of all the users in the database.
     """
-    users = db.query(models.User).all()
+    query = db.query(models.User)
+    if region is not None:
+        query = query.filter(_in_region(region))
+    users = query.all()
     return users
 
+def stream_all(db: Session, region: tuple = None, batch_size: int = None):
+    """
+    This function retrieves the users of `get_all` in batches read from one open cursor, for the
+    streaming mode of the user list.
+
+    :param db: Session
+    :type db: Session
+    :param region: Only return users located in this `(level, id)` region or anywhere inside it
+    :type region: tuple
+    :param batch_size: Users per batch, `config.STREAM_BATCH_SIZE` by default
+    :type batch_size: int
+    :return: a generator of lists of users as dictionaries of their columns. Only the current batch
+    is held in memory; rows are not loaded into the session.
+    """
+    statement = select(*models.User.__table__.columns)
+    if region is not None:
+        statement = statement.where(_in_region(region))
+    result = db.execute(statement, execution_options={'yield_per': batch_size or config.STREAM_BATCH_SIZE})
+    try:
+        for rows in result.partitions():
+            yield [dict(row._mapping) for row in rows]
+    finally:
+        result.close()
+
 def get_user(id: int, db: Session):
     """
     This function retrieves a user from a database by their ID and raises an exception if the user is
@@ -63,14 +140,26 @@ def get_user(id: int, db: Session):
     :param db: The "db" parameter is a SQLAlchemy session object that is used to interact with the
     database. It allows the function to query the database and retrieve the user with the specified ID
     :type db: Session
-    :return: a user object from the database with the specified id. If the user is not found, it raises
-    an HTTPException with a 400 status code and a message indicating that the user with the specified id
-    is not found.
+    :return: a user object from the database with the specified id, looked up in the archive when it
+    is not in the `users` table. If the user is not found, it raises an HTTPException with a 400
+    status code and a message indicating that the user with the specified id is not found.
     """
-    user = db.query(models.User).filter(models.User.id == id).first()
+    user = archive.find(db, id=id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"user with the id {id} is not found."
         )
-    return user
\ No newline at end of file
+    return user
+
+def get_stats(db: Session, **filters):
+    """
+    This function returns the number of users per province, district, municipality, role, gender and
+    active flag from the incrementally maintained rollup table.
+
+    :param db: The "db" parameter is a SQLAlchemy session object used to read the rollup table
+    :type db: Session
+    :param filters: Optional equality filters on the rollup group columns
+    :return: a list of rollup rows, one per non-empty group.
+    """
+    return rollup.get_stats(db, **filters)
\ No newline at end of file
@@ -1,8 +1,12 @@
+from typing import List, Optional
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
-from app.account import database, models, schemas, token, utils
+from app.account import archive, database, models, schemas, token, utils
+from app.core import streaming
+from app.core.querybudget import query_budget
 
 from .hashing import Hash
 
@@ -15,6 +19,7 @@ get_db = database.get_db
 
 
 @router.post('/login/')
+@query_budget(2)
 def login(request: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
     """
     This function handles user login authentication and returns an access token.
@@ -31,8 +36,7 @@ def login(request: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(
     a JWT access token generated using the user's email as the subject, and the value of "token_type" is
     "bearer".
     """
-    user = db.query(models.User).filter(
-        models.User.email == request.username).first()
+    user = archive.find(db, email=request.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -47,6 +51,7 @@ def login(request: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post('/', status_code=status.HTTP_201_CREATED)
+@query_budget(11)
 def create(request: schemas.UserCreate, db: Session = Depends(get_db)):
     """
     This function creates a new user in the database using the provided user creation request and
@@ -67,10 +72,17 @@ def create(request: schemas.UserCreate, db: Session = Depends(get_db)):
     return utils.create(request, db)
 
 @router.get('/', response_model=None)
-def get_users(db: Session = Depends(get_db)):
+@query_budget(1)
+def get_users(region: Optional[str] = None, stream: bool = False, db: Session = Depends(get_db)):
     """
     This function retrieves all users from the database.
     
+    :param region: Optional region such as `province:3`; only users located in it or in any region
+    inside it are returned
+    :type region: Optional[str]
+    :param stream: Send the users as a JSON array streamed in batches from a database cursor, so the
+    response never holds the whole list in memory
+    :type stream: bool
     :param db: The parameter `db` is of type `Session` and is a dependency that is obtained using the
     `get_db` function. It is used to access the database and perform CRUD (Create, Read, Update, Delete)
     operations on the `utils` table. The `get_all` function is
@@ -80,9 +92,48 @@ def get_users(db: Session = Depends(get_db)):
     implementation of the `get_all` function, but it is likely a list of user objects or a database
     query result containing user data.
     """
-    return utils.get_all(db)
+    region = utils.parse_region(region) if region else None
+    if stream:
+        return streaming.json_array_response(utils.stream_all(db, region))
+    return utils.get_all(db, region)
+
+@router.get('/stats/', status_code=status.HTTP_200_OK, response_model=List[schemas.ShowUserStats])
+@query_budget(1)
+def get_stats(
+    province: Optional[int] = None,
+    district: Optional[int] = None,
+    municipality: Optional[int] = None,
+    role: Optional[models.RoleEnum] = None,
+    gender: Optional[models.GenderEnum] = None,
+    is_active: Optional[bool] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    This function returns user counts grouped by location, role, gender and active flag.
+    
+    :param province: Optional province id to restrict the counts to
+    :param district: Optional district id to restrict the counts to
+    :param municipality: Optional municipality id to restrict the counts to
+    :param role: Optional role to restrict the counts to
+    :param gender: Optional gender to restrict the counts to
+    :param is_active: Optional active flag to restrict the counts to
+    :param db: The parameter `db` is a database session object obtained using the `get_db` dependency
+    :type db: Session
+    :return: a list of groups with their user count. The counts come from the rollup table maintained
+    by `utils.create`, so the cost depends on the number of groups rather than the number of users.
+    """
+    return utils.get_stats(
+        db,
+        province=province,
+        district=district,
+        municipality=municipality,
+        role=role.value if role else None,
+        gender=gender.value if gender else None,
+        is_active=is_active
+    )
 
 @router.get('/{id}/', status_code=status.HTTP_200_OK, response_model=schemas.ShowUser)
+@query_budget(2)
 def get_user(id: int, db: Session = Depends(get_db)):
     """
     This function retrieves a user from a database by their ID.
@@ -0,0 +1,174 @@
+"""
+Admission control: per route class concurrency limits with bounded waiting queues.
+
+Every HTTP request is put in a class before routing, from its method and path. A class admits up
+to its concurrency limit at once; further requests wait in a FIFO queue of bounded size, and are
+shed with a `Retry-After` header when the queue is full or when they waited longer than
+`config.ADMISSION_QUEUE_TIMEOUT`. Login bursts are answered with 429, the other classes with 503.
+Monitoring routes are never queued, so an overloaded worker can still be observed.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import deque
+
+from app.core import config, metrics
+
+AUTH = 'auth'
+WRITE = 'write'
+READ = 'read'
+AUTH_PATHS = ('/account/login/',)
+EXEMPT_PREFIXES = ('/metrics', '/admin/')
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def classify(scope):
+    """
+    This function returns the route class of a request, or `None` when it is not limited.
+    """
+    path = scope['path']
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path in AUTH_PATHS:
+        return AUTH
+    return READ if scope['method'] in READ_METHODS else WRITE
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """
+    Concurrency limit and waiting queue of one route class. Only used from the event loop, so the
+    counters need no lock; a released slot is handed straight to the oldest waiter.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiters = deque()
+        # Moving average of how long a request holds its slot, for the Retry-After estimate.
+        self.service_time = 0.05
+        self._active = metrics.ADMISSION_ACTIVE.labels(name)
+        self._depth = metrics.ADMISSION_QUEUE_DEPTH.labels(name)
+        self._wait = metrics.ADMISSION_WAIT.labels(name)
+
+    def retry_after(self):
+        """
+        This function estimates in whole seconds when the queue will have drained.
+        """
+        backlog = (len(self.waiters) + 1) * self.service_time / self.concurrency
+        return max(1, math.ceil(backlog))
+
+    def _reject(self, reason: str):
+        metrics.ADMISSION_REJECTED.labels(self.name, reason).inc()
+        raise Rejected(reason, self.retry_after())
+
+    async def acquire(self):
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            self._active.inc()
+            self._wait.observe(0.0)
+            return
+        if len(self.waiters) >= self.queue_size:
+            self._reject('queue_full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self._depth.inc()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over while timing out; give it to the next waiter instead.
+                self._hand_over()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            self._reject('timeout')
+        finally:
+            self._depth.dec()
+        self._wait.observe(time.perf_counter() - started)
+
+    def release(self, held: float):
+        self.service_time += (held - self.service_time) * 0.2
+        self._hand_over()
+
+    def _hand_over(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        self._active.dec()
+
+
+def limiters():
+    """
+    This function builds the limiters of the configured route classes.
+    """
+    limits = {
+        AUTH: (config.ADMISSION_AUTH_CONCURRENCY, config.ADMISSION_AUTH_QUEUE),
+        WRITE: (config.ADMISSION_WRITE_CONCURRENCY, config.ADMISSION_WRITE_QUEUE),
+        READ: (config.ADMISSION_READ_CONCURRENCY, config.ADMISSION_READ_QUEUE),
+    }
+    return {
+        name: Limiter(name, concurrency, queue_size, config.ADMISSION_QUEUE_TIMEOUT)
+        for name, (concurrency, queue_size) in limits.items()
+        if concurrency > 0
+    }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware holding every limited request in its class's queue until a slot is free. The
+    slot is held until the response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.limiters = limiters()
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get(classify(scope)) if scope['type'] == 'http' else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except Rejected as exc:
+            await self._shed(limiter, exc, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - started)
+
+    async def _shed(self, limiter: Limiter, exc: Rejected, send):
+        status_code = 429 if limiter.name == AUTH else 503
+        detail = 'queue is full' if exc.reason == 'queue_full' else 'timed out waiting in the queue'
+        body = json.dumps({'detail': f'Too many {limiter.name} requests, {detail}'}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(exc.retry_after).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,247 @@
+"""
+Online backups of the SQLite database with SQLite's backup API.
+
+The pages are copied a few at a time with a pause between steps; the source is only locked while
+a step runs, so requests keep reading and writing during the backup. A write by another
+connection makes SQLite restart the copy, and after `MAX_RESTARTS` of them the remaining copy is
+done in a single step so a busy database still gets backed up. The copy is written next to the
+destination, optionally checked with `PRAGMA integrity_check` and gzip-compressed, then renamed
+into place.
+
+    python -m app.core.backup --output backups/misdis.db.gz --gzip
+"""
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy.engine import make_url
+
+from app.account import database
+from app.core import config
+
+MAX_RESTARTS = 3
+
+
+class _Restarted(Exception):
+    pass
+
+
+class Progress:
+    """
+    State of a backup, updated after every step so that it can be reported while it runs. `state`
+    goes through `copying`, `verifying` and `compressing` to `done` or `failed`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state = 'copying'
+        self.started_at = datetime.now(timezone.utc)
+        self.total_pages = 0
+        self.remaining_pages = 0
+        self.restarts = 0
+        self.page_size = 0
+        self.elapsed = 0.0
+        self.size = None
+        self.integrity = None
+        self.error = None
+
+    @property
+    def running(self):
+        return self.state not in ('done', 'failed')
+
+    def as_dict(self):
+        copied = self.total_pages - self.remaining_pages
+        copied_bytes = copied * self.page_size
+        return {
+            'path': self.path,
+            'state': self.state,
+            'started_at': self.started_at.isoformat(),
+            'pages': self.total_pages,
+            'copied_pages': copied,
+            'percent': round(copied * 100 / self.total_pages, 1) if self.total_pages else 0.0,
+            'restarts': self.restarts,
+            'elapsed_s': round(self.elapsed, 3),
+            'throughput_mb_s': round(copied_bytes / self.elapsed / 1e6, 2) if self.elapsed else None,
+            'size': self.size,
+            'integrity': self.integrity,
+            'error': self.error,
+        }
+
+
+def source_path():
+    """
+    This function returns the file of the database the application uses.
+    """
+    path = make_url(database.SQLALCHAMY_DATABASE_URL).database
+    if path in (None, '', ':memory:'):
+        raise ValueError('only file databases can be backed up')
+    return path
+
+
+def _copy(source: sqlite3.Connection, target: sqlite3.Connection, pages: int, sleep: float, progress: Progress):
+    started = time.perf_counter()
+
+    def step(status, remaining, total):
+        # A restart starts over from the first page, so the copied count stops growing.
+        if progress.total_pages and total - remaining <= progress.total_pages - progress.remaining_pages:
+            progress.restarts += 1
+            if progress.restarts > MAX_RESTARTS:
+                raise _Restarted()
+        progress.total_pages, progress.remaining_pages = total, remaining
+        progress.elapsed = time.perf_counter() - started
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    try:
+        source.backup(target, pages=pages, progress=step)
+    except _Restarted:
+        # Writes keep invalidating the copied pages; copy the rest at once under one read lock.
+        source.backup(target, pages=-1)
+        progress.remaining_pages = 0
+    progress.elapsed = time.perf_counter() - started
+
+
+def run(destination: str, pages: int = None, sleep: float = None, compress: bool = False,
+        verify: bool = True, progress: Progress = None):
+    """
+    This function backs up the application database to a file while it stays in use.
+
+    :param destination: The backup file; with `compress` it is a gzip file of the database
+    :type destination: str
+    :param pages: Pages copied per step, `config.BACKUP_PAGES_PER_STEP` by default
+    :type pages: int
+    :param sleep: Seconds to pause between steps, `config.BACKUP_STEP_SLEEP` by default
+    :type sleep: float
+    :param compress: Gzip the backup
+    :type compress: bool
+    :param verify: Run `PRAGMA integrity_check` on the copy and fail when it reports a problem
+    :type verify: bool
+    :param progress: Receives the progress while the backup runs; a new one is made when omitted
+    :type progress: Progress
+    :return: the final `Progress` of the backup.
+    """
+    pages = config.BACKUP_PAGES_PER_STEP if pages is None else pages
+    sleep = config.BACKUP_STEP_SLEEP if sleep is None else sleep
+    progress = progress or Progress(destination)
+    directory = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(directory, exist_ok=True)
+    copy_path = os.path.join(directory, f'.{os.path.basename(destination)}.partial')
+    try:
+        source = sqlite3.connect(source_path())
+        target = sqlite3.connect(copy_path)
+        try:
+            progress.page_size = source.execute('PRAGMA page_size').fetchone()[0]
+            _copy(source, target, pages, sleep, progress)
+            if verify:
+                progress.state = 'verifying'
+                problems = [row[0] for row in target.execute('PRAGMA integrity_check')]
+                progress.integrity = 'ok' if problems == ['ok'] else '; '.join(problems)
+        finally:
+            target.close()
+            source.close()
+        if verify and progress.integrity != 'ok':
+            raise RuntimeError(f'integrity check of the backup failed: {progress.integrity}')
+        if compress:
+            progress.state = 'compressing'
+            compressed_path = f'{copy_path}.gz'
+            with open(copy_path, 'rb') as plain, gzip.open(compressed_path, 'wb', compresslevel=config.GZIP_LEVEL) as packed:
+                shutil.copyfileobj(plain, packed, 1024 * 1024)
+            os.replace(compressed_path, copy_path)
+        os.replace(copy_path, destination)
+        progress.size = os.path.getsize(destination)
+        progress.state = 'done'
+    except BaseException as exc:
+        progress.state = 'failed'
+        progress.error = str(exc)
+        for path in (copy_path, f'{copy_path}.gz'):
+            if os.path.exists(path):
+                os.unlink(path)
+        raise
+    return progress
+
+
+_current = None
+_lock = threading.Lock()
+
+
+def start(compress: bool = False, verify: bool = True):
+    """
+    This function starts a backup into `config.BACKUP_DIR` in a background thread.
+
+    :param compress: Gzip the backup
+    :type compress: bool
+    :param verify: Check the integrity of the copy
+    :type verify: bool
+    :return: the `Progress` of the new backup, or `None` when a backup is already running.
+    """
+    global _current
+    source_path()
+    with _lock:
+        if _current is not None and _current.running:
+            return None
+        name = f"misdis-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}.db{'.gz' if compress else ''}"
+        progress = _current = Progress(os.path.join(config.BACKUP_DIR, name))
+
+    def target():
+        try:
+            run(progress.path, compress=compress, verify=verify, progress=progress)
+        except Exception:
+            pass  # recorded on the progress
+
+    threading.Thread(target=target, name='backup', daemon=True).start()
+    return progress
+
+
+def status():
+    """
+    This function returns the progress of the running or last backup, or `None`.
+    """
+    return _current.as_dict() if _current is not None else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Back up the database while the application runs.')
+    parser.add_argument('--output', required=True, help='the backup file')
+    parser.add_argument('--gzip', action='store_true', help='compress the backup')
+    parser.add_argument('--no-verify', action='store_true', help='skip the integrity check of the copy')
+    parser.add_argument('--pages', type=int, default=config.BACKUP_PAGES_PER_STEP, help='pages copied per step')
+    parser.add_argument('--sleep-ms', type=float, default=config.BACKUP_STEP_SLEEP * 1000, help='pause between steps')
+    args = parser.parse_args(argv)
+
+    progress = Progress(args.output)
+    reporter = threading.Thread(target=lambda: _report(progress), daemon=True)
+    reporter.start()
+    try:
+        run(args.output, args.pages, args.sleep_ms / 1000, args.gzip, not args.no_verify, progress)
+    except Exception as exc:
+        print(f"backup failed: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        reporter.join()
+    result = progress.as_dict()
+    print(
+        f"{result['path']}: {result['pages']} pages in {result['elapsed_s']} s "
+        f"({result['throughput_mb_s']} MB/s, {result['restarts']} restarts), {result['size']} bytes, "
+        f"integrity {result['integrity'] or 'not checked'}"
+    )
+    return 0
+
+
+def _report(progress: Progress):
+    while progress.running:
+        time.sleep(1)
+        if progress.state == 'copying':
+            result = progress.as_dict()
+            print(f"  {result['percent']}% of {result['pages']} pages, {result['throughput_mb_s']} MB/s", file=sys.stderr)
+        elif progress.running:
+            print(f"  {progress.state}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
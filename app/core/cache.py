@@ -0,0 +1,165 @@
+"""
+Serialized response bodies cached per data version.
+
+Data versions are counters in the `cache_version` table, shared by every worker using the
+database. Writers call `bump(namespace, db)` in the transaction of their write; each worker
+re-reads the counters at most every `config.CACHE_POLL_INTERVAL` seconds, and right after one of its
+own bumps commits, so a write is visible to every worker's caches within one poll interval. A body
+cached under an older version is rebuilt by the next request. Each body is serialized once and
+compressed at most once per encoding and version, concurrent misses waiting for the thread doing
+the work, so a hit costs no serialization and no compression.
+"""
+import json
+import threading
+import time
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app.account import database
+from app.core import compression, config, metrics, models
+
+_versions = {}
+_polled_at = None
+_poll_lock = threading.Lock()
+_bodies = {}
+_loading = {}
+_loading_lock = threading.Lock()
+
+
+def _poll():
+    global _versions, _polled_at
+    with database.engine.connect() as connection:
+        rows = connection.execute(select(models.CacheVersion.namespace, models.CacheVersion.version)).all()
+    _versions = dict(rows)
+    _polled_at = time.monotonic()
+
+
+def _due():
+    return _polled_at is None or time.monotonic() - _polled_at >= config.CACHE_POLL_INTERVAL
+
+
+def version(namespace: str, refresh: bool = False):
+    """
+    This function returns the current data version of a namespace as last seen by this worker.
+
+    :param namespace: The namespace, e.g. `federal`
+    :type namespace: str
+    :param refresh: Read the version from the database now instead of waiting for the next poll
+    :type refresh: bool
+    :return: the version, at most `config.CACHE_POLL_INTERVAL` seconds behind the database.
+    """
+    if refresh or _due():
+        with _poll_lock:
+            if refresh or _due():
+                _poll()
+    return _versions.get(namespace, 0)
+
+
+def bump(namespace: str, db: Session):
+    """
+    This function invalidates, in every worker, the bodies cached under a namespace.
+
+    The counter is incremented in the caller's session, so it is committed or rolled back together
+    with the write that changed the data.
+
+    :param namespace: The namespace whose data changed, e.g. `federal`
+    :type namespace: str
+    :param db: The database session of the write
+    :type db: Session
+    """
+    statement = insert(models.CacheVersion).values(namespace=namespace, version=1)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[models.CacheVersion.namespace],
+        set_={'version': models.CacheVersion.version + 1},
+    ))
+    db.info['cache_bumped'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    global _polled_at
+    if session.info.pop('cache_bumped', False):
+        # The writing worker serves its own write on the next request instead of after a poll.
+        _polled_at = None
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('cache_bumped', None)
+
+
+class CachedBody:
+    __slots__ = ('version', 'encoded', 'lock')
+
+    def __init__(self, data_version: int, body: bytes):
+        self.version = data_version
+        self.encoded = {compression.IDENTITY: body}
+        self.lock = threading.Lock()
+
+    def get(self, encoding: str):
+        body = self.encoded.get(encoding)
+        if body is None:
+            # Compressing at the highest level is slow; concurrent requests wait for one thread.
+            with self.lock:
+                body = self.encoded.get(encoding)
+                if body is None:
+                    body = self.encoded[encoding] = compression.compress(
+                        self.encoded[compression.IDENTITY], encoding, best=True
+                    )
+        return body
+
+
+def _load_lock(key: str):
+    lock = _loading.get(key)
+    if lock is None:
+        with _loading_lock:
+            lock = _loading.setdefault(key, threading.Lock())
+    return lock
+
+
+def render_json(content):
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')
+    ).encode('utf-8')
+
+
+def json_response(request: Request, key: str, namespace: str, loader, headers: dict = None):
+    """
+    This function serves a JSON body from the cache, building it with `loader` on a miss.
+
+    :param request: The request being served, used for content negotiation
+    :type request: Request
+    :param key: The cache key of the body, usually the route
+    :type key: str
+    :param namespace: The namespace whose version the body depends on
+    :type namespace: str
+    :param loader: A callable returning the content to serialize
+    :param headers: Extra response headers; a `vary` value is combined with `Accept-Encoding`
+    :type headers: dict
+    :return: a Response carrying the body in the best encoding the client accepts.
+    """
+    # The version is read before loading, so a write racing with the load leaves the entry stale
+    # rather than caching old rows under the new version.
+    data_version = version(namespace)
+    entry = _bodies.get(key)
+    hit = entry is not None and entry.version == data_version
+    metrics.record_cache('response_bodies', hit)
+    if not hit:
+        # Concurrent misses of the same key wait for the first one to load the body.
+        with _load_lock(key):
+            entry = _bodies.get(key)
+            if entry is None or entry.version != data_version:
+                entry = _bodies[key] = CachedBody(data_version, render_json(loader()))
+
+    encoding = compression.negotiate(request.headers.get('accept-encoding', ''))
+    if len(entry.encoded[compression.IDENTITY]) < config.COMPRESSION_MIN_SIZE:
+        encoding = compression.IDENTITY
+    headers = dict(headers or {})
+    headers['vary'] = ', '.join(filter(None, (headers.get('vary'), 'Accept-Encoding')))
+    if encoding != compression.IDENTITY:
+        headers['content-encoding'] = encoding
+    return Response(entry.get(encoding), media_type='application/json', headers=headers)
@@ -0,0 +1,183 @@
+"""
+Opt-in capture of sanitized request traces for replaying production-shaped load.
+
+With `config.CAPTURE_FILE` set, a sample of the HTTP requests is written to that file as JSON
+lines: the arrival time, method, path, route template, query parameters, the headers responses
+depend on, the request body and the status, size and duration of the response. Values that
+identify a person (emails, names, contacts, dates of birth, passwords and tokens) are replaced by a
+redaction marker keeping only their type and length, and the authorization header is only recorded
+as present or not. `benchmarks/replay.py` feeds the traces back into the app.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from urllib.parse import parse_qsl
+
+from starlette.routing import Match
+
+from app.core import config
+from app.core.instrumentation import UNMATCHED_ROUTE, route_template
+
+logger = logging.getLogger('app.traffic')
+logger.propagate = False
+
+EXEMPT_PREFIXES = ('/metrics', '/admin/')
+# Request headers recorded as is, since responses vary with them.
+HEADERS = (b'accept', b'accept-encoding', b'accept-language', b'content-type')
+# Body fields, form fields and query parameters whose values are redacted.
+SENSITIVE_FIELDS = frozenset((
+    'email', 'username', 'password', 'first_name', 'middle_name', 'last_name', 'dob', 'contact',
+    'client_secret', 'access_token', 'token',
+))
+REDACTED = '$redacted'
+
+_handler_lock = threading.Lock()
+
+
+def _ensure_handler():
+    if logger.handlers:
+        return
+    with _handler_lock:
+        if not logger.handlers:
+            handler = RotatingFileHandler(
+                config.CAPTURE_FILE,
+                maxBytes=config.CAPTURE_FILE_MAX_BYTES,
+                backupCount=config.CAPTURE_FILE_BACKUPS,
+                encoding='utf-8',
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+
+def redact(value):
+    """
+    This function returns the marker standing in for a sensitive value in a trace.
+    """
+    marker = {REDACTED: type(value).__name__}
+    if isinstance(value, str):
+        marker['length'] = len(value)
+    return marker
+
+
+def sanitize(value, key: str = None):
+    """
+    This function returns a copy of a decoded JSON value with the sensitive fields redacted.
+
+    :param value: The decoded JSON value
+    :param key: The name of the field holding `value`, if any
+    :type key: str
+    :return: the value with every field named in `SENSITIVE_FIELDS` replaced by a redaction marker.
+    """
+    if isinstance(value, dict):
+        return {name: sanitize(item, name) for name, item in value.items()}
+    if isinstance(value, list):
+        return [sanitize(item, key) for item in value]
+    if key in SENSITIVE_FIELDS and value is not None:
+        return redact(value)
+    return value
+
+
+def _fields(pairs):
+    return [[name, redact(value) if name in SENSITIVE_FIELDS else value] for name, value in pairs]
+
+
+def _body(content_type: str, body: bytes, truncated: bool):
+    if not body:
+        return None
+    if truncated:
+        return {'bytes': len(body), 'truncated': True}
+    if content_type.startswith('application/json'):
+        try:
+            return {'json': sanitize(json.loads(body))}
+        except ValueError:
+            pass
+    elif content_type.startswith('application/x-www-form-urlencoded'):
+        return {'form': _fields(parse_qsl(body.decode('latin-1'), keep_blank_values=True))}
+    return {'bytes': len(body)}
+
+
+def resolve_route(scope):
+    """
+    This function returns the route template of a request, matching it against the app's routes
+    when it never reached the router, e.g. when it was answered by single-flight or shed.
+    """
+    route = route_template(scope)
+    if route != UNMATCHED_ROUTE or 'app' not in scope:
+        return route
+    for candidate in scope['app'].router.routes:
+        match, _ = candidate.matches(scope)
+        if match == Match.FULL:
+            return candidate.path
+    return UNMATCHED_ROUTE
+
+
+class CaptureMiddleware:
+    """
+    ASGI middleware writing one sanitized trace line per sampled request once it has been answered.
+    It sits outside every other middleware, so requests shed by admission control or coalesced by
+    single-flight are captured as the client saw them.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not config.CAPTURE_FILE
+            or scope['type'] != 'http'
+            or scope['path'].startswith(EXEMPT_PREFIXES)
+            or random.random() >= config.CAPTURE_SAMPLE_RATE
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        chunks = []
+        received = 0
+        status_code = 500
+        response_bytes = 0
+
+        async def receive_and_record():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                body = message.get('body', b'')
+                received += len(body)
+                if received <= config.CAPTURE_MAX_BODY_BYTES:
+                    chunks.append(body)
+            return message
+
+        async def send_and_record(message):
+            nonlocal status_code, response_bytes
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            elif message['type'] == 'http.response.body':
+                response_bytes += len(message.get('body', b''))
+            await send(message)
+
+        arrived = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_and_record, send_and_record)
+        finally:
+            duration = time.perf_counter() - started
+            headers = dict(scope['headers'])
+            body = b''.join(chunks)
+            trace = {
+                't': round(arrived, 6),
+                'method': scope['method'],
+                'path': scope['path'],
+                'route': resolve_route(scope),
+                'query': _fields(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)),
+                'headers': {name.decode(): headers[name].decode('latin-1') for name in HEADERS if name in headers},
+                'auth': b'authorization' in headers,
+                'body': _body(headers.get(b'content-type', b'').decode('latin-1'), body, received > len(body)),
+                'status': status_code,
+                'response_bytes': response_bytes,
+                'duration_ms': round(duration * 1000, 3),
+            }
+            _ensure_handler()
+            logger.info(json.dumps(trace, ensure_ascii=False, separators=(',', ':')))
@@ -0,0 +1,177 @@
+"""
+gzip and brotli response compression.
+
+brotli is optional: when the `brotli` package is not installed only gzip is negotiated.
+"""
+import gzip
+import zlib
+
+from app.core import config
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+IDENTITY = 'identity'
+GZIP = 'gzip'
+BROTLI = 'br'
+MAX_GZIP_LEVEL = 9
+MAX_BROTLI_QUALITY = 11
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml')
+
+
+def supported_encodings():
+    return (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def negotiate(accept_encoding: str):
+    """
+    This function picks the response encoding for an Accept-Encoding header.
+
+    :param accept_encoding: The raw value of the Accept-Encoding request header
+    :type accept_encoding: str
+    :return: `br` or `gzip` when the client accepts it with a non-zero q-value (brotli wins ties),
+    otherwise `identity`.
+    """
+    if not accept_encoding:
+        return IDENTITY
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, parameters = item.strip().partition(';')
+        weight = 1.0
+        parameters = parameters.strip()
+        if parameters.startswith('q='):
+            try:
+                weight = float(parameters[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = IDENTITY, 0.0
+    for encoding in supported_encodings():
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: str, best: bool = False):
+    """
+    This function compresses a whole body.
+
+    :param body: The bytes to compress
+    :type body: bytes
+    :param encoding: `br`, `gzip` or `identity`
+    :type encoding: str
+    :param best: Use the highest compression level, for bodies that are compressed once and
+    served many times
+    :type best: bool
+    """
+    if encoding == GZIP:
+        return gzip.compress(body, compresslevel=MAX_GZIP_LEVEL if best else config.GZIP_LEVEL, mtime=0)
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=MAX_BROTLI_QUALITY if best else config.BROTLI_QUALITY)
+    return body
+
+
+def _compressor(encoding: str):
+    if encoding == GZIP:
+        compressor = zlib.compressobj(config.GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    compressor = brotli.Compressor(quality=config.BROTLI_QUALITY)
+    return lambda chunk: compressor.process(chunk) + compressor.flush(), compressor.finish
+
+
+def accept_encoding(scope):
+    for name, value in scope['headers']:
+        if name == b'accept-encoding':
+            return value.decode('latin-1')
+    return ''
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with the best encoding the client accepts.
+
+    Responses that already carry a Content-Encoding (such as the precompressed cached bodies),
+    responses below `minimum_size` and non-text content types are passed through untouched.
+    Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = config.COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(accept_encoding(scope))
+        if encoding == IDENTITY:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.passthrough = False
+        self.stream = None
+
+    def _compressible(self, headers):
+        content_type = b''
+        for name, value in headers:
+            if name == b'content-encoding':
+                return False
+            if name == b'content-type':
+                content_type = value
+        return content_type.decode('latin-1').lower().startswith(COMPRESSIBLE_TYPES)
+
+    def _encoded_headers(self, length=None):
+        headers = [
+            (name, value) for name, value in self.start.get('headers', [])
+            if name not in (b'content-length', b'vary')
+        ]
+        vary = [value for name, value in self.start.get('headers', []) if name == b'vary']
+        headers.append((b'content-encoding', self.encoding.encode()))
+        headers.append((b'vary', b', '.join([*vary, b'Accept-Encoding'])))
+        if length is not None:
+            headers.append((b'content-length', str(length).encode()))
+        return headers
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.start = message
+            self.passthrough = not self._compressible(message.get('headers', []))
+            if self.passthrough:
+                await self._send(message)
+            return
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.stream is None and not more_body:
+            if len(body) < self.minimum_size:
+                await self._send(self.start)
+                await self._send(message)
+                return
+            compressed = compress(body, self.encoding)
+            await self._send({**self.start, 'headers': self._encoded_headers(len(compressed))})
+            await self._send({'type': 'http.response.body', 'body': compressed})
+            return
+
+        if self.stream is None:
+            self.stream = _compressor(self.encoding)
+            await self._send({**self.start, 'headers': self._encoded_headers()})
+        process, finish = self.stream
+        chunk = process(body) if body else b''
+        if not more_body:
+            chunk += finish()
+        await self._send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
@@ -0,0 +1,76 @@
+import os
+
+# Shared secret expected in the X-Admin-Token header of the /admin routes. The admin routes are
+# disabled while it is unset.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Log one structured line per request with its DB statement count and timings.
+REQUEST_LOG = os.environ.get('REQUEST_LOG', '1') == '1'
+
+# Fail requests that issue more SQL statements than their route's @query_budget. Meant for tests.
+QUERY_BUDGET_ENFORCE = os.environ.get('QUERY_BUDGET_ENFORCE', '0') == '1'
+
+# Statements slower than this many milliseconds are written, with their SQLite query plan, to the
+# slow query log. Only the execute call is timed, not fetching the rows. A negative value disables
+# the slow query log.
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE', 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', '5'))
+# Number of recent slow queries kept in memory for GET /admin/slow-queries/.
+SLOW_QUERY_BUFFER = int(os.environ.get('SLOW_QUERY_BUFFER', '500'))
+
+# Directory where on-demand profiles are stored for download from /admin/profiling/.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+# Responses smaller than this many bytes are sent uncompressed.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+# Levels used when compressing on the fly; cached bodies are compressed once per data version at
+# the highest level instead.
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+# How often each worker re-reads the shared cache versions, bounding how long a write made by
+# another worker can be served stale from this worker's caches.
+CACHE_POLL_INTERVAL = float(os.environ.get('CACHE_POLL_INTERVAL_MS', '500')) / 1000
+
+# Memory-mapped binary snapshot of the federal tables shared by every worker on the host. Defaults
+# to a file next to the SQLite database.
+FEDERAL_SNAPSHOT_FILE = os.environ.get('FEDERAL_SNAPSHOT_FILE')
+
+# Admission control: requests running at once and requests waiting per route class. `auth` is the
+# bcrypt-bound login, `write` every other non-GET route and `read` the GET routes; keeping the sum
+# of the concurrency limits under the threadpool size (40) means a burst in one class cannot take
+# every worker thread. A concurrency of 0 disables the limit of that class.
+ADMISSION_AUTH_CONCURRENCY = int(os.environ.get('ADMISSION_AUTH_CONCURRENCY', '4'))
+ADMISSION_AUTH_QUEUE = int(os.environ.get('ADMISSION_AUTH_QUEUE', '16'))
+ADMISSION_WRITE_CONCURRENCY = int(os.environ.get('ADMISSION_WRITE_CONCURRENCY', '8'))
+ADMISSION_WRITE_QUEUE = int(os.environ.get('ADMISSION_WRITE_QUEUE', '64'))
+ADMISSION_READ_CONCURRENCY = int(os.environ.get('ADMISSION_READ_CONCURRENCY', '24'))
+ADMISSION_READ_QUEUE = int(os.environ.get('ADMISSION_READ_QUEUE', '256'))
+# Queued requests still waiting for a slot after this many milliseconds are rejected.
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_MS', '2000')) / 1000
+
+# Let concurrent identical GET requests share the response of the first one instead of each
+# running the route.
+SINGLE_FLIGHT = os.environ.get('SINGLE_FLIGHT', '1') == '1'
+# Responses with a larger body are not shared; the waiting requests then run the route themselves.
+SINGLE_FLIGHT_MAX_BYTES = int(os.environ.get('SINGLE_FLIGHT_MAX_BYTES', str(8 * 1024 * 1024)))
+
+# Online backups started from /admin/backup/ are written to this directory. Each step copies this
+# many database pages and the backup pauses between steps so live requests keep the database.
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', '256'))
+BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP_MS', '5')) / 1000
+
+# Sanitized request traces are appended to this JSON lines file for benchmarks/replay.py; unset
+# disables the capture. Only this fraction of the requests is captured, and bodies larger than
+# CAPTURE_MAX_BODY_BYTES are recorded by size only.
+CAPTURE_FILE = os.environ.get('CAPTURE_FILE') or None
+CAPTURE_SAMPLE_RATE = float(os.environ.get('CAPTURE_SAMPLE_RATE', '1.0'))
+CAPTURE_MAX_BODY_BYTES = int(os.environ.get('CAPTURE_MAX_BODY_BYTES', str(64 * 1024)))
+CAPTURE_FILE_MAX_BYTES = int(os.environ.get('CAPTURE_FILE_MAX_BYTES', str(100 * 1024 * 1024)))
+CAPTURE_FILE_BACKUPS = int(os.environ.get('CAPTURE_FILE_BACKUPS', '5'))
+
+# Rows fetched, encoded and sent per chunk by the streaming mode (`stream=true`) of the list routes.
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', '500'))
@@ -0,0 +1,290 @@
+import argparse
+import random
+import sys
+import time
+from datetime import date
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.account import database, models, rollup
+from app.core import cache
+# Registers the cache_version table, so create_all makes it here instead of racing app workers.
+from app.core import models as core_models  # noqa: F401
+from app.federal import closure
+from app.federal import models as federal_models
+
+# Districts per province, in province order, as in Nepal's federal structure (7 / 77 / 753).
+DISTRICTS_PER_PROVINCE = (14, 8, 13, 11, 12, 10, 9)
+MUNICIPALITIES = 753
+
+ROLES = ((models.RoleEnum.Student.value, 85), (models.RoleEnum.Tutor.value, 15))
+GENDERS = (
+    (models.GenderEnum.Male.value, 490),
+    (models.GenderEnum.Female.value, 480),
+    (models.GenderEnum.NonBinary.value, 10),
+    (models.GenderEnum.Prefer_Not_To_Sepcify.value, 15),
+    (models.GenderEnum.Others.value, 5),
+)
+ACTIVE_RATIO = 0.7
+VERIFIED_RATIO = 0.6
+NO_LOCATION_RATIO = 0.03
+FIRST_NAMES = ('Aarav', 'Aayush', 'Anisha', 'Bibek', 'Bina', 'Gita', 'Hari', 'Kiran', 'Manisha', 'Nabin',
+               'Pooja', 'Prakash', 'Rajesh', 'Ramesh', 'Sabina', 'Sita', 'Sujan', 'Sunita', 'Srijana', 'Umesh')
+LAST_NAMES = ('Adhikari', 'Bhandari', 'Gurung', 'KC', 'Karki', 'Khadka', 'Lama', 'Magar', 'Poudel', 'Rai',
+              'Shah', 'Sharma', 'Shrestha', 'Tamang', 'Thapa', 'Yadav')
+DEVANAGARI_DIGITS = str.maketrans('0123456789', '०१२३४५६७८९')
+
+USER_COLUMNS = ('id', 'first_name', 'middle_name', 'last_name', 'dob', 'email', 'position', 'role', 'gender',
+                'contact', 'city', 'city_ne', 'country', 'province', 'district', 'municipality',
+                'is_verified', 'is_active')
+
+
+def _cumulative(weighted):
+    values, totals, running = [], [], 0
+    for value, weight in weighted:
+        running += weight
+        values.append(value)
+        totals.append(running)
+    return values, totals
+
+
+def _split(total: int, parts: int, rnd: random.Random):
+    """
+    Splits `total` items into `parts` non-empty buckets with a little random variation.
+    """
+    counts = [total // parts] * parts
+    for index in rnd.sample(range(parts), total - sum(counts)):
+        counts[index] += 1
+    return counts
+
+
+def federal_rows(multiplier: int = 1, seed: int = 0):
+    """
+    This function builds the rows of a synthetic federal hierarchy.
+
+    :param multiplier: The number of copies of the 7 province / 77 district / 753 municipality
+    hierarchy to generate under the single country
+    :type multiplier: int
+    :param seed: The seed of the random generator, the same seed always yields the same rows
+    :type seed: int
+    :return: a dictionary with a list of row dictionaries for each of the `country`, `province`,
+    `district` and `municipality` tables. Ids are assigned densely starting from 1.
+    """
+    rnd = random.Random(f'federal-{seed}')
+    rows = {
+        'country': [{'id': 1, 'title': 'Nepal', 'title_ne': 'नेपाल', 'code': 'NP', 'order': 1}],
+        'province': [],
+        'district': [],
+        'municipality': [],
+    }
+    for _ in range(multiplier):
+        municipality_counts = iter(_split(MUNICIPALITIES, sum(DISTRICTS_PER_PROVINCE), rnd))
+        for province_order, district_count in enumerate(DISTRICTS_PER_PROVINCE, start=1):
+            province_id = len(rows['province']) + 1
+            rows['province'].append({
+                'id': province_id,
+                'title': f'Province {province_id}',
+                'title_ne': f'प्रदेश {str(province_id).translate(DEVANAGARI_DIGITS)}',
+                'code': f'P{province_id:02d}',
+                'order': province_order,
+                'country': 1,
+            })
+            for district_order in range(1, district_count + 1):
+                district_id = len(rows['district']) + 1
+                rows['district'].append({
+                    'id': district_id,
+                    'title': f'District {district_id}',
+                    'title_ne': f'जिल्ला {str(district_id).translate(DEVANAGARI_DIGITS)}',
+                    'code': f'D{district_id:03d}',
+                    'order': district_order,
+                    'province': province_id,
+                })
+                for municipality_order in range(1, next(municipality_counts) + 1):
+                    municipality_id = len(rows['municipality']) + 1
+                    rows['municipality'].append({
+                        'id': municipality_id,
+                        'title': f'Municipality {municipality_id}',
+                        'title_ne': f'नगरपालिका {str(municipality_id).translate(DEVANAGARI_DIGITS)}',
+                        'code': f'M{municipality_id:04d}',
+                        'order': municipality_order,
+                        'district': district_id,
+                    })
+    return rows
+
+
+def user_batches(count: int, federal: dict, seed: int = 0, batch_size: int = 50_000, start_id: int = 1):
+    """
+    This function yields synthetic `users` rows in batches of tuples ordered like `USER_COLUMNS`.
+
+    Municipalities get a log-normal population weight so a few are much bigger than the rest, and
+    province and district always agree with the chosen municipality.
+
+    :param count: The number of users to generate
+    :type count: int
+    :param federal: The rows returned by `federal_rows`
+    :type federal: dict
+    :param seed: The seed of the random generator
+    :type seed: int
+    :param batch_size: The number of rows per yielded batch
+    :type batch_size: int
+    :param start_id: The id of the first generated user
+    :type start_id: int
+    """
+    rnd = random.Random(f'users-{seed}')
+    district_province = {row['id']: row['province'] for row in federal['district']}
+    locations = [
+        (district_province[row['district']], row['district'], row['id'])
+        for row in federal['municipality']
+    ]
+    location_weights = []
+    running = 0.0
+    for _ in locations:
+        running += rnd.lognormvariate(0, 1)
+        location_weights.append(running)
+    roles, role_weights = _cumulative(ROLES)
+    genders, gender_weights = _cumulative(GENDERS)
+    dob_start = date(1960, 1, 1).toordinal()
+    dob_span = date(2012, 12, 31).toordinal() - dob_start
+
+    user_id = start_id
+    remaining = count
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        batch_locations = rnd.choices(locations, cum_weights=location_weights, k=size)
+        batch_roles = rnd.choices(roles, cum_weights=role_weights, k=size)
+        batch_genders = rnd.choices(genders, cum_weights=gender_weights, k=size)
+        batch = []
+        for location, role, gender in zip(batch_locations, batch_roles, batch_genders):
+            first_name = FIRST_NAMES[rnd.randrange(len(FIRST_NAMES))]
+            last_name = LAST_NAMES[rnd.randrange(len(LAST_NAMES))]
+            if rnd.random() < NO_LOCATION_RATIO:
+                location = (None, None, None)
+            batch.append((
+                user_id,
+                first_name,
+                None,
+                last_name,
+                date.fromordinal(dob_start + rnd.randrange(dob_span)).isoformat(),
+                f'{first_name.lower()}.{last_name.lower()}.{user_id}@example.com',
+                'Teacher' if role == models.RoleEnum.Tutor.value else None,
+                role,
+                gender,
+                f'+9779{rnd.randrange(10 ** 9):09d}',
+                None,
+                None,
+                1,
+                *location,
+                rnd.random() < VERIFIED_RATIO,
+                rnd.random() < ACTIVE_RATIO,
+            ))
+            user_id += 1
+        remaining -= size
+        yield batch
+
+
+def _insert_sql(table: str, columns):
+    names = ', '.join(f'"{column}"' for column in columns)
+    placeholders = ', '.join('?' for _ in columns)
+    return f'INSERT INTO "{table}" ({names}) VALUES ({placeholders})'
+
+
+def generate(engine: Engine, users: int = 100_000, multiplier: int = 1, seed: int = 0,
+             batch_size: int = 50_000, reset: bool = False):
+    """
+    This function fills a database with a synthetic federal hierarchy and users.
+
+    Rows are written with DBAPI `executemany` on a single connection and committed once, which is
+    what keeps a million users in the range of seconds instead of the hours the ORM would take.
+
+    :param engine: The engine of the database to fill
+    :type engine: Engine
+    :param users: The number of users to generate
+    :type users: int
+    :param multiplier: The number of copies of the federal hierarchy to generate
+    :type multiplier: int
+    :param seed: The seed of the random generators
+    :type seed: int
+    :param batch_size: The number of users inserted per `executemany` call
+    :type batch_size: int
+    :param reset: Drop and recreate every table before generating
+    :type reset: bool
+    :return: a dictionary with the number of rows written per table.
+    """
+    if multiplier < 1:
+        raise ValueError(f"multiplier must be at least 1, got {multiplier}")
+    if reset:
+        models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        for table in (federal_models.Country, federal_models.Province, federal_models.District,
+                      federal_models.Municipality, models.User):
+            if db.scalar(select(func.count()).select_from(table)):
+                raise ValueError(f"table {table.__tablename__} is not empty, generate into an empty database or reset it")
+
+    federal = federal_rows(multiplier, seed)
+    written = {}
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA synchronous = OFF')
+        for table, rows in federal.items():
+            columns = tuple(rows[0])
+            cursor.executemany(
+                _insert_sql(table, columns),
+                [tuple(row[column] for column in columns) for row in rows]
+            )
+            written[table] = len(rows)
+        written['users'] = 0
+        for batch in user_batches(users, federal, seed, batch_size):
+            cursor.executemany(_insert_sql('users', USER_COLUMNS), batch)
+            written['users'] += len(batch)
+        connection.commit()
+        cursor.execute('PRAGMA synchronous = FULL')
+        cursor.close()
+    finally:
+        connection.close()
+
+    with Session(engine) as db:
+        written['user_rollup'] = rollup.rebuild(db)
+        written['federal_closure'] = closure.rebuild(db)
+        # Running workers and snapshot files only see the new rows once the version moves.
+        cache.bump('federal', db)
+        db.commit()
+    return written
+
+
+def _positive_int(text: str):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fill a database with synthetic federal and user data.')
+    parser.add_argument('--database-url', default=database.SQLALCHAMY_DATABASE_URL)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--multiplier', type=_positive_int, default=1, help='copies of the 7/77/753 federal hierarchy')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables first')
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    started = time.perf_counter()
+    try:
+        written = generate(engine, args.users, args.multiplier, args.seed, args.batch_size, args.reset)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - started
+    for table, count in written.items():
+        print(f"{table}: {count}")
+    print(f"generated in {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
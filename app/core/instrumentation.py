@@ -0,0 +1,198 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core import config, querybudget
+
+logger = logging.getLogger('app.requests')
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class RequestStats:
+    """
+    Statement count and DB time of the request currently being served. `statements` collects
+    each statement with the stack that issued it, and is only set while query budgets are enforced.
+    """
+    __slots__ = ('scope', 'queries', 'db_time', 'statements')
+
+    def __init__(self, scope, statements=None):
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = statements
+
+
+class RouteSummary:
+    __slots__ = ('requests', 'queries', 'max_queries', 'db_time', 'total_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.total_time = 0.0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'queries': self.queries,
+            'avg_queries': round(self.queries / self.requests, 2) if self.requests else 0,
+            'max_queries': self.max_queries,
+            'db_ms': round(self.db_time * 1000, 3),
+            'avg_db_ms': round(self.db_time * 1000 / self.requests, 3) if self.requests else 0,
+            'avg_ms': round(self.total_time * 1000 / self.requests, 3) if self.requests else 0,
+        }
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar('current_request', default=None)
+route_summaries = {}
+
+
+def route_template(scope):
+    """
+    This function returns the path template of the route that handled `scope`, such as
+    `/federal/province/{id}/`, so that statistics are not split per id.
+    """
+    route = scope.get('route')
+    return getattr(route, 'path', UNMATCHED_ROUTE)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        if stats.statements is not None:
+            stats.statements.append((statement, querybudget.capture_stack()))
+
+
+def install(engine: Engine):
+    """
+    This function attaches the statement counting hooks to an engine.
+
+    :param engine: The engine whose statements are counted against the current request
+    :type engine: Engine
+    """
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def summary():
+    """
+    This function returns the per-route statement counts and timings collected since startup,
+    the routes issuing the most statements first.
+    """
+    rows = [
+        {'method': method, 'route': route, **route_summary.as_dict()}
+        for (method, route), route_summary in route_summaries.items()
+    ]
+    return sorted(rows, key=lambda row: row['queries'], reverse=True)
+
+
+@contextmanager
+def budget_scope(max_queries: int, label: str):
+    """
+    This context manager enforces a query budget on one part of a request, such as one operation of
+    a batch, while query budgets are enforced.
+
+    The statements issued inside the block are checked against `max_queries` when it exits, and
+    then no longer count against the route's own `@query_budget`, which only covers the rest of
+    the request.
+
+    :param max_queries: The maximum number of statements the block may issue
+    :type max_queries: int
+    :param label: Names the block in the error, e.g. the route and the operation
+    :type label: str
+    """
+    stats = current_request.get()
+    if stats is None or stats.statements is None:
+        yield
+        return
+    start = len(stats.statements)
+    yield
+    scoped = stats.statements[start:]
+    del stats.statements[start:]
+    querybudget.check(stats.scope['method'], label, max_queries, scoped)
+
+
+class QueryCountingMiddleware:
+    """
+    ASGI middleware counting the SQL statements and DB time of every HTTP request.
+
+    Results are returned in a `Server-Timing` header (`db` with the statement count as its
+    description, `app` for the whole request), logged as one JSON line on the `app.requests`
+    logger and accumulated per route template for `summary()`. Sync endpoints run in the
+    threadpool with a copy of the request context, so the engine hooks still find the stats.
+
+    While query budgets are enforced, a request over its route's `@query_budget` raises
+    `QueryBudgetExceeded` listing every statement and where it was issued from.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope, [] if querybudget.enforcing() else None)
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                header = (
+                    f'db;dur={stats.db_time * 1000:.3f};desc="{stats.queries} queries", '
+                    f'app;dur={elapsed_ms:.3f}'
+                )
+                message['headers'] = [*message.get('headers', []), (b'server-timing', header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_request.reset(token)
+            self._record(scope, stats, status_code, time.perf_counter() - started)
+
+        if stats.statements is not None:
+            budget = querybudget.budget_for(scope)
+            if budget is not None:
+                querybudget.check(scope['method'], route_template(scope), budget, stats.statements)
+
+    def _record(self, scope, stats: RequestStats, status_code: int, elapsed: float):
+        key = (scope['method'], route_template(scope))
+        route_summary = route_summaries.get(key)
+        if route_summary is None:
+            route_summary = route_summaries.setdefault(key, RouteSummary())
+        route_summary.requests += 1
+        route_summary.queries += stats.queries
+        route_summary.max_queries = max(route_summary.max_queries, stats.queries)
+        route_summary.db_time += stats.db_time
+        route_summary.total_time += elapsed
+        if config.REQUEST_LOG and logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'method': key[0],
+                'route': key[1],
+                'path': scope['path'],
+                'status': status_code,
+                'duration_ms': round(elapsed * 1000, 3),
+                'db_queries': stats.queries,
+                'db_ms': round(stats.db_time * 1000, 3),
+            }))
@@ -0,0 +1,34 @@
+"""
+Negotiation of the language of localized responses.
+"""
+# Languages the localized routes can render, most preferred first on ties.
+LANGUAGES = ('en', 'ne')
+
+
+def negotiate(accept_language: str):
+    """
+    This function picks the response language from an `Accept-Language` header.
+
+    :param accept_language: The raw header value, e.g. `ne-NP,ne;q=0.9,en;q=0.5`
+    :type accept_language: str
+    :return: the supported language with the highest quality, compared by primary subtag, or `None`
+    when the header names none of them. A wildcard alone does not pick a language, so clients that
+    do not ask for one keep getting both names.
+    """
+    best, best_quality = None, 0.0
+    for item in accept_language.split(','):
+        tag, _, parameters = item.partition(';')
+        language = tag.strip().split('-')[0].lower()
+        if language not in LANGUAGES:
+            continue
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            name, _, value = parameter.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality:
+            best, best_quality = language, quality
+    return best
@@ -0,0 +1,340 @@
+"""
+Dependency-free metrics registry rendered in the Prometheus text exposition format.
+
+Observations are lock-free: every metric child keeps one small list of numbers per thread
+(a shard) that only that thread ever writes, and the shards are summed when `/metrics` is
+scraped. The registry lock is only taken the first time a thread touches a child and when a new
+label combination is created.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from app.core.instrumentation import route_template
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """
+    Per-thread shards of `width` numbers, summed on read.
+    """
+    __slots__ = ('_local', '_shards', '_lock', '_width')
+
+    def __init__(self, width: int, lock: threading.Lock):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = lock
+        self._width = width
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = [0] * self._width
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _totals(self):
+        totals = [0] * self._width
+        for shard in list(self._shards):
+            for index, value in enumerate(shard):
+                totals[index] += value
+        return totals
+
+
+class CounterChild(_Sharded):
+    __slots__ = ()
+
+    def __init__(self, lock):
+        super().__init__(1, lock)
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    def value(self):
+        return self._totals()[0]
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        self._shard()[0] -= amount
+
+
+class HistogramChild(_Sharded):
+    """
+    Shard layout: one count per bucket (the last one is +Inf), then the sum, then the count.
+    """
+    __slots__ = ('_bounds',)
+
+    def __init__(self, lock, bounds):
+        super().__init__(len(bounds) + 3, lock)
+        self._bounds = bounds
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect_left(self._bounds, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ('_child', '_started')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+
+    def register(self, metric):
+        with self.lock:
+            if any(existing.name == metric.name for existing in self.metrics):
+                raise ValueError(f"metric {metric.name} is already registered")
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        This function renders every registered metric in the Prometheus text format.
+        """
+        lines = []
+        for metric in list(self.metrics):
+            lines.append(f'# HELP {metric.name} {_escape(metric.documentation)}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = registry.lock
+        self._children = {}
+        registry.register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value())}'
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return CounterChild(self._lock)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return GaugeChild(self._lock)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+
+class CallbackGauge(_Metric):
+    """
+    A gauge whose samples are computed at scrape time by `callback`, which returns an iterable of
+    `(label_values, value)` pairs.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, callback, registry: Registry = REGISTRY):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames, registry)
+
+    def samples(self):
+        for values, value in self.callback():
+            yield f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return HistogramChild(self._lock, self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            totals = child._totals()
+            cumulative = 0
+            for bound, count in zip((*self.bounds, float('inf')), totals):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}'
+            labels = _format_labels(self.labelnames, values)
+            yield f'{self.name}_sum{labels} {_format_value(totals[-2])}'
+            yield f'{self.name}_count{labels} {totals[-1]}'
+
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by method, route template and status code.',
+    ('method', 'route', 'status'),
+)
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests currently being served.')
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by method and route template.',
+    ('method', 'route'),
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a connection from the pool.',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+DB_SESSION_LIFETIME = Histogram(
+    'db_session_lifetime_seconds', 'Lifetime of the sessions handed out by get_db.',
+)
+BCRYPT_DURATION = Histogram(
+    'bcrypt_duration_seconds', 'Time spent hashing and verifying passwords.', ('operation',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0),
+)
+ADMISSION_ACTIVE = Gauge('admission_active_requests', 'Requests holding an admission slot, by route class.', ('class',))
+ADMISSION_QUEUE_DEPTH = Gauge('admission_queue_depth', 'Requests waiting for an admission slot, by route class.', ('class',))
+ADMISSION_WAIT = Histogram(
+    'admission_wait_seconds', 'Time admitted requests waited for a slot, by route class.', ('class',),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_total', 'Requests shed by admission control, by route class and reason.',
+    ('class', 'reason'),
+)
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result.', ('cache', 'result'))
+
+
+def _cache_hit_ratios():
+    lookups = {}
+    for (cache, result), child in list(CACHE_REQUESTS._children.items()):
+        hits, total = lookups.get(cache, (0, 0))
+        count = child.value()
+        lookups[cache] = (hits + (count if result == 'hit' else 0), total + count)
+    return [((cache,), hits / total) for cache, (hits, total) in lookups.items() if total]
+
+
+CACHE_HIT_RATIO = CallbackGauge(
+    'cache_hit_ratio', 'Share of cache lookups served from the cache since startup.', ('cache',),
+    _cache_hit_ratios,
+)
+
+
+PROCESS_INFO = CallbackGauge(
+    'process_info', 'Always 1, labelled with the pid of the worker that served the scrape.', ('pid',),
+    lambda: [((os.getpid(),), 1)],
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """
+    This function counts one lookup of the named cache as a hit or a miss.
+    """
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def render():
+    return REGISTRY.render()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, in-flight requests and latency per route template.
+    Unmatched paths share one label value so scans of random URLs cannot grow the label set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels()
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            route = route_template(scope)
+            HTTP_REQUESTS.labels(scope['method'], route, str(status_code)).inc()
+            HTTP_LATENCY.labels(scope['method'], route).observe(elapsed)
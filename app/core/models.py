@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, String
+
+from app.account.database import Base
+
+
+class CacheVersion(Base):
+    __tablename__='cache_version'
+
+    namespace = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,283 @@
+"""
+On-demand profiling of selected routes.
+
+Arming a route swaps its ASGI app and endpoint callable for profiling wrappers; disarming (or
+using up the requested count) puts the originals back, so routes that are not armed run exactly
+the code they run without this module.
+"""
+import cProfile
+import hmac
+import json
+import os
+import re
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi.routing import APIRoute
+
+from app.core import config
+
+FORMATS = ('pstats', 'speedscope')
+PROFILE_HEADER = b'x-profile'
+ADMIN_HEADER = b'x-admin-token'
+
+_session: ContextVar[Optional['ProfileSession']] = ContextVar('profile_session', default=None)
+
+
+class SpeedscopeTracer:
+    """
+    Deterministic tracer recording open/close events of every Python and C call made by the
+    profiled function, in the speedscope "evented" file format.
+    """
+
+    def __init__(self):
+        self.frames = []
+        self.frame_index = {}
+        self.events = []
+        self.stack = []
+        self.started = 0
+        self.ended = 0
+
+    def _frame(self, key, name, file, line):
+        index = self.frame_index.get(key)
+        if index is None:
+            index = self.frame_index[key] = len(self.frames)
+            self.frames.append({'name': name, 'file': file, 'line': line})
+        return index
+
+    def _open(self, index, at):
+        self.events.append({'type': 'O', 'frame': index, 'at': at})
+        self.stack.append(index)
+
+    def _close(self, at):
+        self.events.append({'type': 'C', 'frame': self.stack.pop(), 'at': at})
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter_ns() - self.started
+        if event == 'call':
+            code = frame.f_code
+            self._open(self._frame(code, code.co_qualname, code.co_filename, code.co_firstlineno), now)
+        elif event == 'c_call':
+            name = f'{getattr(arg, "__module__", None) or "builtins"}.{getattr(arg, "__qualname__", repr(arg))}'
+            self._open(self._frame(name, name, '<built-in>', 0), now)
+        elif self.stack:
+            # return, c_return and c_exception; events from before the trace started have no
+            # open frame and are ignored.
+            self._close(now)
+
+    def runcall(self, function, kwargs):
+        self.started = time.perf_counter_ns()
+        sys.setprofile(self._callback)
+        try:
+            return function(**kwargs)
+        finally:
+            sys.setprofile(None)
+            self.ended = time.perf_counter_ns() - self.started
+            while self.stack:
+                self._close(self.ended)
+
+    def dump(self, path: str, name: str):
+        document = {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'misdis-profiling',
+            'shared': {'frames': self.frames},
+            'profiles': [{
+                'type': 'evented',
+                'name': name,
+                'unit': 'nanoseconds',
+                'startValue': 0,
+                'endValue': self.ended,
+                'events': self.events,
+            }],
+        }
+        with open(path, 'w', encoding='utf-8') as handle:
+            json.dump(document, handle)
+
+
+class ProfileSession:
+    def __init__(self, method: str, route: str, profile_format: str):
+        self.method = method
+        self.route = route
+        self.format = profile_format
+        self.profiler = cProfile.Profile() if profile_format == 'pstats' else SpeedscopeTracer()
+        self.started_at = datetime.now(timezone.utc)
+        self.duration = None
+
+    def run(self, function, kwargs):
+        started = time.perf_counter()
+        try:
+            if self.format == 'pstats':
+                return self.profiler.runcall(function, **kwargs)
+            return self.profiler.runcall(function, kwargs)
+        finally:
+            self.duration = time.perf_counter() - started
+
+    def save(self):
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', self.route).strip('-') or 'root'
+        stamp = self.started_at.strftime('%Y%m%dT%H%M%S%f')
+        extension = 'prof' if self.format == 'pstats' else 'speedscope.json'
+        name = f'{stamp}-{self.method}-{slug}.{extension}'
+        path = os.path.join(config.PROFILE_DIR, name)
+        if self.format == 'pstats':
+            self.profiler.dump_stats(path)
+        else:
+            self.profiler.dump(path, f'{self.method} {self.route}')
+        return name
+
+
+class ArmedRoute:
+    """
+    A route whose next `remaining` requests (or, with `header_only`, requests carrying an
+    `X-Profile` header and a valid admin token) are profiled.
+    """
+
+    def __init__(self, route: APIRoute, remaining: Optional[int], profile_format: str, header_only: bool):
+        self.route = route
+        self.remaining = remaining
+        self.format = profile_format
+        self.header_only = header_only
+        self.active = 0
+        self.disarmed = False
+        self.original_app = route.app
+        self.original_call = route.dependant.call
+        route.app = self.app
+        route.dependant.call = self.call
+
+    def disarm(self):
+        if self.disarmed:
+            return
+        self.disarmed = True
+        self.route.app = self.original_app
+        self.route.dependant.call = self.original_call
+        if armed.get(id(self.route)) is self:
+            del armed[id(self.route)]
+
+    def _wanted(self, scope):
+        if self.remaining is not None and self.remaining <= 0:
+            return False
+        if not self.header_only:
+            return True
+        headers = dict(scope['headers'])
+        return (
+            PROFILE_HEADER in headers
+            and bool(config.ADMIN_TOKEN)
+            # Compared in constant time, like `require_admin` does for the /admin routes.
+            and hmac.compare_digest(headers.get(ADMIN_HEADER) or b'', config.ADMIN_TOKEN.encode('utf-8'))
+        )
+
+    async def app(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._wanted(scope):
+            await self.original_app(scope, receive, send)
+            return
+        if self.remaining is not None:
+            self.remaining -= 1
+        self.active += 1
+        session = ProfileSession(scope['method'], self.route.path, self.format)
+        token = _session.set(session)
+        try:
+            await self.original_app(scope, receive, send)
+        finally:
+            _session.reset(token)
+            self.active -= 1
+            if session.duration is not None:
+                session.save()
+            # The route stays wrapped until its last profiled request is done, since the
+            # endpoint callable is looked up while the request runs.
+            if self.remaining == 0 and self.active == 0:
+                self.disarm()
+
+    def call(self, **kwargs):
+        session = _session.get()
+        if session is None:
+            return self.original_call(**kwargs)
+        return session.run(self.original_call, kwargs)
+
+    def as_dict(self):
+        return {
+            'method': sorted(self.route.methods),
+            'route': self.route.path,
+            'remaining': self.remaining,
+            'format': self.format,
+            'header_only': self.header_only,
+        }
+
+
+armed = {}
+
+
+def arm(routes, route: str, method: Optional[str] = None, count: Optional[int] = 1,
+        profile_format: str = 'pstats', header_only: bool = False):
+    """
+    This function arms profiling on every API route matching a path template and method.
+
+    :param routes: The routes of the application, usually `request.app.routes`
+    :param route: The path template to profile, e.g. `/account/login/`, or `*` for every route
+    :type route: str
+    :param method: Only arm the route for this HTTP method
+    :type method: Optional[str]
+    :param count: The number of requests to profile before disarming, `None` to keep profiling
+    until `disarm` is called (only allowed together with `header_only`)
+    :type count: Optional[int]
+    :param profile_format: `pstats` for cProfile output or `speedscope` for an evented trace
+    :type profile_format: str
+    :param header_only: Only profile requests carrying an `X-Profile` header and the admin token
+    :type header_only: bool
+    :return: the list of routes that were armed.
+    """
+    matched = []
+    for candidate in routes:
+        if not isinstance(candidate, APIRoute):
+            continue
+        if route != '*' and candidate.path != route:
+            continue
+        if method and method.upper() not in candidate.methods:
+            continue
+        if route == '*' and candidate.path.startswith('/admin'):
+            continue
+        existing = armed.get(id(candidate))
+        if existing is not None:
+            existing.disarm()
+        armed[id(candidate)] = ArmedRoute(candidate, count, profile_format, header_only)
+        matched.append(armed[id(candidate)].as_dict())
+    return matched
+
+
+def disarm():
+    """
+    This function restores every armed route.
+    """
+    for armed_route in list(armed.values()):
+        armed_route.disarm()
+
+
+def status():
+    return [armed_route.as_dict() for armed_route in armed.values()]
+
+
+def stored_profiles():
+    """
+    This function lists the profiles stored in `config.PROFILE_DIR`, newest first.
+    """
+    if not os.path.isdir(config.PROFILE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(config.PROFILE_DIR):
+        path = os.path.join(config.PROFILE_DIR, name)
+        if os.path.isfile(path):
+            entries.append({'name': name, 'size': os.path.getsize(path)})
+    return sorted(entries, key=lambda entry: entry['name'], reverse=True)
+
+
+def profile_path(name: str):
+    """
+    This function returns the path of a stored profile, or `None` if the name is not one of them.
+    """
+    if name != os.path.basename(name) or not name.endswith(('.prof', '.speedscope.json')):
+        return None
+    path = os.path.join(config.PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,79 @@
+import os
+import traceback
+
+from app.core import config
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a request issues more SQL statements than its route's declared budget.
+    """
+
+
+def query_budget(max_queries: int):
+    """
+    This decorator declares the maximum number of SQL statements a route may issue per request.
+
+    It only records the budget on the endpoint; `QueryCountingMiddleware` enforces it when
+    `config.QUERY_BUDGET_ENFORCE` is on, which is meant for test runs. Apply it below the router
+    decorator so the router registers the annotated function.
+
+    :param max_queries: The maximum number of statements allowed per request
+    :type max_queries: int
+    """
+    def decorator(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+
+def budget_for(scope):
+    """
+    This function returns the query budget of the endpoint that handled `scope`, if any.
+    """
+    return getattr(scope.get('endpoint'), 'query_budget', None)
+
+
+def capture_stack():
+    """
+    This function returns the frames of the current stack that belong to this project, outermost
+    first, leaving out library frames and the instrumentation itself.
+    """
+    return [
+        frame for frame in traceback.extract_stack()[:-1]
+        if frame.filename.startswith(PROJECT_ROOT)
+        and 'site-packages' not in frame.filename
+        and not frame.filename.endswith(('instrumentation.py', 'querybudget.py'))
+    ]
+
+
+def check(method: str, route: str, budget: int, statements: list):
+    """
+    This function raises `QueryBudgetExceeded` when more statements than `budget` were issued.
+
+    :param method: The HTTP method of the request
+    :type method: str
+    :param route: The route template of the request
+    :type route: str
+    :param budget: The declared budget of the route
+    :type budget: int
+    :param statements: The `(statement, stack)` pairs captured during the request
+    :type statements: list
+    """
+    if len(statements) <= budget:
+        return
+    lines = [f"{method} {route} issued {len(statements)} SQL statements, its budget is {budget}:"]
+    for number, (statement, stack) in enumerate(statements, start=1):
+        marker = ' (over budget)' if number > budget else ''
+        lines.append(f"\n[{number}]{marker} {' '.join(statement.split())}")
+        lines.extend(
+            f"    {frame.filename}:{frame.lineno} in {frame.name}\n      {frame.line}"
+            for frame in stack
+        )
+    raise QueryBudgetExceeded('\n'.join(lines))
+
+
+def enforcing():
+    return config.QUERY_BUDGET_ENFORCE
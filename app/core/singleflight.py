@@ -0,0 +1,107 @@
+"""
+Single-flight coalescing of identical concurrent GET requests.
+
+The first GET for a key (path, query string and the headers the response depends on) runs
+normally and its response messages are recorded as they are sent. Identical GETs arriving while it
+is in flight do not reach the application: they wait for it to finish and replay the recorded
+response. When the first request fails, or its body is too large to record, the waiting requests
+run on their own instead. Streamed responses, whose body is sent in several messages, are never
+recorded: the waiting requests are released as soon as the first chunk is sent.
+"""
+import asyncio
+
+from app.core import config, metrics
+
+EXEMPT_PREFIXES = ('/metrics', '/admin/')
+# Request headers that can change a response, so requests only share a response when they agree.
+KEY_HEADERS = (b'authorization', b'accept', b'accept-encoding', b'accept-language')
+
+
+def request_key(scope):
+    """
+    This function returns the coalescing key of a request, or `None` when it must run on its own.
+    """
+    if scope['type'] != 'http' or scope['method'] != 'GET' or scope['path'].startswith(EXEMPT_PREFIXES):
+        return None
+    headers = dict(scope['headers'])
+    return (scope['path'], scope['query_string'], *(headers.get(name) for name in KEY_HEADERS))
+
+
+class _Recorder:
+    __slots__ = ('messages', 'size', 'finished')
+
+    def __init__(self):
+        self.messages = []
+        self.size = 0
+        self.finished = False
+
+    def record(self, message):
+        """
+        This function records one response message, and returns `False` once the response is
+        not shared: its body is too large, or it is streamed in several messages.
+        """
+        if self.messages is None:
+            return False
+        if message['type'] == 'http.response.body':
+            self.size += len(message.get('body', b''))
+            if message.get('more_body', False) or self.size > config.SINGLE_FLIGHT_MAX_BYTES:
+                self.messages = None
+                return False
+            self.finished = True
+        self.messages.append(message)
+        return True
+
+    def result(self):
+        return self.messages if self.finished else None
+
+
+class SingleFlightMiddleware:
+    """
+    ASGI middleware letting concurrent identical GETs share one execution. Followers are answered
+    from the leader's recorded messages and never hold an admission slot or a database connection.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.in_flight = {}
+
+    async def __call__(self, scope, receive, send):
+        key = request_key(scope) if config.SINGLE_FLIGHT else None
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+
+        leader = self.in_flight.get(key)
+        if leader is not None:
+            messages, route = await asyncio.shield(leader)
+            metrics.record_cache('single_flight', messages is not None)
+            if messages is not None:
+                # Followers never reach the router; outer middlewares label them with the leader's route.
+                if route is not None:
+                    scope['route'] = route
+                for message in messages:
+                    await send(dict(message))
+                return
+            await self.app(scope, receive, send)
+            return
+
+        metrics.record_cache('single_flight', False)
+        flight = self.in_flight[key] = asyncio.get_running_loop().create_future()
+        recorder = _Recorder()
+
+        def land():
+            if not flight.done():
+                del self.in_flight[key]
+                flight.set_result((recorder.result(), scope.get('route')))
+
+        async def send_and_record(message):
+            if not recorder.record(message):
+                # Nothing more is recorded, so the followers run on their own right away instead of
+                # waiting for the rest of a streamed body.
+                land()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            land()
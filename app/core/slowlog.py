@@ -0,0 +1,152 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core import capture, config, instrumentation
+
+logger = logging.getLogger('app.slow_queries')
+logger.propagate = False
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+MAX_PARAMETER_LENGTH = 200
+
+recent = deque(maxlen=config.SLOW_QUERY_BUFFER)
+_handler_lock = threading.Lock()
+
+
+def _ensure_handler():
+    if logger.handlers:
+        return
+    with _handler_lock:
+        if not logger.handlers:
+            handler = RotatingFileHandler(
+                config.SLOW_QUERY_LOG_FILE,
+                maxBytes=config.SLOW_QUERY_LOG_MAX_BYTES,
+                backupCount=config.SLOW_QUERY_LOG_BACKUPS,
+                encoding='utf-8',
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.WARNING)
+
+
+def _parameter(value):
+    # SQLite parameters are positional, so which column they belong to is unknown; every string
+    # may hold an email or contact and is logged as the marker traces use, ids and limits as is.
+    if isinstance(value, (str, bytes)):
+        return capture.redact(value)
+    text = repr(value)
+    return text if len(text) <= MAX_PARAMETER_LENGTH else text[:MAX_PARAMETER_LENGTH] + '...'
+
+
+def explain(cursor, statement: str, parameters):
+    """
+    This function returns the SQLite `EXPLAIN QUERY PLAN` rows of a statement.
+
+    The plan is read on the same DBAPI connection as the statement, through a plain DBAPI cursor,
+    so it sees the same transaction and does not go through the engine hooks again.
+
+    :param cursor: The DBAPI cursor the statement ran on
+    :param statement: The SQL statement
+    :type statement: str
+    :param parameters: The bound parameters of the statement
+    :return: a list of plan detail strings, or a single error message if the plan could not be read.
+    """
+    try:
+        plan_cursor = cursor.connection.cursor()
+        try:
+            rows = plan_cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters or ()).fetchall()
+        finally:
+            plan_cursor.close()
+    except Exception as exc:
+        return [f'plan unavailable: {exc}']
+    return [row[-1] for row in rows]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['slow_query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # The hook runs when the DBAPI `execute` returns, before any row is fetched. SQLite produces
+    # rows while they are fetched, so a statement only counts up to its first row; a scan that
+    # returns many rows is slow in the fetch and may not be logged.
+    threshold = config.SLOW_QUERY_MS
+    if threshold < 0:
+        return
+    duration_ms = (time.perf_counter() - conn.info.pop('slow_query_started', time.perf_counter())) * 1000
+    if duration_ms < threshold:
+        return
+
+    stats = instrumentation.current_request.get()
+    scope = stats.scope if stats is not None else {}
+    explainable = (
+        conn.dialect.name == 'sqlite'
+        and not executemany
+        and statement.lstrip().upper().startswith(EXPLAINABLE)
+    )
+    plan = explain(cursor, statement, parameters) if explainable else []
+    record(
+        statement=statement,
+        parameters=[_parameter(value) for value in (parameters[:20] if executemany else parameters or ())],
+        duration_ms=round(duration_ms, 3),
+        method=scope.get('method'),
+        route=instrumentation.route_template(scope) if scope else None,
+        plan=plan,
+        full_scan=any(detail.startswith('SCAN') for detail in plan),
+    )
+
+
+def record(**entry):
+    """
+    This function appends one slow query to the in-memory buffer and the rotating log file.
+    """
+    entry = {'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds'), **entry}
+    recent.append(entry)
+    _ensure_handler()
+    logger.warning(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def install(engine: Engine):
+    """
+    This function attaches the slow query hooks to an engine.
+
+    :param engine: The engine whose statements are timed against `config.SLOW_QUERY_MS`
+    :type engine: Engine
+    """
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def query(route: str = None, min_ms: float = None, full_scan: bool = None, limit: int = 100):
+    """
+    This function returns the most recent slow queries of this process, newest first.
+
+    :param route: Only return queries issued by this route template
+    :type route: str
+    :param min_ms: Only return queries that took at least this many milliseconds
+    :type min_ms: float
+    :param full_scan: Only return queries whose plan does (or does not) contain a full table scan
+    :type full_scan: bool
+    :param limit: The maximum number of entries to return
+    :type limit: int
+    """
+    matches = []
+    for entry in reversed(list(recent)):
+        if route is not None and entry['route'] != route:
+            continue
+        if min_ms is not None and entry['duration_ms'] < min_ms:
+            continue
+        if full_scan is not None and entry['full_scan'] != full_scan:
+            continue
+        matches.append(entry)
+        if len(matches) >= limit:
+            break
+    return matches
@@ -0,0 +1,51 @@
+"""
+Streaming JSON array responses for list routes that can return a whole table.
+
+The rows are produced in batches and each batch is encoded and sent as soon as it is ready, so a
+request holds one batch of rows and one encoded chunk at a time instead of the whole list and its
+JSON string. The array holds the same rows as the buffered response.
+"""
+import json
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+
+def _encode(rows):
+    return ','.join(
+        json.dumps(jsonable_encoder(row), ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+        for row in rows
+    ).encode('utf-8')
+
+
+def json_array(batches):
+    """
+    This function encodes batches of rows as the chunks of one JSON array.
+
+    :param batches: An iterable of lists of rows
+    :return: a generator of byte chunks, one per non-empty batch, that concatenate to a JSON array.
+    """
+    yield b'['
+    first = True
+    for rows in batches:
+        if not rows:
+            continue
+        chunk = _encode(rows)
+        yield chunk if first else b',' + chunk
+        first = False
+    yield b']'
+
+
+def json_array_response(batches, headers: dict = None):
+    """
+    This function returns a response streaming batches of rows as a JSON array.
+
+    The batches are pulled while the response is sent, so a database cursor behind them stays open
+    until the last chunk; the request's session is only closed once the response is complete.
+
+    :param batches: An iterable of lists of rows
+    :param headers: Extra response headers
+    :type headers: dict
+    :return: a StreamingResponse of the rows.
+    """
+    return StreamingResponse(json_array(batches), media_type='application/json', headers=headers)
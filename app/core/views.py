@@ -0,0 +1,209 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, conint, validator
+
+from app.core import backup, config, instrumentation, metrics, profiling, slowlog
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    This function guards the admin routes by comparing the X-Admin-Token header with the configured
+    ADMIN_TOKEN. The admin routes are disabled while no token is configured.
+    
+    :param x_admin_token: The value of the X-Admin-Token request header
+    :type x_admin_token: Optional[str]
+    """
+    # Compared in constant time, as bytes since compare_digest rejects non-ASCII strings.
+    if not config.ADMIN_TOKEN or not hmac.compare_digest(
+        (x_admin_token or '').encode('utf-8'), config.ADMIN_TOKEN.encode('utf-8')
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin token is missing or invalid"
+        )
+
+
+class ProfilingRequest(BaseModel):
+    route: str
+    method: Optional[str] = None
+    count: Optional[conint(ge=1)] = 1
+    format: str = 'pstats'
+    header_only: bool = False
+
+    @validator('format')
+    def check_format(cls, value):
+        if value not in profiling.FORMATS:
+            raise ValueError(f"format must be one of {', '.join(profiling.FORMATS)}")
+        return value
+
+
+class BackupRequest(BaseModel):
+    compress: bool = True
+    verify: bool = True
+
+
+metrics_router = APIRouter(
+    tags=['Monitoring']
+)
+
+
+@metrics_router.get('/metrics', include_in_schema=False)
+def get_metrics():
+    """
+    This function serves every registered metric in the Prometheus text exposition format.
+    
+    :return: a plain text response meant to be scraped by Prometheus.
+    """
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=['Admin'],
+    dependencies=[Depends(require_admin)]
+)
+
+
+@router.get('/queries/', status_code=status.HTTP_200_OK)
+def get_query_summary():
+    """
+    This function returns the number of SQL statements and the DB time spent per route since startup.
+    
+    :return: a list with one entry per method and route template, sorted by total statement count.
+    """
+    return instrumentation.summary()
+
+
+@router.get('/slow-queries/', status_code=status.HTTP_200_OK)
+def get_slow_queries(
+    route: Optional[str] = None,
+    min_ms: Optional[float] = None,
+    full_scan: Optional[bool] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    This function returns the most recent statements that crossed the slow query threshold.
+    
+    :param route: Only return statements issued by this route template, e.g. `/federal/districts/`
+    :type route: Optional[str]
+    :param min_ms: Only return statements that took at least this many milliseconds
+    :type min_ms: Optional[float]
+    :param full_scan: Only return statements whose query plan does (or does not) scan a whole table
+    :type full_scan: Optional[bool]
+    :param limit: The maximum number of statements to return
+    :type limit: int
+    :return: a list of slow statements with their parameters, duration, route and SQLite query plan,
+    newest first. The same entries are written to the rotating slow query log file.
+    """
+    return {
+        'threshold_ms': config.SLOW_QUERY_MS,
+        'queries': slowlog.query(route=route, min_ms=min_ms, full_scan=full_scan, limit=limit),
+    }
+
+
+@router.post('/profiling/', status_code=status.HTTP_201_CREATED)
+def arm_profiling(request: ProfilingRequest, http_request: Request):
+    """
+    This function arms profiling of the next requests to a route.
+    
+    :param request: The route template (or `*`), optional method, number of requests to profile,
+    output format (`pstats` or `speedscope`) and whether only requests carrying an `X-Profile`
+    header together with the admin token should be profiled. `count` may only be null together
+    with `header_only`, in which case profiling stays armed until it is disarmed
+    :type request: ProfilingRequest
+    :param http_request: The current request, used to reach the application's routes
+    :type http_request: Request
+    :return: the list of armed routes.
+    """
+    if request.count is None and not request.header_only:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="count can only be omitted for header_only profiling"
+        )
+    matched = profiling.arm(
+        http_request.app.routes,
+        request.route,
+        method=request.method,
+        count=request.count,
+        profile_format=request.format,
+        header_only=request.header_only
+    )
+    if not matched:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No route matches {request.method or 'any method'} {request.route}"
+        )
+    return matched
+
+@router.get('/profiling/', status_code=status.HTTP_200_OK)
+def get_profiling():
+    """
+    This function returns the armed routes and the stored profiles.
+    """
+    return {'armed': profiling.status(), 'profiles': profiling.stored_profiles()}
+
+@router.delete('/profiling/', status_code=status.HTTP_202_ACCEPTED)
+def disarm_profiling():
+    """
+    This function disarms profiling on every route.
+    """
+    profiling.disarm()
+    return {'message': "Profiling disarmed"}
+
+@router.get('/profiling/{name}', status_code=status.HTTP_200_OK)
+def download_profile(name: str):
+    """
+    This function downloads a stored profile.
+    
+    :param name: The file name of the profile as listed by `GET /admin/profiling/`
+    :type name: str
+    :return: the pstats (`.prof`, readable with `python -m pstats` or snakeviz) or speedscope
+    (`.speedscope.json`, readable at speedscope.app) file.
+    """
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {name} is not found"
+        )
+    return FileResponse(path, filename=name)
+
+@router.post('/backup/', status_code=status.HTTP_202_ACCEPTED)
+def start_backup(request: BackupRequest):
+    """
+    This function starts an online backup of the database in the background.
+    
+    :param request: Whether to gzip the backup and to check the integrity of the copy
+    :type request: BackupRequest
+    :return: the progress of the new backup, also available from `GET /admin/backup/`. Responds with
+    409 while another backup is running.
+    """
+    try:
+        progress = backup.start(compress=request.compress, verify=request.verify)
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        )
+    if progress is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A backup is already running"
+        )
+    return progress.as_dict()
+
+@router.get('/backup/', status_code=status.HTTP_200_OK)
+def get_backup():
+    """
+    This function returns the progress of the running backup, or the result of the last one.
+    """
+    result = backup.status()
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No backup has been started"
+        )
+    return result
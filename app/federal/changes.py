@@ -0,0 +1,153 @@
+"""
+Change log of the federal tables, read by offline clients to sync only what changed.
+
+Every federal write adds one `ChangeLog` entry to the session it runs in, so the entry is
+committed or rolled back together with the write. Deletes leave a tombstone (an entry without a
+snapshot). Old entries are removed by `compact`; clients whose last sync is older than the oldest
+remaining entry get `410 Gone` and re-download the lists.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.account import database
+from app.federal import models
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+MAX_LIMIT = 10000
+
+
+def snapshot(row):
+    return {column.key: getattr(row, column.key) for column in row.__table__.columns}
+
+
+def record(row, op: str, db: Session):
+    """
+    This function logs a write to a federal row in the session the write runs in.
+
+    :param row: The created, updated or deleted `Country`, `Province`, `District` or
+    `Municipality`. Created rows must have been flushed so that their id is known
+    :param op: One of `CREATE`, `UPDATE` or `DELETE`
+    :type op: str
+    :param db: The database session of the write
+    :type db: Session
+    """
+    db.add(models.ChangeLog(
+        table=row.__tablename__,
+        row_id=row.id,
+        op=op,
+        snapshot=None if op == DELETE else snapshot(row),
+    ))
+
+
+def bounds(db: Session):
+    """
+    This function returns the `(horizon, head)` of the change log: clients that synced up to
+    `horizon` or later can be brought up to date, `head` is the sequence number of the newest entry.
+    """
+    oldest, newest = db.execute(select(func.min(models.ChangeLog.seq), func.max(models.ChangeLog.seq))).one()
+    if newest is None:
+        return 0, 0
+    return oldest - 1, newest
+
+
+def get_changes(since, limit: int, db: Session):
+    """
+    This function returns the federal changes committed after a sequence number, oldest first.
+
+    :param since: The `last_seq` of the client's previous sync. `None` returns no changes and only
+    the current head, which new clients store before downloading the full lists
+    :type since: Optional[int]
+    :param limit: The maximum number of changes to return; `has_more` tells the client to ask again
+    :type limit: int
+    :param db: The database session used to read the log
+    :type db: Session
+    :return: a dictionary with the changes, the head of the log, the `last_seq` to send next time and
+    whether more changes are waiting.
+    """
+    horizon, head = bounds(db)
+    if since is None:
+        return {'changes': [], 'head': head, 'last_seq': head, 'has_more': False}
+    if since < horizon:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail={
+                'message': f"Changes after {since} have been compacted, download the full lists again",
+                'head': head,
+            }
+        )
+    entries = db.execute(
+        select(models.ChangeLog)
+        .where(models.ChangeLog.seq > since)
+        .order_by(models.ChangeLog.seq)
+        .limit(limit + 1)
+    ).scalars().all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    return {
+        'changes': [
+            {
+                'seq': entry.seq,
+                'table': entry.table,
+                'id': entry.row_id,
+                'op': entry.op,
+                'data': entry.snapshot,
+                'changed_at': entry.changed_at,
+            }
+            for entry in entries
+        ],
+        'head': head,
+        'last_seq': entries[-1].seq if entries else max(since, 0),
+        'has_more': has_more,
+    }
+
+
+def compact(older_than: timedelta, db: Session):
+    """
+    This function deletes the change log entries older than a retention period.
+
+    The newest entry is always kept, so the horizon clients are checked against never moves back
+    to zero.
+
+    :param older_than: Entries logged before now minus this period are deleted
+    :type older_than: timedelta
+    :param db: The database session used for the compaction
+    :type db: Session
+    :return: the number of entries deleted.
+    """
+    cutoff = datetime.now(timezone.utc) - older_than
+    newest = db.execute(select(func.max(models.ChangeLog.seq))).scalar()
+    if newest is None:
+        return 0
+    result = db.execute(
+        delete(models.ChangeLog)
+        .where(models.ChangeLog.changed_at < cutoff, models.ChangeLog.seq < newest)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compact the federal change log.')
+    parser.add_argument('--days', type=float, default=30, help='delete entries older than this many days')
+    args = parser.parse_args(argv)
+
+    models.ChangeLog.__table__.create(bind=database.engine, checkfirst=True)
+    db = database.SessionLocal()
+    try:
+        deleted = compact(timedelta(days=args.days), db)
+        horizon, head = bounds(db)
+        print(f"deleted {deleted} change log entries, clients synced up to {horizon} or later can resume (head {head})")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
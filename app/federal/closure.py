@@ -0,0 +1,193 @@
+"""
+Closure table of the federal hierarchy: one `(ancestor, descendant, depth)` row for every pair of
+regions where one contains the other, including each region with itself at depth 0.
+
+Regions are identified by `(table, id)` since the four levels live in separate tables. The federal
+writes keep the table current in their own transaction: creates link the new row under its
+parent's ancestors, deletes unlink it, and updates that change a parent move the whole subtree.
+"""
+import argparse
+import sys
+
+from sqlalchemy import delete, insert, literal, or_, select, true, tuple_, union_all
+from sqlalchemy.orm import Session, aliased
+
+from app.account import database
+from app.federal import models
+
+Closure = models.Closure
+LEVELS = ('country', 'province', 'district', 'municipality')
+# The parent table of each level, which is also the name of the column holding the parent id.
+PARENTS = {'province': 'country', 'district': 'province', 'municipality': 'district'}
+COLUMNS = ('ancestor_table', 'ancestor_id', 'descendant_table', 'descendant_id', 'depth')
+
+
+def _is(table: str, id: int, side: str):
+    return (getattr(Closure, f'{side}_table') == table) & (getattr(Closure, f'{side}_id') == id)
+
+
+def _subtree(table: str, id: int):
+    return select(Closure.descendant_table, Closure.descendant_id).where(_is(table, id, 'ancestor'))
+
+
+def _attach(table: str, id: int, parent_id: int, db: Session):
+    ancestor, subtree = aliased(Closure), aliased(Closure)
+    # Deliberately a cross product: every ancestor of the new parent is linked to every row of the
+    # moved subtree.
+    links = select(
+        ancestor.ancestor_table, ancestor.ancestor_id, subtree.descendant_table, subtree.descendant_id,
+        ancestor.depth + subtree.depth + 1,
+    ).select_from(ancestor).join(subtree, true()).where(
+        ancestor.descendant_table == PARENTS[table], ancestor.descendant_id == parent_id,
+        subtree.ancestor_table == table, subtree.ancestor_id == id,
+    )
+    db.execute(insert(Closure).from_select(COLUMNS, links))
+
+
+def _detach(table: str, id: int, db: Session):
+    subtree = _subtree(table, id)
+    db.execute(delete(Closure).where(
+        tuple_(Closure.descendant_table, Closure.descendant_id).in_(subtree),
+        tuple_(Closure.ancestor_table, Closure.ancestor_id).not_in(subtree),
+    ))
+
+
+def add(row, db: Session):
+    """
+    This function links a newly created federal row under its parent, in one statement.
+
+    :param row: The created `Country`, `Province`, `District` or `Municipality`, already flushed
+    :param db: The database session of the create
+    :type db: Session
+    """
+    table = row.__tablename__
+    links = [select(literal(table), literal(row.id), literal(table), literal(row.id), literal(0))]
+    parent_id = getattr(row, PARENTS[table]) if table in PARENTS else None
+    if parent_id is not None:
+        links.append(
+            select(Closure.ancestor_table, Closure.ancestor_id, literal(table), literal(row.id), Closure.depth + 1)
+            .where(_is(PARENTS[table], parent_id, 'descendant'))
+        )
+    db.execute(insert(Closure).from_select(COLUMNS, union_all(*links)))
+
+
+def move(row, db: Session):
+    """
+    This function moves a federal row and everything under it to the row's current parent, after
+    an update changed the parent id.
+    """
+    table = row.__tablename__
+    _detach(table, row.id, db)
+    parent_id = getattr(row, PARENTS[table])
+    if parent_id is not None:
+        _attach(table, row.id, parent_id, db)
+
+
+def remove(row, db: Session):
+    """
+    This function unlinks a federal row that is about to be deleted. Rows that were under it keep
+    their links among themselves but no longer have ancestors above the deleted row.
+    """
+    table = row.__tablename__
+    _detach(table, row.id, db)
+    db.execute(delete(Closure).where(or_(_is(table, row.id, 'ancestor'), _is(table, row.id, 'descendant'))))
+
+
+def descendants(table: str, id: int, db: Session, level: str = None):
+    """
+    This function returns the regions inside a federal row, nearest first.
+
+    :param table: The table of the containing row
+    :type table: str
+    :param id: The id of the containing row
+    :type id: int
+    :param db: The database session used for the lookup
+    :type db: Session
+    :param level: Only return regions of this table
+    :type level: str
+    :return: a list of `(table, id, depth)` tuples, the row itself excluded.
+    """
+    query = (
+        select(Closure.descendant_table, Closure.descendant_id, Closure.depth)
+        .where(_is(table, id, 'ancestor'), Closure.depth > 0)
+        .order_by(Closure.depth, Closure.descendant_id)
+    )
+    if level is not None:
+        query = query.where(Closure.descendant_table == level)
+    return db.execute(query).all()
+
+
+def ancestors(table: str, id: int, db: Session):
+    """
+    This function returns the regions containing a federal row as `(table, id, depth)` tuples,
+    nearest first, the row itself excluded.
+    """
+    query = (
+        select(Closure.ancestor_table, Closure.ancestor_id, Closure.depth)
+        .where(_is(table, id, 'descendant'), Closure.depth > 0)
+        .order_by(Closure.depth)
+    )
+    return db.execute(query).all()
+
+
+def within(table: str, id: int, level: str):
+    """
+    This function returns a subquery of the ids of `level` rows inside (or equal to) a region,
+    for filtering other tables by any ancestor region with one indexed lookup.
+    """
+    return select(Closure.descendant_id).where(_is(table, id, 'ancestor'), Closure.descendant_table == level)
+
+
+def rebuild(db: Session):
+    """
+    This function recomputes the whole closure table from the four federal tables in one
+    transaction.
+
+    :param db: The database session used for the rebuild
+    :type db: Session
+    :return: the number of closure rows written.
+    """
+    parents = {}
+    for table in LEVELS:
+        model = getattr(models, table.capitalize())
+        parent_column = getattr(model, PARENTS[table]) if table in PARENTS else None
+        columns = [model.id, parent_column] if parent_column is not None else [model.id]
+        for row in db.execute(select(*columns)):
+            parent = (PARENTS[table], row[1]) if parent_column is not None and row[1] is not None else None
+            parents[(table, row[0])] = parent
+
+    links = []
+    for node in parents:
+        # Levels only point upwards, so every chain ends at a country or at a missing parent.
+        ancestor, depth = node, 0
+        while ancestor in parents:
+            links.append(dict(zip(COLUMNS, (*ancestor, *node, depth))))
+            ancestor, depth = parents[ancestor], depth + 1
+
+    db.execute(delete(Closure))
+    if links:
+        db.execute(insert(Closure), links)
+    db.commit()
+    return len(links)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the federal closure table.')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the closure table from the federal tables')
+    args = parser.parse_args(argv)
+
+    Closure.__table__.create(bind=database.engine, checkfirst=True)
+    db = database.SessionLocal()
+    try:
+        if args.rebuild:
+            print(f"rebuilt {rebuild(db)} closure rows")
+        else:
+            count = db.query(Closure).count()
+            print(f"{count} closure rows, run with --rebuild to recompute them")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request, status
 from sqlalchemy.orm import Session
 
-from app.federal import schemas, utils
+from app.federal import changes, schemas, utils
 from app.account import database
+from app.core import cache, streaming
+from app.core.querybudget import query_budget
 
 get_db = database.get_db
 
@@ -12,6 +16,7 @@ router = APIRouter(
 )
 
 @router.post('/country/', status_code=status.HTTP_201_CREATED)
+@query_budget(5)
 def create_country(request: schemas.CountryCreate, db: Session = Depends(get_db)):
     """
     This function creates a new country record in the database using the provided request data.
@@ -31,10 +36,23 @@ def create_country(request: schemas.CountryCreate, db: Session = Depends(get_db)
     return utils.create_country(request, db)
 
 @router.get('/countries/', status_code=status.HTTP_200_OK, response_model=None)
-def get_all_country(db: Session = Depends(get_db)):
+@query_budget(6)
+def get_all_country(request: Request, ids: Optional[str] = None, expand: Optional[str] = None,
+                    locale: Optional[str] = Depends(utils.get_language),
+                    db: Session = Depends(get_db)):
     """
     This function retrieves all data from a database using a helper function.
     
+    :param request: The incoming request, used to pick the encoding of the cached body
+    :type request: Request
+    :param ids: Optional comma separated ids, e.g. `1,2,3`, to only return those countries in the given
+    order together with the ids that do not exist
+    :type ids: Optional[str]
+    :param expand: Optional comma separated relations to nest into each country, e.g.
+    `provinces.districts`
+    :type expand: Optional[str]
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
     :param db: The parameter `db` is a dependency injection that is used to get a database session
     object. It is of type `Session` which is a class from the SQLAlchemy library that represents a
     connection to a database. The `Depends` function is used to declare a dependency on the `get_db`
@@ -43,16 +61,48 @@ def get_all_country(db: Session = Depends(get_db)):
     `utils` module, passing in the `db` parameter. The specific return value depends on the
     implementation of the `get_all` function in the `utils` module.
     """
-    return utils.get_all_country(db)
+    expanded = utils.parse_expand('country', expand)
+    if ids is not None:
+        return utils.get_by_ids('country', utils.parse_ids(ids), expanded, locale)
+    return cache.json_response(
+        request, utils.list_key('countries', expanded, locale), 'federal',
+        lambda: utils.get_all_country(db, expanded, locale), utils.language_headers(locale),
+    )
+
+@router.post('/countries/lookup/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(6)
+def lookup_country(request: schemas.LookupRequest, locale: Optional[str] = Depends(utils.get_language),
+                   db: Session = Depends(get_db)):
+    """
+    This function retrieves the countries with the given ids, for id lists too long for a query string.
+
+    :param request: The ids to look up, and optionally the relations to expand as in `expand`
+    :type request: schemas.LookupRequest
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
+    :param db: The database session of the request
+    :type db: Session
+    :return: the found countries under `results` in the order their ids were requested, and the ids
+    that do not exist under `missing`.
+    """
+    return utils.get_by_ids('country', request.ids, utils.parse_expand('country', request.expand), locale)
 
-@router.get('/country/{id}/', status_code=status.HTTP_200_OK, response_model=schemas.ShowCountry)
-def get_country(id: int, db: Session = Depends(get_db)):
+@router.get('/country/{id}/', status_code=status.HTTP_200_OK, response_model=schemas.CountryNode,
+            response_model_exclude_unset=True)
+@query_budget(6)
+def get_country(id: int, expand: Optional[str] = None, locale: Optional[str] = Depends(utils.get_language),
+                db: Session = Depends(get_db)):
     """
     This function retrieves a country from a database based on its ID.
     
     :param id: The id parameter is an integer that represents the unique identifier of a country in a
     database
     :type id: int
+    :param expand: Optional comma separated relations to nest into the country, e.g.
+    `provinces.districts`
+    :type expand: Optional[str]
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
     :param db: db is a parameter of type Session that is used to access the database. It is obtained
     using the get_db function which returns a new session for each request. The session is used to query
     the database and perform CRUD operations. The Session object is provided by the SQLAlchemy ORM
@@ -62,9 +112,10 @@ def get_country(id: int, db: Session = Depends(get_db)):
     function with the `id` parameter and the `db` parameter obtained from the `get_db()` function. The
     specific return value depends on the implementation of the `utils.get_country()` function.
     """
-    return utils.get_country(id, db)
+    return utils.get_country(id, db, utils.parse_expand('country', expand), locale)
 
 @router.delete('/country/{id}/', status_code=status.HTTP_202_ACCEPTED, response_model=None)
+@query_budget(6)
 def delete_country(id: int, db: Session = Depends(get_db)):
     """
     This function deletes a country from the database based on its ID.
@@ -84,6 +135,7 @@ def delete_country(id: int, db: Session = Depends(get_db)):
     return utils.delete_country(id, db)
 
 @router.put('/country/{id}/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(5)
 def update_country(id: int, request: schemas.UpdateCountry, db: Session = Depends(get_db)):
     """
     This function updates a country in the database based on the provided ID and request data.
@@ -105,6 +157,7 @@ def update_country(id: int, request: schemas.UpdateCountry, db: Session = Depend
     return utils.update_country(id, request, db)
 
 @router.patch('/country/{id}/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(5)
 def patch_country(id: int, request: schemas.UpdateCountry, db: Session = Depends(get_db)):
     """
     This function patches a country in the database with the provided ID and request data.
@@ -127,6 +180,7 @@ def patch_country(id: int, request: schemas.UpdateCountry, db: Session = Depends
 
 
 @router.post('/province/', status_code=status.HTTP_201_CREATED)
+@query_budget(6)
 def create_province(request: schemas.ProvinceCreate, db: Session = Depends(get_db)):
     """
     This function creates a province using the provided request data and database connection.
@@ -148,10 +202,23 @@ def create_province(request: schemas.ProvinceCreate, db: Session = Depends(get_d
     return utils.create_province(request, db)
 
 @router.get('/provinces/', status_code=status.HTTP_200_OK, response_model=None)
-def get_all_province(db: Session = Depends(get_db)):
+@query_budget(6)
+def get_all_province(request: Request, ids: Optional[str] = None, expand: Optional[str] = None,
+                     locale: Optional[str] = Depends(utils.get_language),
+                     db: Session = Depends(get_db)):
     """
     This function retrieves all provinces from a database using a helper function.
     
+    :param request: The incoming request, used to pick the encoding of the cached body
+    :type request: Request
+    :param ids: Optional comma separated ids, e.g. `1,2,3`, to only return those provinces in the given
+    order together with the ids that do not exist
+    :type ids: Optional[str]
+    :param expand: Optional comma separated relations to nest into each province, e.g.
+    `country,districts.municipalities`
+    :type expand: Optional[str]
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
     :param db: The parameter `db` is of type `Session` and is used as a dependency for the function
     `get_all_province()`. It is likely that `get_db()` is a function that returns a database session
     object, which is then passed as an argument to `get_all_province()`. The session
@@ -160,17 +227,49 @@ def get_all_province(db: Session = Depends(get_db)):
     function from the `utils` module with the `db` parameter passed as an argument. The specific return
     value depends on the implementation of the `get_all_province` function in the `utils` module.
     """
-    return utils.get_all_province(db)
+    expanded = utils.parse_expand('province', expand)
+    if ids is not None:
+        return utils.get_by_ids('province', utils.parse_ids(ids), expanded, locale)
+    return cache.json_response(
+        request, utils.list_key('provinces', expanded, locale), 'federal',
+        lambda: utils.get_all_province(db, expanded, locale), utils.language_headers(locale),
+    )
+
+@router.post('/provinces/lookup/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(6)
+def lookup_province(request: schemas.LookupRequest, locale: Optional[str] = Depends(utils.get_language),
+                    db: Session = Depends(get_db)):
+    """
+    This function retrieves the provinces with the given ids, for id lists too long for a query string.
+
+    :param request: The ids to look up, and optionally the relations to expand as in `expand`
+    :type request: schemas.LookupRequest
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
+    :param db: The database session of the request
+    :type db: Session
+    :return: the found provinces under `results` in the order their ids were requested, and the ids
+    that do not exist under `missing`.
+    """
+    return utils.get_by_ids('province', request.ids, utils.parse_expand('province', request.expand), locale)
 
 
-@router.get('/province/{id}/', status_code=status.HTTP_200_OK, response_model=schemas.ShowProvince)
-def get_province(id: int, db: Session = Depends(get_db)):
+@router.get('/province/{id}/', status_code=status.HTTP_200_OK, response_model=schemas.ProvinceNode,
+            response_model_exclude_unset=True)
+@query_budget(6)
+def get_province(id: int, expand: Optional[str] = None, locale: Optional[str] = Depends(utils.get_language),
+                 db: Session = Depends(get_db)):
     """
     This function retrieves a province from a database based on its ID.
     
     :param id: The id parameter is an integer that represents the unique identifier of a province. It is
     used to retrieve information about a specific province from the database
     :type id: int
+    :param expand: Optional comma separated relations to nest into the province, e.g.
+    `country,districts.municipalities`
+    :type expand: Optional[str]
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
     :param db: The parameter `db` is a dependency injection that is used to get a database session. It
     is of type `Session` which is a class from the SQLAlchemy library that represents a transactional
     database session. The `get_db` function is responsible for creating a new database session for each
@@ -179,9 +278,10 @@ def get_province(id: int, db: Session = Depends(get_db)):
     :return: The function `get_province` is returning the result of calling the `utils.get_province`
     function with the `id` parameter and the `db` parameter obtained from the `get_db` dependency.
     """
-    return utils.get_province(id, db)
+    return utils.get_province(id, db, utils.parse_expand('province', expand), locale)
 
 @router.delete('/province/{id}/', status_code=status.HTTP_202_ACCEPTED, response_model=None)
+@query_budget(6)
 def delete_province(id: int, db: Session = Depends(get_db)):
     """
     This function deletes a province from the database based on its ID.
@@ -201,6 +301,7 @@ def delete_province(id: int, db: Session = Depends(get_db)):
     return utils.delete_province(id, db)
 
 @router.put('/province/{id}/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(7)
 def update_province(id: int, request: schemas.UpdateProvince, db: Session = Depends(get_db)):
     """
     This function updates a province in the database based on the provided ID and request data.
@@ -222,6 +323,7 @@ def update_province(id: int, request: schemas.UpdateProvince, db: Session = Depe
     return utils.update_province(id, request, db)
 
 @router.patch('/province/{id}/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(7)
 def patch_province(id: int, request: schemas.UpdateProvince, db: Session = Depends(get_db)):
     """
     This function patches a province in the database with the provided ID and update request.
@@ -246,6 +348,7 @@ def patch_province(id: int, request: schemas.UpdateProvince, db: Session = Depen
 
 
 @router.post('/district/', status_code=status.HTTP_201_CREATED)
+@query_budget(5)
 def create_district(request: schemas.DistrictCreate, db: Session = Depends(get_db)):
     """
     This function creates a district using the input data and database connection.
@@ -265,10 +368,23 @@ def create_district(request: schemas.DistrictCreate, db: Session = Depends(get_d
     return utils.create_district(request, db)
 
 @router.get('/districts/', status_code=status.HTTP_200_OK, response_model=None)
-def get_all_district(db: Session = Depends(get_db)):
+@query_budget(6)
+def get_all_district(request: Request, ids: Optional[str] = None, expand: Optional[str] = None,
+                     locale: Optional[str] = Depends(utils.get_language),
+                     db: Session = Depends(get_db)):
     """
     This function retrieves all districts from a database using a helper function.
     
+    :param request: The incoming request, used to pick the encoding of the cached body
+    :type request: Request
+    :param ids: Optional comma separated ids, e.g. `1,2,3`, to only return those districts in the given
+    order together with the ids that do not exist
+    :type ids: Optional[str]
+    :param expand: Optional comma separated relations to nest into each district, e.g.
+    `province.country,municipalities`
+    :type expand: Optional[str]
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
     :param db: The parameter `db` is of type `Session` and is used as a dependency for the function
     `get_all_district`. It is likely that this function is part of a FastAPI application and `Session`
     is an instance of a database session that is created and managed by an ORM (Object-
@@ -276,16 +392,48 @@ def get_all_district(db: Session = Depends(get_db)):
     :return: The function `get_all_district` is returning the result of calling the `get_all_district`
     function from the `utils` module, which is likely a list of all the districts in the database.
     """
-    return utils.get_all_district(db)
+    expanded = utils.parse_expand('district', expand)
+    if ids is not None:
+        return utils.get_by_ids('district', utils.parse_ids(ids), expanded, locale)
+    return cache.json_response(
+        request, utils.list_key('districts', expanded, locale), 'federal',
+        lambda: utils.get_all_district(db, expanded, locale), utils.language_headers(locale),
+    )
+
+@router.post('/districts/lookup/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(6)
+def lookup_district(request: schemas.LookupRequest, locale: Optional[str] = Depends(utils.get_language),
+                    db: Session = Depends(get_db)):
+    """
+    This function retrieves the districts with the given ids, for id lists too long for a query string.
+
+    :param request: The ids to look up, and optionally the relations to expand as in `expand`
+    :type request: schemas.LookupRequest
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
+    :param db: The database session of the request
+    :type db: Session
+    :return: the found districts under `results` in the order their ids were requested, and the ids
+    that do not exist under `missing`.
+    """
+    return utils.get_by_ids('district', request.ids, utils.parse_expand('district', request.expand), locale)
 
 
-@router.get('/district/{id}/', status_code=status.HTTP_200_OK, response_model=schemas.ShowDistrict)
-def get_district(id: int, db: Session = Depends(get_db)):
+@router.get('/district/{id}/', status_code=status.HTTP_200_OK, response_model=schemas.DistrictNode,
+            response_model_exclude_unset=True)
+@query_budget(6)
+def get_district(id: int, expand: Optional[str] = None, locale: Optional[str] = Depends(utils.get_language),
+                 db: Session = Depends(get_db)):
     """
     This function retrieves a district from a database based on its ID.
     
     :param id: The id parameter is an integer that represents the unique identifier of a district
     :type id: int
+    :param expand: Optional comma separated relations to nest into the district, e.g.
+    `province.country,municipalities`
+    :type expand: Optional[str]
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
     :param db: The parameter `db` is a dependency injection that is used to get a database session. It
     is of type `Session` which is a class from the SQLAlchemy library that represents a database
     session. The `Depends` function is used to declare a dependency on the `get_db` function which
@@ -296,9 +444,10 @@ def get_district(id: int, db: Session = Depends(get_db)):
     function with the same input parameters. The specific output of `utils.get_district()` depends on
     its implementation.
     """
-    return utils.get_district(id, db)
+    return utils.get_district(id, db, utils.parse_expand('district', expand), locale)
 
 @router.delete('/district/{id}/', status_code=status.HTTP_202_ACCEPTED, response_model=None)
+@query_budget(6)
 def delete_district(id: int, db: Session = Depends(get_db)):
     """
     This function deletes a district from the database based on its ID.
@@ -318,6 +467,7 @@ def delete_district(id: int, db: Session = Depends(get_db)):
     return utils.delete_district(id, db)
 
 @router.put('/district/{id}/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(7)
 def update_district(id: int, request: schemas.UpdateDistrict, db: Session = Depends(get_db)):
     """
     This function updates a district in the database based on the provided ID and request data.
@@ -340,6 +490,7 @@ def update_district(id: int, request: schemas.UpdateDistrict, db: Session = Depe
     return utils.update_district(id, request, db)
 
 @router.patch('/district/{id}/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(7)
 def patch_district(id: int, request: schemas.UpdateDistrict, db: Session = Depends(get_db)):
     """
     This function patches a district in the database with the provided ID and request data.
@@ -364,6 +515,7 @@ def patch_district(id: int, request: schemas.UpdateDistrict, db: Session = Depen
 
 
 @router.post('/municipality/', status_code=status.HTTP_201_CREATED)
+@query_budget(5)
 def create_municipality(request: schemas.MunicipalityCreate, db: Session = Depends(get_db)):
     """
     This function creates a municipality using the provided request data and database connection.
@@ -383,10 +535,26 @@ def create_municipality(request: schemas.MunicipalityCreate, db: Session = Depen
     return utils.create_municipality(request, db)
 
 @router.get('/municipalities/', status_code=status.HTTP_200_OK, response_model=None)
-def get_all_municipality(db: Session = Depends(get_db)):
+@query_budget(6)
+def get_all_municipality(request: Request, ids: Optional[str] = None, expand: Optional[str] = None,
+                         stream: bool = False, locale: Optional[str] = Depends(utils.get_language),
+                         db: Session = Depends(get_db)):
     """
     This function retrieves all municipalities from a database using a helper function.
     
+    :param request: The incoming request, used to pick the encoding of the cached body
+    :type request: Request
+    :param ids: Optional comma separated ids, e.g. `1,2,3`, to only return those municipalities in the given
+    order together with the ids that do not exist
+    :type ids: Optional[str]
+    :param expand: Optional comma separated relations to nest into each municipality, e.g.
+    `district.province.country`
+    :type expand: Optional[str]
+    :param stream: Send the list as a JSON array streamed in batches instead of the cached body, so the
+    response never holds the whole list in memory
+    :type stream: bool
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
     :param db: The parameter `db` is of type `Session` and is a dependency that is obtained using the
     `get_db` function. It is used to access the database session and perform database operations. The
     `Session` type is typically used in SQLAlchemy to represent a database session, which is a
@@ -397,16 +565,52 @@ def get_all_municipality(db: Session = Depends(get_db)):
     return value depends on the implementation of the `get_all_municipality` function in the `utils`
     module.
     """
-    return utils.get_all_municipality(db)
+    expanded = utils.parse_expand('municipality', expand)
+    if ids is not None:
+        return utils.get_by_ids('municipality', utils.parse_ids(ids), expanded, locale)
+    if stream:
+        return streaming.json_array_response(
+            utils.stream_municipality(expanded, locale), utils.language_headers(locale)
+        )
+    return cache.json_response(
+        request, utils.list_key('municipalities', expanded, locale), 'federal',
+        lambda: utils.get_all_municipality(db, expanded, locale), utils.language_headers(locale),
+    )
+
+@router.post('/municipalities/lookup/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(6)
+def lookup_municipality(request: schemas.LookupRequest, locale: Optional[str] = Depends(utils.get_language),
+                        db: Session = Depends(get_db)):
+    """
+    This function retrieves the municipalities with the given ids, for id lists too long for a query string.
+
+    :param request: The ids to look up, and optionally the relations to expand as in `expand`
+    :type request: schemas.LookupRequest
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
+    :param db: The database session of the request
+    :type db: Session
+    :return: the found municipalities under `results` in the order their ids were requested, and the ids
+    that do not exist under `missing`.
+    """
+    return utils.get_by_ids('municipality', request.ids, utils.parse_expand('municipality', request.expand), locale)
 
 
-@router.get('/municipality/{id}/', status_code=status.HTTP_200_OK, response_model=schemas.ShowMunicipality)
-def get_municipality(id: int, db: Session = Depends(get_db)):
+@router.get('/municipality/{id}/', status_code=status.HTTP_200_OK, response_model=schemas.MunicipalityNode,
+            response_model_exclude_unset=True)
+@query_budget(6)
+def get_municipality(id: int, expand: Optional[str] = None, locale: Optional[str] = Depends(utils.get_language),
+                     db: Session = Depends(get_db)):
     """
     This function retrieves a municipality from a database based on its ID.
     
     :param id: The id parameter is an integer that represents the unique identifier of a municipality
     :type id: int
+    :param expand: Optional comma separated relations to nest into the municipality, e.g.
+    `district.province.country`
+    :type expand: Optional[str]
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
     :param db: The parameter `db` is a dependency injection that is used to get a database session
     object. It is of type `Session` which is a class from the SQLAlchemy library that represents a
     transactional database session. The `get_db` function is responsible for creating a new database
@@ -416,9 +620,10 @@ def get_municipality(id: int, db: Session = Depends(get_db)):
     database session `db` as input parameters, and calls the `utils.get_municipality` function with
     these parameters to retrieve the municipality information from the database.
     """
-    return utils.get_municipality(id, db)
+    return utils.get_municipality(id, db, utils.parse_expand('municipality', expand), locale)
 
 @router.delete('/municipality/{id}/', status_code=status.HTTP_202_ACCEPTED, response_model=None)
+@query_budget(6)
 def delete_municipality(id: int, db: Session = Depends(get_db)):
     """
     This function deletes a municipality from a database using its ID.
@@ -438,6 +643,7 @@ def delete_municipality(id: int, db: Session = Depends(get_db)):
     return utils.delete_municipality(id, db)
 
 @router.put('/municipality/{id}/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(7)
 def update_municipality(id: int, request: schemas.UpdateMunicipality, db: Session = Depends(get_db)):
     """
     This function updates a municipality in the database based on the provided ID and request data.
@@ -459,6 +665,7 @@ def update_municipality(id: int, request: schemas.UpdateMunicipality, db: Sessio
     return utils.update_municipality(id, request, db)
 
 @router.patch('/municipality/{id}/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(7)
 def patch_municipality(id: int, request: schemas.UpdateMunicipality, db: Session = Depends(get_db)):
     """
     This function patches a municipality record in the database with the provided ID and request data.
@@ -479,3 +686,85 @@ def patch_municipality(id: int, request: schemas.UpdateMunicipality, db: Session
     specific return value of `utils.patch_municipality` is not specified in this code snippet.
     """
     return utils.patch_municipality(id, request, db)
+
+@router.get('/{table}/{id}/descendants/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(7)
+def get_descendants(table: schemas.Level, id: int, level: Optional[schemas.Level] = None,
+                    locale: Optional[str] = Depends(utils.get_language), db: Session = Depends(get_db)):
+    """
+    This function returns the regions inside a country, province, district or municipality.
+
+    :param table: The level of the containing region
+    :type table: schemas.Level
+    :param id: The id of the containing region
+    :type id: int
+    :param level: Only return regions of this level, e.g. every municipality of a province
+    :type level: Optional[schemas.Level]
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
+    :param db: The database session used to read the closure table
+    :type db: Session
+    :return: the regions nearest first, each with its `level` and its `depth` below the region.
+    """
+    return utils.get_descendants(table.value, id, db, level.value if level else None, locale)
+
+@router.get('/{table}/{id}/ancestors/', status_code=status.HTTP_200_OK, response_model=None)
+@query_budget(7)
+def get_ancestors(table: schemas.Level, id: int, locale: Optional[str] = Depends(utils.get_language),
+                  db: Session = Depends(get_db)):
+    """
+    This function returns the regions containing a province, district or municipality.
+
+    :param table: The level of the region
+    :type table: schemas.Level
+    :param id: The id of the region
+    :type id: int
+    :param locale: The language picked by the `utils.get_language` dependency
+    :type locale: Optional[str]
+    :param db: The database session used to read the closure table
+    :type db: Session
+    :return: the containing regions nearest first, each with its `level` and its `depth` above the
+    region.
+    """
+    return utils.get_ancestors(table.value, id, db, locale)
+
+@router.post('/batch/', status_code=status.HTTP_200_OK, response_model=schemas.BatchResponse)
+# Only the cache bump; each operation is checked against its own budget in `utils.run_batch`.
+@query_budget(1)
+def run_batch(request: schemas.BatchRequest, db: Session = Depends(get_db)):
+    """
+    This function applies several federal creates, updates, patches and deletes atomically.
+
+    :param request: The ordered operations. Each has an `op`, a `table`, the `id` of the row to
+    change, and the fields of the single route's body in `data`. Creates can name a temporary `ref`
+    that later operations use as an `id` or as a parent id
+    :type request: schemas.BatchRequest
+    :param db: The database session the batch runs in, committed once at the end
+    :type db: Session
+    :return: the id written by each operation, in order. If any operation fails, none is applied
+    and the error detail gives the index of the failing operation.
+    """
+    return utils.run_batch(request, db)
+
+@router.get('/changes/', status_code=status.HTTP_200_OK, response_model=schemas.ChangeFeed)
+@query_budget(2)
+def get_changes(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(1000, ge=1, le=changes.MAX_LIMIT),
+    db: Session = Depends(get_db),
+):
+    """
+    This function returns the federal creates, updates and deletes committed after `since`.
+
+    :param since: The `last_seq` returned by the client's previous sync. Leave it out to only get the
+    current `head`, which new clients store before downloading the full lists
+    :type since: Optional[int]
+    :param limit: The maximum number of changes to return; when `has_more` is true the client asks
+    again with the new `last_seq`
+    :type limit: int
+    :param db: The database session used to read the change log
+    :type db: Session
+    :return: the changes oldest first, each with the row snapshot or, for deletes, a `null` data
+    tombstone. Responds with 410 when entries after `since` have been compacted away.
+    """
+    return changes.get_changes(since, limit, db)
@@ -1,4 +1,6 @@
-from sqlalchemy import ForeignKey, Column, Integer, String
+from datetime import datetime, timezone
+
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Index, Integer, String
 
 from app.account.database import Base
 
@@ -43,3 +45,26 @@ class Municipality(Base):
     district = Column(Integer, ForeignKey('district.id', ondelete='RESTRICT', back_populates='district_municipality'))
 
 
+class ChangeLog(Base):
+    __tablename__='federal_change_log'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = Column(Integer, primary_key=True)
+    table = Column(String(25), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    op = Column(String(10), nullable=False)
+    snapshot = Column(JSON, nullable=True)
+    changed_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
+
+
+class Closure(Base):
+    __tablename__='federal_closure'
+    __table_args__ = (
+        Index('ix_federal_closure_descendant', 'descendant_table', 'descendant_id', 'depth'),
+    )
+
+    ancestor_table = Column(String(25), primary_key=True)
+    ancestor_id = Column(Integer, primary_key=True)
+    descendant_table = Column(String(25), primary_key=True)
+    descendant_id = Column(Integer, primary_key=True)
+    depth = Column(Integer, nullable=False)
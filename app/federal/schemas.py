@@ -1,6 +1,8 @@
-from typing import Optional
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, StrictInt, conlist
 
 class CountryCreate(BaseModel):
     title: Optional[str]
@@ -43,7 +45,7 @@ class ShowProvince(BaseModel):
     title_ne: Optional[str]
     code: Optional[str]
     order: Optional[int]
-    country: Optional[ShowCountry]
+    country: Optional[int]
 
     class Config():
         orm_mode = True
@@ -96,4 +98,111 @@ class ShowMunicipality(BaseModel):
     district: Optional[int]
 
     class Config():
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class CountryNode(BaseModel):
+    id: int
+    title: Optional[str]
+    title_ne: Optional[str]
+    name: Optional[str]
+    code: Optional[str]
+    order: Optional[int]
+    provinces: Optional[List['ProvinceNode']]
+
+class ProvinceNode(BaseModel):
+    id: int
+    title: Optional[str]
+    title_ne: Optional[str]
+    name: Optional[str]
+    code: Optional[str]
+    order: Optional[int]
+    country: Optional[Union[CountryNode, int]]
+    districts: Optional[List['DistrictNode']]
+
+class DistrictNode(BaseModel):
+    id: int
+    title: Optional[str]
+    title_ne: Optional[str]
+    name: Optional[str]
+    code: Optional[str]
+    order: Optional[int]
+    province: Optional[Union[ProvinceNode, int]]
+    municipalities: Optional[List['MunicipalityNode']]
+
+class MunicipalityNode(BaseModel):
+    id: int
+    title: Optional[str]
+    title_ne: Optional[str]
+    name: Optional[str]
+    code: Optional[str]
+    order: Optional[int]
+    district: Optional[Union[DistrictNode, int]]
+
+CountryNode.update_forward_refs()
+ProvinceNode.update_forward_refs()
+DistrictNode.update_forward_refs()
+
+
+class Level(str, Enum):
+    country = 'country'
+    province = 'province'
+    district = 'district'
+    municipality = 'municipality'
+
+
+class Language(str, Enum):
+    en = 'en'
+    ne = 'ne'
+
+
+MAX_LOOKUP_IDS = 10000
+
+class LookupRequest(BaseModel):
+    ids: conlist(int, min_items=1, max_items=MAX_LOOKUP_IDS)
+    expand: Optional[str] = None
+
+
+class BatchOp(str, Enum):
+    create = 'create'
+    update = 'update'
+    patch = 'patch'
+    delete = 'delete'
+
+class BatchOperation(BaseModel):
+    op: BatchOp
+    table: Level
+    # The row to update, patch or delete: an id, or the `ref` of a row created earlier in the batch.
+    id: Optional[Union[StrictInt, str]]
+    # Temporary id of a created row, usable as `id` or as a parent id by the later operations.
+    ref: Optional[str]
+    data: Dict[str, Any] = {}
+
+MAX_BATCH_OPERATIONS = 500
+
+class BatchRequest(BaseModel):
+    operations: conlist(BatchOperation, min_items=1, max_items=MAX_BATCH_OPERATIONS)
+
+class BatchResult(BaseModel):
+    op: BatchOp
+    table: Level
+    id: int
+    ref: Optional[str]
+
+class BatchResponse(BaseModel):
+    results: List[BatchResult]
+
+
+class Change(BaseModel):
+    seq: int
+    table: str
+    id: int
+    op: str
+    data: Optional[Dict[str, Any]]
+    changed_at: datetime
+
+class ChangeFeed(BaseModel):
+    changes: List[Change]
+    head: int
+    last_seq: int
+    has_more: bool
@@ -0,0 +1,362 @@
+"""
+Binary snapshot of the federal hierarchy, memory-mapped read-only by every worker.
+
+The file holds one set of fixed-width columns per table plus a single UTF-8 string blob:
+
+- `ids`, `parent`, `order`: int32 per row. Rows are sorted by (parent position, id), so the
+  children of a parent are one contiguous run. A NULL `order` is stored as `NULL_INT`, a parent
+  that does not exist as -1.
+- `index`: int32 per possible id (0..max_id), the row position of that id or -1.
+- `children`: uint32, `count + 1` entries of the parent table: the children of the parent at
+  position `p` are the rows `children[p]:children[p + 1]` of this table.
+- `<column>_start`, `<column>_length` for `title`, `title_ne` and `code`: where the value sits in
+  the string blob; a length of -1 means NULL.
+
+Columns are exposed as `memoryview` casts of the mapping, so lookups by id and by parent read
+straight from the page cache and every worker on the host shares the same physical pages. The
+file is written to a temporary name and renamed over the old one; workers that still map the old
+file keep a valid view of it until they reopen.
+"""
+import argparse
+import fcntl
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app.account import database
+from app.core import cache, config
+from app.federal import models
+
+MAGIC = b'MISDFED1'
+PREFIX = struct.Struct('<8sI')
+ALIGNMENT = 8
+NULL_INT = -2 ** 31
+STRING_COLUMNS = ('title', 'title_ne', 'code')
+# (table, model, parent table, parent column), parents first.
+TABLES = (
+    ('country', models.Country, None, None),
+    ('province', models.Province, 'country', 'country'),
+    ('district', models.District, 'province', 'province'),
+    ('municipality', models.Municipality, 'district', 'district'),
+)
+
+
+class _Writer:
+    def __init__(self):
+        self.sections = []
+        self.size = 0
+        self.strings = bytearray()
+
+    def add(self, values: array):
+        data = values.tobytes()
+        offset = self.size
+        self.sections.append(data + b'\0' * (-len(data) % ALIGNMENT))
+        self.size += len(self.sections[-1])
+        return [offset, values.typecode, len(values)]
+
+    def string(self, value):
+        if value is None:
+            return 0, -1
+        encoded = value.encode('utf-8')
+        start = len(self.strings)
+        self.strings += encoded
+        return start, len(encoded)
+
+
+def build(db: Session, data_version: int):
+    """
+    This function serializes the four federal tables into the snapshot format.
+
+    :param db: The database session used to read the tables
+    :type db: Session
+    :param data_version: The `federal` cache version the tables were read at
+    :type data_version: int
+    :return: the bytes of the snapshot file.
+    """
+    writer = _Writer()
+    header = {
+        'database': database.SQLALCHAMY_DATABASE_URL,
+        'data_version': data_version,
+        'byteorder': sys.byteorder,
+        'tables': {},
+    }
+    positions = {}
+    for name, model, parent_table, parent_column in TABLES:
+        columns = [model.id, model.order, *(getattr(model, column) for column in STRING_COLUMNS)]
+        if parent_column:
+            columns.append(getattr(model, parent_column))
+        rows = db.execute(select(*columns)).all()
+        parent_positions = positions.get(parent_table, {})
+
+        def parent_position(row):
+            return parent_positions.get(row[-1], -1) if parent_column else -1
+
+        rows.sort(key=lambda row: (parent_position(row), row[0]))
+        positions[name] = {row[0]: position for position, row in enumerate(rows)}
+        max_id = max((row[0] for row in rows), default=0)
+
+        index = array('i', [-1]) * (max_id + 1)
+        for position, row in enumerate(rows):
+            index[row[0]] = position
+        table = {
+            'count': len(rows),
+            'max_id': max_id,
+            'parent': parent_table,
+            'columns': {
+                'ids': writer.add(array('i', (row[0] for row in rows))),
+                'parent': writer.add(array('i', (
+                    (row[-1] if row[-1] is not None else -1) if parent_column else -1 for row in rows
+                ))),
+                'order': writer.add(array('i', (NULL_INT if row[1] is None else row[1] for row in rows))),
+                'index': writer.add(index),
+            },
+        }
+        for offset, column in enumerate(STRING_COLUMNS, start=2):
+            starts, lengths = array('I'), array('i')
+            for row in rows:
+                start, length = writer.string(row[offset])
+                starts.append(start)
+                lengths.append(length)
+            table['columns'][f'{column}_start'] = writer.add(starts)
+            table['columns'][f'{column}_length'] = writer.add(lengths)
+        if parent_table:
+            parent_count = header['tables'][parent_table]['count']
+            children = array('I', [0]) * (parent_count + 1)
+            for row in rows:
+                position = parent_position(row)
+                if position >= 0:
+                    children[position + 1] += 1
+            for position in range(parent_count):
+                children[position + 1] += children[position]
+            header['tables'][parent_table]['columns']['children'] = writer.add(children)
+        header['tables'][name] = table
+
+    header['strings'] = [writer.size, len(writer.strings)]
+    encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    encoded += b' ' * (-(PREFIX.size + len(encoded)) % ALIGNMENT)
+    return b''.join([PREFIX.pack(MAGIC, len(encoded)), encoded, *writer.sections, bytes(writer.strings)])
+
+
+def write(path: str, db: Session, data_version: int):
+    """
+    This function builds a snapshot and atomically replaces the file at `path` with it.
+    """
+    data = build(db, data_version)
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.federal-snapshot-')
+    try:
+        with os.fdopen(descriptor, 'wb') as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+class Table:
+    """
+    Read-only columns of one federal table inside a mapped snapshot.
+    """
+    __slots__ = ('name', 'count', 'max_id', 'parent_table', 'ids', 'parent', 'order', 'index',
+                 'children', 'strings', 'starts', 'lengths')
+
+    def __init__(self, name: str, header: dict, view: memoryview, data_offset: int, strings: memoryview):
+        self.name = name
+        self.count = header['count']
+        self.max_id = header['max_id']
+        self.parent_table = header['parent']
+        self.strings = strings
+        columns = {}
+        for column, (offset, typecode, length) in header['columns'].items():
+            start = data_offset + offset
+            columns[column] = view[start:start + length * 4].cast(typecode)
+        self.ids = columns['ids']
+        self.parent = columns['parent']
+        self.order = columns['order']
+        self.index = columns['index']
+        self.children = columns.get('children')
+        self.starts = {column: columns[f'{column}_start'] for column in STRING_COLUMNS}
+        self.lengths = {column: columns[f'{column}_length'] for column in STRING_COLUMNS}
+
+    def position(self, id: int):
+        """
+        This function returns the row position of an id, or -1 when the table has no such row.
+        """
+        if 0 <= id <= self.max_id:
+            return self.index[id]
+        return -1
+
+    def child_range(self, position: int):
+        """
+        This function returns the `(start, stop)` row positions of the children of the row at
+        `position`, in the child table.
+        """
+        return self.children[position], self.children[position + 1]
+
+    def string(self, column: str, position: int):
+        length = self.lengths[column][position]
+        if length < 0:
+            return None
+        start = self.starts[column][position]
+        return str(self.strings[start:start + length], 'utf-8')
+
+    def order_at(self, position: int):
+        value = self.order[position]
+        return None if value == NULL_INT else value
+
+    def parent_at(self, position: int):
+        value = self.parent[position]
+        return None if value < 0 else value
+
+
+class Snapshot:
+    """
+    A mapped snapshot file. The mapping is closed when the object is garbage collected, after the
+    last reader let go of it.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as handle:
+            self.mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mapping)
+        magic, header_length = PREFIX.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a federal snapshot')
+        header = json.loads(bytes(view[PREFIX.size:PREFIX.size + header_length]))
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path} was written on a {header["byteorder"]}-endian host')
+        data_offset = PREFIX.size + header_length
+        strings_offset, strings_length = header['strings']
+        strings = view[data_offset + strings_offset:data_offset + strings_offset + strings_length]
+        self.database = header['database']
+        self.data_version = header['data_version']
+        self.tables = {
+            name: Table(name, table, view, data_offset, strings)
+            for name, table in header['tables'].items()
+        }
+
+    def __getitem__(self, name: str):
+        return self.tables[name]
+
+    def fingerprint(self):
+        return [[self.tables[name].count, self.tables[name].max_id] for name, _, _, _ in TABLES]
+
+
+_current = None
+_lock = threading.Lock()
+
+
+def default_path():
+    """
+    This function returns `config.FEDERAL_SNAPSHOT_FILE`, or a path next to the SQLite database file
+    when it is unset, so that processes using different databases never share a snapshot.
+    """
+    if config.FEDERAL_SNAPSHOT_FILE:
+        return config.FEDERAL_SNAPSHOT_FILE
+    name = make_url(database.SQLALCHAMY_DATABASE_URL).database
+    if name in (None, '', ':memory:'):
+        return os.path.join(tempfile.gettempdir(), f'misdis-federal-{os.getpid()}.snapshot')
+    return f'{name}.federal-snapshot'
+
+
+def fingerprint(connection):
+    """
+    This function returns the row count and highest id of every federal table, read in one
+    statement, to tell a snapshot from tables changed without bumping the `federal` version.
+    """
+    columns = []
+    for _, model, _, _ in TABLES:
+        columns.append(select(func.count()).select_from(model).scalar_subquery())
+        columns.append(select(func.coalesce(func.max(model.id), 0)).scalar_subquery())
+    row = connection.execute(select(*columns)).one()
+    return [[row[position], row[position + 1]] for position in range(0, len(row), 2)]
+
+
+def _open(path: str, data_version: int, verify: bool):
+    try:
+        snapshot = Snapshot(path)
+    except (FileNotFoundError, ValueError):
+        return None
+    if snapshot.database != database.SQLALCHAMY_DATABASE_URL or snapshot.data_version != data_version:
+        return None
+    # Writers outside the application, such as a regenerated database, may not bump the version.
+    if verify:
+        with database.engine.connect() as connection:
+            if fingerprint(connection) != snapshot.fingerprint():
+                return None
+    return snapshot
+
+
+def current():
+    """
+    This function returns the snapshot matching the current `federal` data version.
+
+    A stale or missing file is rebuilt by one worker at a time, under an exclusive lock on a
+    `.lock` file next to it; the other workers wait and map the file that worker wrote. A file is
+    also stale when the row counts or highest ids of the tables differ from the ones it was built
+    from, which is checked when a process maps its first file; after that a worker only notices
+    writes through the version, so writers outside the application must call
+    `cache.bump('federal', db)`.
+    """
+    global _current
+    data_version = cache.version('federal')
+    snapshot = _current
+    if snapshot is not None and snapshot.data_version == data_version:
+        return snapshot
+    path = default_path()
+    with _lock:
+        # Files mapped later were written for a version this process polled, from the tables as
+        # they were at that version, so only the first one can predate an out-of-band write.
+        verify = _current is None
+        snapshot = _open(path, data_version, verify)
+        if snapshot is None:
+            with open(f'{path}.lock', 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                # Another worker may have rebuilt the file for a version this worker has not
+                # polled yet; re-read the version so the two agree instead of rebuilding back.
+                data_version = cache.version('federal', refresh=True)
+                snapshot = _open(path, data_version, verify)
+                if snapshot is None:
+                    db = database.SessionLocal()
+                    try:
+                        write(path, db, data_version)
+                    finally:
+                        db.close()
+                    snapshot = Snapshot(path)
+        _current = snapshot
+    return snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or inspect the federal snapshot file.')
+    parser.add_argument('--build', action='store_true', help='rebuild the snapshot from the database')
+    parser.add_argument('--path', default=None, help='defaults to the file the application uses')
+    args = parser.parse_args(argv)
+
+    args.path = args.path or default_path()
+    if args.build:
+        db = database.SessionLocal()
+        try:
+            write(args.path, db, cache.version('federal'))
+        finally:
+            db.close()
+    snapshot = Snapshot(args.path)
+    print(f"{args.path}: {os.path.getsize(args.path)} bytes, federal data version {snapshot.data_version}")
+    for name, table in snapshot.tables.items():
+        print(f"  {name}: {table.count} rows, max id {table.max_id}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Read access to the federal tables backed by the columnar snapshot of `app.federal.snapshot`.
+
+Rows are only materialized as dictionaries when a route returns them; lookups by id are one index
+read and the children of a parent are one contiguous range, both precomputed in the snapshot.
+"""
+from app.federal import snapshot
+
+# Relations that can be expanded from each table: the parent (replacing the parent id) and the
+# children.
+RELATIONS = {
+    'country': {'provinces': 'province'},
+    'province': {'country': 'country', 'districts': 'district'},
+    'district': {'province': 'province', 'municipalities': 'municipality'},
+    'municipality': {'district': 'district'},
+}
+# Enough to walk the whole hierarchy in either direction; also bounds the work of paths going
+# back and forth, such as `province.districts.province`.
+MAX_EXPAND_DEPTH = 3
+# The name column of each locale, then the column a missing name falls back to.
+NAME_COLUMNS = {'en': ('title', 'title_ne'), 'ne': ('title_ne', 'title')}
+
+
+def parse_expand(name: str, value: str):
+    """
+    This function parses an `expand` parameter such as `country,districts.municipalities`.
+
+    :param name: The table the paths start from
+    :type name: str
+    :param value: Comma separated paths of dot separated relation names
+    :type value: str
+    :return: the relations to expand as a tree of nested dictionaries.
+    :raises ValueError: when a path is too deep or names a relation the table at that point does
+    not have.
+    """
+    tree = {}
+    for path in filter(None, (item.strip() for item in value.split(','))):
+        relations = path.split('.')
+        if len(relations) > MAX_EXPAND_DEPTH:
+            raise ValueError(f"{path!r} expands more than {MAX_EXPAND_DEPTH} levels")
+        node, table = tree, name
+        for relation in relations:
+            target = RELATIONS[table].get(relation)
+            if target is None:
+                allowed = ', '.join(RELATIONS[table])
+                raise ValueError(f"{table} has no relation {relation!r} to expand, expected one of: {allowed}")
+            node, table = node.setdefault(relation, {}), target
+    return tree
+
+
+def canonical_expand(tree: dict):
+    """
+    This function renders a parsed `expand` tree back into a stable string, for cache keys.
+    """
+    return ','.join(
+        f'{relation}.{canonical_expand(subtree)}' if subtree else relation
+        for relation, subtree in sorted(tree.items())
+    )
+
+
+def _node(current: snapshot.Snapshot, name: str, position: int, expand: dict, locale: str = None):
+    table = current[name]
+    row = _row(table, position, locale)
+    for relation, subtree in (expand or {}).items():
+        target = current[RELATIONS[name][relation]]
+        if relation == table.parent_table:
+            parent_position = target.position(row[relation]) if row[relation] is not None else -1
+            if parent_position >= 0:
+                row[relation] = _node(current, target.name, parent_position, subtree, locale)
+        else:
+            start, stop = table.child_range(position)
+            row[relation] = [_node(current, target.name, child, subtree, locale) for child in range(start, stop)]
+    return row
+
+
+def _row(table: snapshot.Table, position: int, locale: str = None):
+    row = {'id': table.ids[position]}
+    if locale is None:
+        row['title'] = table.string('title', position)
+        row['title_ne'] = table.string('title_ne', position)
+    else:
+        row['name'] = _name(table, position, locale)
+    row['code'] = table.string('code', position)
+    row['order'] = table.order_at(position)
+    if table.parent_table:
+        row[table.parent_table] = table.parent_at(position)
+    return row
+
+
+def _name(table: snapshot.Table, position: int, locale: str):
+    # A row missing the requested name falls back to the other language rather than to null.
+    columns = NAME_COLUMNS[locale]
+    name = table.string(columns[0], position)
+    return name if name is not None else table.string(columns[1], position)
+
+
+def get(name: str, id: int, expand: dict = None, locale: str = None):
+    """
+    This function returns one federal row as a dictionary.
+
+    :param name: The table, `country`, `province`, `district` or `municipality`
+    :type name: str
+    :param id: The id of the row
+    :type id: int
+    :param expand: Relations to nest into the row, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: `en` or `ne` to replace `title` and `title_ne` by a single `name`
+    :type locale: str
+    :return: the row, or `None` when the table has no row with that id.
+    """
+    current = snapshot.current()
+    position = current[name].position(id)
+    return _node(current, name, position, expand, locale) if position >= 0 else None
+
+
+def rows(name: str, expand: dict = None, locale: str = None):
+    """
+    This function returns every row of a federal table, ordered by id, with the relations in
+    `expand` nested into each row and the names in `locale` when it is given.
+    """
+    current = snapshot.current()
+    return [_node(current, name, position, expand, locale) for position in current[name].index if position >= 0]
+
+
+def batches(name: str, size: int, expand: dict = None, locale: str = None):
+    """
+    This function yields the rows of `rows` in lists of at most `size` rows, materializing one list
+    at a time. The snapshot is taken once, so a refresh while iterating does not mix versions.
+    """
+    current = snapshot.current()
+    batch = []
+    for position in current[name].index:
+        if position < 0:
+            continue
+        batch.append(_node(current, name, position, expand, locale))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def children(name: str, parent_id: int):
+    """
+    This function returns the rows of a federal table whose parent is `parent_id`, ordered by id.
+
+    :param name: The child table, `province`, `district` or `municipality`
+    :type name: str
+    :param parent_id: The id of the parent row in the parent table
+    :type parent_id: int
+    :return: the child rows, or `None` when the parent does not exist.
+    """
+    current = snapshot.current()
+    table = current[name]
+    parent = current[table.parent_table]
+    position = parent.position(parent_id)
+    if position < 0:
+        return None
+    start, stop = parent.child_range(position)
+    return [_row(table, child) for child in range(start, stop)]
+
+
+def regions(links, locale: str = None):
+    """
+    This function materializes `(table, id, depth)` links, as returned by the closure lookups, into
+    rows tagged with their `level` and `depth`. Links to rows the snapshot does not have are skipped.
+    """
+    current = snapshot.current()
+    result = []
+    for name, id, depth in links:
+        table = current[name]
+        position = table.position(id)
+        if position >= 0:
+            result.append({**_row(table, position, locale), 'level': name, 'depth': depth})
+    return result
+
+
+def hierarchy_error(**ids):
+    """
+    This function checks that federal ids given together, such as the location of a user, exist and
+    belong to each other.
+
+    Every check is an index read in the snapshot, so validating a full location costs no query
+    beyond the usual cache version poll.
+
+    :param ids: The ids by table name (`country`, `province`, `district`, `municipality`); `None`
+    values are skipped, and a row is checked against the nearest given ancestor
+    :return: a message describing the first problem found, or `None` when the ids are consistent.
+    """
+    current = snapshot.current()
+    names = [name for name, _, _, _ in snapshot.TABLES]
+    for name in names:
+        id = ids.get(name)
+        if id is not None and current[name].position(id) < 0:
+            return f"{name.capitalize()} with the id {id} is not found"
+    for level, name in enumerate(names):
+        id = ids.get(name)
+        if id is None:
+            continue
+        table, ancestor = current[name], id
+        for parent_name in reversed(names[:level]):
+            ancestor = table.parent_at(table.position(ancestor))
+            expected = ids.get(parent_name)
+            if expected is not None:
+                if ancestor != expected:
+                    return f"{name.capitalize()} with the id {id} does not belong to the {parent_name} with the id {expected}"
+                break
+            table = current[parent_name]
+            if ancestor is None or table.position(ancestor) < 0:
+                break
+    return None
+
+
+def get_many(name: str, ids, expand: dict = None, locale: str = None):
+    """
+    This function returns the rows of a federal table for a list of ids.
+
+    :param name: The table, `country`, `province`, `district` or `municipality`
+    :type name: str
+    :param ids: The ids to look up; repeated ids are returned once
+    :param expand: Relations to nest into each row, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: `en` or `ne` to replace `title` and `title_ne` by a single `name`
+    :type locale: str
+    :return: a dictionary with the found rows in the order their ids were requested, and the
+    requested ids that do not exist.
+    """
+    current = snapshot.current()
+    table = current[name]
+    results, missing, seen = [], [], set()
+    for id in ids:
+        if id in seen:
+            continue
+        seen.add(id)
+        position = table.position(id)
+        if position >= 0:
+            results.append(_node(current, name, position, expand, locale))
+        else:
+            missing.append(id)
+    return {'results': results, 'missing': missing}
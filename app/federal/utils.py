@@ -1,10 +1,149 @@
-from fastapi import HTTPException, status
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response, status
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
-from app.federal import models, schemas
+from app.core import cache, config, instrumentation, language
+from app.federal import changes, closure, models, schemas, store
+
+
+def parse_ids(value: str):
+    """
+    This function parses the comma separated `ids` query parameter of the federal collections.
 
+    :param value: The raw parameter, e.g. `1,2,3`
+    :type value: str
+    :return: the ids as a list of integers, in the order they were given.
+    """
+    try:
+        ids = [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be a comma separated list of integers"
+        )
+    if not ids or len(ids) > schemas.MAX_LOOKUP_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"ids must list between 1 and {schemas.MAX_LOOKUP_IDS} ids"
+        )
+    return ids
+
+def parse_expand(table: str, value):
+    """
+    This function parses the `expand` query parameter of the federal routes.
 
-def create_country(request: schemas.CountryCreate, db: Session):
+    :param table: The table the expanded paths start from
+    :type table: str
+    :param value: The raw parameter, e.g. `country,districts.municipalities`, or `None`
+    :type value: Optional[str]
+    :return: the relations to expand as a nested dictionary, empty when nothing is expanded.
+    """
+    if not value:
+        return {}
+    try:
+        return store.parse_expand(table, value)
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        )
+
+def get_language(request: Request, response: Response, lang: Optional[schemas.Language] = None):
+    """
+    This function is the dependency picking the language of the federal read routes.
+
+    The routes pass the result on as `locale`: with `en` or `ne`, every returned row has a single
+    localized `name` instead of `title` and `title_ne`.
+
+    :param request: The incoming request, whose `Accept-Language` is used when `lang` is not given
+    :type request: Request
+    :param response: The response of the route, which gets the `Vary` and `Content-Language` headers
+    :type response: Response
+    :param lang: `en` or `ne`, overriding the `Accept-Language` negotiation
+    :type lang: Optional[schemas.Language]
+    :return: `en`, `ne`, or `None` to return both titles as before.
+    """
+    locale = lang.value if lang is not None else language.negotiate(request.headers.get('accept-language', ''))
+    response.headers.update(language_headers(locale))
+    return locale
+
+def language_headers(locale: Optional[str]):
+    """
+    This function returns the headers of a response whose language was negotiated.
+    """
+    headers = {'vary': 'Accept-Language'}
+    if locale is not None:
+        headers['content-language'] = locale
+    return headers
+
+def list_key(route: str, expand: dict, locale: Optional[str]):
+    """
+    This function returns the key a federal list body is cached under, one per route, expansion and
+    language.
+    """
+    key = route
+    if expand:
+        key += f'?expand={store.canonical_expand(expand)}'
+    if locale is not None:
+        key += f'{"&" if expand else "?"}lang={locale}'
+    return key
+
+def _region_or_404(table: str, id: int):
+    if store.get(table, id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{table.capitalize()} with the id {id} is not found"
+        )
+
+def get_descendants(table: str, id: int, db: Session, level: str = None, locale: str = None):
+    """
+    This function returns every region inside a federal row, at any depth, with one closure table
+    lookup.
+
+    :param table: The level of the containing row, `country`, `province`, `district` or `municipality`
+    :type table: str
+    :param id: The id of the containing row
+    :type id: int
+    :param db: The database session used to read the closure table
+    :type db: Session
+    :param level: Only return regions of this level
+    :type level: str
+    :param locale: The language picked by `get_language`
+    :type locale: str
+    :return: the regions nearest first, each with its `level` and its `depth` below the row.
+    """
+    _region_or_404(table, id)
+    return store.regions(closure.descendants(table, id, db, level), locale)
+
+def get_ancestors(table: str, id: int, db: Session, locale: str = None):
+    """
+    This function returns the regions containing a federal row, nearest first, each with its
+    `level` and its `depth` above the row.
+    """
+    _region_or_404(table, id)
+    return store.regions(closure.ancestors(table, id, db), locale)
+
+def get_by_ids(table: str, ids, expand: dict = None, locale: str = None):
+    """
+    This function retrieves several rows of a federal table at once, from the in-memory snapshot.
+
+    :param table: The table, `country`, `province`, `district` or `municipality`
+    :type table: str
+    :param ids: The requested ids
+    :param expand: Relations to nest into each row, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
+    :return: a dictionary with `results` in request order and the `missing` ids.
+    """
+    return store.get_many(table, ids, expand, locale)
+
+# The create, update, patch and delete functions below take `commit`: by default they bump the
+# `federal` cache version and commit the change, while `run_batch` passes `False` to commit all of
+# its operations at once.
+def create_country(request: schemas.CountryCreate, db: Session, commit: bool = True):
     """
     The function creates a new country object in the database based on the input data.
     
@@ -25,23 +164,32 @@ def create_country(request: schemas.CountryCreate, db: Session):
         order = request.order
     )
     db.add(country)
-    db.commit()
-    db.refresh(country)
+    db.flush()
+    closure.add(country, db)
+    changes.record(country, changes.CREATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(country)
     return country
 
-def get_all_country(db: Session):
+def get_all_country(db: Session, expand: dict = None, locale: str = None):
     """
     This function retrieves all the country records from the database using SQLAlchemy's query method.
     
     :param db: Session
     :type db: Session
+    :param expand: Relations to nest into the result, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
     :return: The function `get_all` returns a list of all the `Country` objects in the database accessed
     through the provided `Session` object.
     """
-    country = db.query(models.Country).all()
+    country = store.rows('country', expand, locale)
     return country
 
-def get_country(id: int, db: Session):
+def get_country(id: int, db: Session, expand: dict = None, locale: str = None):
     """
     This function retrieves a country from a database based on its ID and raises an exception if the
     country is not found.
@@ -54,11 +202,15 @@ def get_country(id: int, db: Session):
     (Object-Relational Mapping) library such as SQLAlchemy. The session object is used to execute
     queries and commit changes to the
     :type db: Session
+    :param expand: Relations to nest into the result, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
     :return: a country object from the database with the specified id. If the country is not found, it
     raises an HTTPException with a 400 status code and a message indicating that the country with the
     specified id is not found.
     """
-    country = db.query(models.Country).filter(models.Country.id == id).first()
+    country = store.get('country', id, expand, locale)
     if not country:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -66,7 +218,7 @@ def get_country(id: int, db: Session):
         )
     return country
 
-def delete_country(id: int, db: Session):
+def delete_country(id: int, db: Session, commit: bool = True):
     """
     This function deletes a country from the database based on its ID.
     
@@ -86,13 +238,17 @@ def delete_country(id: int, db: Session):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Country with the id {id} is not found"
         )
+    closure.remove(country, db)
+    changes.record(country, changes.DELETE, db)
     db.delete(country)
-    db.commit()
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
     return {
         "message": "Country deleted successfully"
     }
 
-def update_country(id: int, request: schemas.UpdateCountry, db: Session):
+def update_country(id: int, request: schemas.UpdateCountry, db: Session, commit: bool = True):
     """
     This function updates a country in the database based on the provided ID and request data.
     
@@ -118,11 +274,14 @@ def update_country(id: int, request: schemas.UpdateCountry, db: Session):
     for field, value in request.dict(exclude_unset=True).items():
         setattr(country, field, value)
 
-    db.commit()
-    db.refresh(country)
+    changes.record(country, changes.UPDATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(country)
     return country
 
-def patch_country(id: int, request: schemas.UpdateCountry, db: Session):
+def patch_country(id: int, request: schemas.UpdateCountry, db: Session, commit: bool = True):
     """
     This function updates a country in the database based on the provided ID and request data.
     
@@ -153,12 +312,15 @@ def patch_country(id: int, request: schemas.UpdateCountry, db: Session):
     if request.order:
         country.order = request.order
 
-    db.commit()
-    db.refresh(country)
+    changes.record(country, changes.UPDATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(country)
     return country
 
 
-def create_province(request: schemas.ProvinceCreate, db: Session):
+def create_province(request: schemas.ProvinceCreate, db: Session, commit: bool = True):
     """
     This function creates a new province in the database with the given information and returns the
     created province.
@@ -189,12 +351,17 @@ def create_province(request: schemas.ProvinceCreate, db: Session):
         country = country.id
     )
     db.add(province)
-    db.commit()
-    db.refresh(province)
+    db.flush()
+    closure.add(province, db)
+    changes.record(province, changes.CREATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(province)
     return province
 
 
-def get_all_province(db: Session):
+def get_all_province(db: Session, expand: dict = None, locale: str = None):
     """
     This function retrieves all provinces from a database using SQLAlchemy.
     
@@ -203,12 +370,16 @@ def get_all_province(db: Session):
     database. The `Session` object represents a transactional scope for interacting with the database.
     It provides
     :type db: Session
+    :param expand: Relations to nest into the result, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
     :return: The function `get_all_province` returns a list of all the provinces in the database.
     """
-    province = db.query(models.Province).all()
+    province = store.rows('province', expand, locale)
     return province
 
-def get_province(id: int, db: Session):
+def get_province(id: int, db: Session, expand: dict = None, locale: str = None):
     """
     The function retrieves a province from a database based on its ID and raises an exception if it is
     not found.
@@ -219,11 +390,15 @@ def get_province(id: int, db: Session):
     database. It allows the function to execute queries and perform CRUD (Create, Read, Update, Delete)
     operations on the database
     :type db: Session
+    :param expand: Relations to nest into the result, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
     :return: The function `get_province` returns a `Province` object from the database that matches the
     given `id`. If no such object is found, it raises an HTTPException with a 404 status code and a
     message indicating that the province with the given id was not found.
     """
-    province = db.query(models.Province).filter(models.Province.id == id).first()
+    province = store.get('province', id, expand, locale)
     if province is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -231,7 +406,7 @@ def get_province(id: int, db: Session):
         )
     return province
 
-def delete_province(id: int, db: Session):
+def delete_province(id: int, db: Session, commit: bool = True):
     """
     This function deletes a province from the database based on its ID.
     
@@ -251,13 +426,17 @@ def delete_province(id: int, db: Session):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Province with the id {id} is not found"
         )
+    closure.remove(province, db)
+    changes.record(province, changes.DELETE, db)
     db.delete(province)
-    db.commit()
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
     return {
         "message": "Province deleted successfully"
     }
 
-def update_province(id: int, request: schemas.UpdateProvince, db: Session):
+def update_province(id: int, request: schemas.UpdateProvince, db: Session, commit: bool = True):
     """
     This function updates a province in the database based on the provided ID and request data.
     
@@ -282,14 +461,20 @@ def update_province(id: int, request: schemas.UpdateProvince, db: Session):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Province with the id {id} is not found"
         )
+    previous_parent = province.country
     for field, value in request.dict(exclude_unset=True).items():
         setattr(province, field, value)
 
-    db.commit()
-    db.refresh(province)
+    if province.country != previous_parent:
+        closure.move(province, db)
+    changes.record(province, changes.UPDATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(province)
     return province
 
-def patch_province(id: int, request: schemas.UpdateProvince, db: Session):
+def patch_province(id: int, request: schemas.UpdateProvince, db: Session, commit: bool = True):
     """
     This function updates a province in the database based on the provided ID and request data.
     
@@ -310,6 +495,7 @@ def patch_province(id: int, request: schemas.UpdateProvince, db: Session):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Province with the id {id} is not found"
         )
+    previous_parent = province.country
     if request.title:
         province.title = request.title
     if request.title_ne:
@@ -321,12 +507,17 @@ def patch_province(id: int, request: schemas.UpdateProvince, db: Session):
     if request.country:
         province.country = request.country
 
-    db.commit()
-    db.refresh(province)
+    if province.country != previous_parent:
+        closure.move(province, db)
+    changes.record(province, changes.UPDATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(province)
     return province
 
 
-def create_district(request: schemas.DistrictCreate, db: Session):
+def create_district(request: schemas.DistrictCreate, db: Session, commit: bool = True):
     """
     This function creates a new district object in the database based on the provided request data.
     
@@ -350,24 +541,33 @@ def create_district(request: schemas.DistrictCreate, db: Session):
         province = request.province
     )
     db.add(district)
-    db.commit()
-    db.refresh(district)
+    db.flush()
+    closure.add(district, db)
+    changes.record(district, changes.CREATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(district)
     return district
 
 
-def get_all_district(db: Session):
+def get_all_district(db: Session, expand: dict = None, locale: str = None):
     """
     This function retrieves all districts from a database using SQLAlchemy.
     
     :param db: Session object from SQLAlchemy. It is used to interact with the database and perform CRUD
     operations
     :type db: Session
+    :param expand: Relations to nest into the result, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
     :return: The function `get_all_district` returns a list of all the districts in the database.
     """
-    district = db.query(models.District).all()
+    district = store.rows('district', expand, locale)
     return district
 
-def get_district(id: int, db: Session):
+def get_district(id: int, db: Session, expand: dict = None, locale: str = None):
     """
     The function retrieves a district from a database based on its ID and raises an exception if it is
     not found.
@@ -378,11 +578,15 @@ def get_district(id: int, db: Session):
     database. It allows us to execute queries and perform CRUD (Create, Read, Update, Delete) operations
     on the database
     :type db: Session
+    :param expand: Relations to nest into the result, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
     :return: a district object from the database that matches the given id. If no district is found, it
     raises an HTTPException with a 404 status code and a message indicating that the district with the
     given id is not found.
     """
-    district = db.query(models.District).filter(models.District.id == id).first()
+    district = store.get('district', id, expand, locale)
     if district is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -390,7 +594,7 @@ def get_district(id: int, db: Session):
         )
     return district
 
-def delete_district(id: int, db: Session):
+def delete_district(id: int, db: Session, commit: bool = True):
     """
     This function deletes a district from the database based on its ID.
     
@@ -410,13 +614,17 @@ def delete_district(id: int, db: Session):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"District with the id {id} is not found"
         )
+    closure.remove(district, db)
+    changes.record(district, changes.DELETE, db)
     db.delete(district)
-    db.commit()
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
     return {
         "message": "District deleted successfully"
     }
 
-def update_district(id: int, request: schemas.UpdateDistrict, db: Session):
+def update_district(id: int, request: schemas.UpdateDistrict, db: Session, commit: bool = True):
     """
     This function updates a district in the database based on the provided ID and request data.
     
@@ -441,14 +649,20 @@ def update_district(id: int, request: schemas.UpdateDistrict, db: Session):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"District with the id {id} is not found"
         )
+    previous_parent = district.province
     for field, value in request.dict(exclude_unset=True).items():
         setattr(district, field, value)
 
-    db.commit()
-    db.refresh(district)
+    if district.province != previous_parent:
+        closure.move(district, db)
+    changes.record(district, changes.UPDATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(district)
     return district
 
-def patch_district(id: int, request: schemas.UpdateDistrict, db: Session):
+def patch_district(id: int, request: schemas.UpdateDistrict, db: Session, commit: bool = True):
     """
     This function updates a district in the database based on the provided request data.
     
@@ -470,6 +684,7 @@ def patch_district(id: int, request: schemas.UpdateDistrict, db: Session):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"District with the id {id} is not found"
         )
+    previous_parent = district.province
     if request.title:
         district.title = request.title
     if request.title_ne:
@@ -481,12 +696,17 @@ def patch_district(id: int, request: schemas.UpdateDistrict, db: Session):
     if request.province:
         district.province = request.province
 
-    db.commit()
-    db.refresh(district)
+    if district.province != previous_parent:
+        closure.move(district, db)
+    changes.record(district, changes.UPDATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(district)
     return district
 
 
-def create_municipality(request: schemas.MunicipalityCreate, db: Session):
+def create_municipality(request: schemas.MunicipalityCreate, db: Session, commit: bool = True):
     """
     The function creates a new municipality in the database based on the input provided in the request
     object.
@@ -510,24 +730,46 @@ def create_municipality(request: schemas.MunicipalityCreate, db: Session):
         district = request.district
     )
     db.add(municipality)
-    db.commit()
-    db.refresh(municipality)
+    db.flush()
+    closure.add(municipality, db)
+    changes.record(municipality, changes.CREATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(municipality)
     return municipality
 
 
-def get_all_municipality(db: Session):
+def get_all_municipality(db: Session, expand: dict = None, locale: str = None):
     """
     This function retrieves all municipalities from a database.
     
     :param db: Session
     :type db: Session
+    :param expand: Relations to nest into the result, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
     :return: The function `get_all_municipality` returns a list of all the municipalities in the
     database.
     """
-    municipality = db.query(models.Municipality).all()
+    municipality = store.rows('municipality', expand, locale)
     return municipality
 
-def get_municipality(id: int, db: Session):
+def stream_municipality(expand: dict = None, locale: str = None):
+    """
+    This function retrieves all municipalities in batches of `config.STREAM_BATCH_SIZE`, for the
+    streaming mode of the municipality list.
+
+    :param expand: Relations to nest into the result, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
+    :return: a generator of lists of municipalities, in the order of `get_all_municipality`.
+    """
+    return store.batches('municipality', config.STREAM_BATCH_SIZE, expand, locale)
+
+def get_municipality(id: int, db: Session, expand: dict = None, locale: str = None):
     """
     This function retrieves a municipality from a database based on its ID and raises an HTTPException
     if it is not found.
@@ -537,11 +779,15 @@ def get_municipality(id: int, db: Session):
     :param db: The "db" parameter is a SQLAlchemy session object that allows the function to interact
     with the database. It is used to query the database for the municipality with the specified ID
     :type db: Session
+    :param expand: Relations to nest into the result, as returned by `parse_expand`
+    :type expand: dict
+    :param locale: The language picked by `get_language`
+    :type locale: str
     :return: a municipality object from the database that matches the given id. If no municipality is
     found with the given id, it raises an HTTPException with a 404 status code and a message indicating
     that the municipality is not found.
     """
-    municipality = db.query(models.Municipality).filter(models.Municipality.id == id).first()
+    municipality = store.get('municipality', id, expand, locale)
     if municipality is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -549,7 +795,7 @@ def get_municipality(id: int, db: Session):
         )
     return municipality
 
-def delete_municipality(id: int, db: Session):
+def delete_municipality(id: int, db: Session, commit: bool = True):
     """
     This function deletes a municipality from the database based on its ID.
     
@@ -569,13 +815,17 @@ def delete_municipality(id: int, db: Session):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Municipality with the id {id} is not found"
         )
+    closure.remove(municipality, db)
+    changes.record(municipality, changes.DELETE, db)
     db.delete(municipality)
-    db.commit()
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
     return {
         "message": "Municipality deleted successfully"
     }
 
-def update_municipality(id: int, request: schemas.UpdateMunicipality, db: Session):
+def update_municipality(id: int, request: schemas.UpdateMunicipality, db: Session, commit: bool = True):
     """
     This function updates a municipality in the database based on the provided ID and request data.
     
@@ -598,14 +848,20 @@ def update_municipality(id: int, request: schemas.UpdateMunicipality, db: Sessio
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Municipality with the id {id} is not found"
         )
+    previous_parent = municipality.district
     for field, value in request.dict(exclude_unset=True).items():
         setattr(municipality, field, value)
 
-    db.commit()
-    db.refresh(municipality)
+    if municipality.district != previous_parent:
+        closure.move(municipality, db)
+    changes.record(municipality, changes.UPDATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(municipality)
     return municipality
 
-def patch_municipality(id: int, request: schemas.UpdateMunicipality, db: Session):
+def patch_municipality(id: int, request: schemas.UpdateMunicipality, db: Session, commit: bool = True):
     """
     This function updates a municipality in the database based on the provided ID and request data.
     
@@ -627,6 +883,7 @@ def patch_municipality(id: int, request: schemas.UpdateMunicipality, db: Session
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Municipality with the id {id} is not found"
         )
+    previous_parent = municipality.district
     if request.title:
         municipality.title = request.title
     if request.title_ne:
@@ -638,6 +895,158 @@ def patch_municipality(id: int, request: schemas.UpdateMunicipality, db: Session
     if request.district:
         municipality.district = request.district
 
+    if municipality.district != previous_parent:
+        closure.move(municipality, db)
+    changes.record(municipality, changes.UPDATE, db)
+    if commit:
+        cache.bump('federal', db)
+        db.commit()
+        db.refresh(municipality)
+    return municipality
+
+
+# The write function and request schema of every batch operation.
+BATCH_WRITERS = {
+    ('create', 'country'): (create_country, schemas.CountryCreate),
+    ('update', 'country'): (update_country, schemas.UpdateCountry),
+    ('patch', 'country'): (patch_country, schemas.UpdateCountry),
+    ('delete', 'country'): (delete_country, None),
+    ('create', 'province'): (create_province, schemas.ProvinceCreate),
+    ('update', 'province'): (update_province, schemas.UpdateProvince),
+    ('patch', 'province'): (patch_province, schemas.UpdateProvince),
+    ('delete', 'province'): (delete_province, None),
+    ('create', 'district'): (create_district, schemas.DistrictCreate),
+    ('update', 'district'): (update_district, schemas.UpdateDistrict),
+    ('patch', 'district'): (patch_district, schemas.UpdateDistrict),
+    ('delete', 'district'): (delete_district, None),
+    ('create', 'municipality'): (create_municipality, schemas.MunicipalityCreate),
+    ('update', 'municipality'): (update_municipality, schemas.UpdateMunicipality),
+    ('patch', 'municipality'): (patch_municipality, schemas.UpdateMunicipality),
+    ('delete', 'municipality'): (delete_municipality, None),
+}
+
+BATCH_MODELS = {
+    'country': models.Country,
+    'province': models.Province,
+    'district': models.District,
+    'municipality': models.Municipality,
+}
+
+def _existing_parent(value, table: str, refs: dict, db: Session):
+    # Parents may have been created or deleted earlier in the batch, so they are checked in the
+    # session rather than in the snapshot.
+    id = _resolve(value, table, refs)
+    parent = db.get(BATCH_MODELS[table], id)
+    if parent is None or parent in db.deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{table.capitalize()} with the id {id} is not found"
+        )
+    return id
+
+def _resolve(value, table: str, refs: dict):
+    if not isinstance(value, str):
+        return value
+    if value not in refs:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{value!r} is not the ref of a row created earlier in the batch and not deleted since"
+        )
+    ref_table, id = refs[value]
+    if ref_table != table:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{value!r} refers to a {ref_table}, expected a {table}"
+        )
+    return id
+
+# Statements one batch operation may issue, including the lookup of its parent: the budget of its
+# single route without the cache bump, which the batch issues once. Updates and patches that move
+# a row to another parent issue the most.
+BATCH_BUDGETS = {
+    'create': 5,
+    'update': 6,
+    'patch': 6,
+    'delete': 5,
+}
+
+def _run_operation(operation: schemas.BatchOperation, refs: dict, db: Session):
+    table = operation.table.value
+    writer, schema = BATCH_WRITERS[(operation.op.value, table)]
+    data = dict(operation.data)
+    parent = closure.PARENTS.get(table)
+    if data.get(parent) is not None:
+        data[parent] = _existing_parent(data[parent], parent, refs, db)
+
+    if operation.op is schemas.BatchOp.create:
+        if operation.id is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="create operations take a ref, not an id"
+            )
+        if operation.ref is not None and operation.ref in refs:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"the ref {operation.ref!r} is already used in the batch"
+            )
+        id = writer(schema.parse_obj(data), db, commit=False).id
+        if operation.ref is not None:
+            refs[operation.ref] = (table, id)
+        return id
+
+    if operation.id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{operation.op.value} operations need the id of the row"
+        )
+    id = _resolve(operation.id, table, refs)
+    if schema is None:
+        writer(id, db, commit=False)
+        # The row is gone, so later operations can no longer use its ref.
+        for ref in [ref for ref, target in refs.items() if target == (table, id)]:
+            del refs[ref]
+    else:
+        writer(id, schema.parse_obj(data), db, commit=False)
+    return id
+
+def run_batch(request: schemas.BatchRequest, db: Session):
+    """
+    This function applies an ordered list of federal creates, updates, patches and deletes in one
+    transaction.
+
+    Each operation goes through the same write function as its single route, so the closure table
+    and the change log are maintained as usual, but nothing is committed until every operation has
+    succeeded and the cache version is bumped once for the whole batch.
+
+    :param request: The operations, in the order they are applied. A create may name a `ref` which
+    later operations use in place of the row's id, including as a parent id
+    :type request: schemas.BatchRequest
+    :param db: The database session the whole batch runs in
+    :type db: Session
+    :return: the id of the row each operation wrote, in order. When an operation fails nothing is
+    written and the error names the index of that operation.
+    """
+    refs, results = {}, []
+    for index, operation in enumerate(request.operations):
+        label = f'/federal/batch/ operation {index} ({operation.op.value} {operation.table.value})'
+        try:
+            with instrumentation.budget_scope(BATCH_BUDGETS[operation.op.value], label):
+                id = _run_operation(operation, refs, db)
+                # Flushed here so the operation's pending writes count against its own budget.
+                db.flush()
+        except HTTPException as exc:
+            db.rollback()
+            raise HTTPException(
+                status_code=exc.status_code,
+                detail={'operation': index, 'detail': exc.detail}
+            )
+        except ValidationError as exc:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail={'operation': index, 'detail': exc.errors()}
+            )
+        results.append({'op': operation.op, 'table': operation.table, 'id': id, 'ref': operation.ref})
+    cache.bump('federal', db)
     db.commit()
-    db.refresh(municipality)
-    return municipality
\ No newline at end of file
+    return {'results': results}
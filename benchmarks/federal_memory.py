@@ -0,0 +1,127 @@
+"""
+Memory footprint of the federal tables held as ORM instances versus the columnar snapshot.
+
+For every multiplier of the federal hierarchy a database is generated and each representation is
+measured in a fresh process: the Python heap growth reported by tracemalloc, the resident set
+growth, and the mean time of a lookup by id that returns the row.
+
+    python -m benchmarks.federal_memory --multipliers 1,10,100
+"""
+import argparse
+import json
+import mmap
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+LOOKUPS = 100_000
+
+
+def _rss_kb():
+    with open('/proc/self/statm') as handle:
+        return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def _measure(load, lookup, ids):
+    rss = _rss_kb()
+    tracemalloc.start()
+    held = load()
+    heap, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss = _rss_kb() - rss
+    started = time.perf_counter()
+    for index in range(LOOKUPS):
+        lookup(held, ids[index % len(ids)])
+    lookup_ns = (time.perf_counter() - started) / LOOKUPS * 1e9
+    return {'heap_kb': heap // 1024, 'rss_kb': rss, 'lookup_ns': round(lookup_ns)}
+
+
+def worker_main(mode: str, path: str):
+    sys.path.insert(0, str(ROOT))
+    from sqlalchemy import select
+
+    from app.account import database
+    from app.federal import models, snapshot, store
+
+    with database.SessionLocal() as db:
+        ids = list(db.scalars(select(models.Municipality.id)))
+        if mode == 'build':
+            snapshot.write(path, db, 0)
+            return {'file_kb': os.path.getsize(path) // 1024}
+        if mode == 'orm':
+            def load():
+                return [db.query(model).all() for model in (models.Country, models.Province, models.District, models.Municipality)]
+
+            def lookup(held, id):
+                row = db.get(models.Municipality, id)
+                return row.title, row.title_ne, row.code, row.order, row.district
+
+            return _measure(load, lookup, ids)
+
+    def load():
+        current = snapshot.Snapshot(path)
+        # Touch one byte per page so the measured resident set includes the whole mapping.
+        sum(memoryview(current.mapping)[::mmap.PAGESIZE])
+        return current
+
+    def lookup(held, id):
+        table = held['municipality']
+        return store._row(table, table.position(id))
+
+    return _measure(load, lookup, ids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--multipliers', default='1,10,100')
+    parser.add_argument('--output', default=None, help='also write the results as JSON to this file')
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--path', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        json.dump(worker_main(args.worker, args.path), sys.stdout)
+        return 0
+
+    from sqlalchemy import create_engine
+
+    from app.core import datagen
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for multiplier in map(int, args.multipliers.split(',')):
+            url = f"sqlite:///{Path(directory) / f'federal-{multiplier}.db'}"
+            engine = create_engine(url)
+            counts = datagen.generate(engine, users=0, multiplier=multiplier)
+            engine.dispose()
+            rows = sum(counts[table] for table in ('country', 'province', 'district', 'municipality'))
+            path = str(Path(directory) / f'federal-{multiplier}.snapshot')
+            result = {'multiplier': multiplier, 'rows': rows}
+            for mode in ('build', 'orm', 'store'):
+                completed = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.federal_memory', '--worker', mode, '--path', path],
+                    cwd=ROOT, env={**os.environ, 'DATABASE_URL': url, 'REQUEST_LOG': '0'},
+                    stdout=subprocess.PIPE, check=True,
+                )
+                result[mode] = json.loads(completed.stdout)
+            results.append(result)
+            print(
+                f"x{multiplier:<4} {rows:>7} rows  "
+                f"orm heap {result['orm']['heap_kb']:>8} KB rss {result['orm']['rss_kb']:>8} KB "
+                f"lookup {result['orm']['lookup_ns']:>6} ns  |  "
+                f"store heap {result['store']['heap_kb']:>6} KB rss {result['store']['rss_kb']:>6} KB "
+                f"(file {result['build']['file_kb']} KB, shared) lookup {result['store']['lookup_ns']:>6} ns"
+            )
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,502 @@
+"""
+HTTP benchmark suite for every route of the federal and account routers.
+
+Each data size gets its own generated SQLite database and its own worker process, so the app's
+engine binds to it through DATABASE_URL and the peak RSS reported is the one of that size only.
+
+    python -m benchmarks.http_bench run --sizes 1000,100000 --concurrency 1,8,32 --output bench.json
+    python -m benchmarks.http_bench run --server ...       # against a real uvicorn process
+    python -m benchmarks.http_bench compare bench.json baseline.json --threshold 0.1
+
+Requires httpx from requirements-dev.txt: pip install -r requirements-dev.txt
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+# Ids per request of the batch get-by-ids scenarios.
+BATCH_IDS = 50
+FEDERAL_LEVELS = (
+    # (singular, plural, parent field, parent table)
+    ('country', 'countries', None, None),
+    ('province', 'provinces', 'country', 'country'),
+    ('district', 'districts', 'province', 'province'),
+    ('municipality', 'municipalities', 'district', 'district'),
+)
+
+
+@dataclass
+class Scenario:
+    name: str
+    kind: str
+    method: str
+    route: str
+    build: Callable[['Context', int], tuple]
+
+
+class Context:
+    """
+    Row counts of the generated database plus the ids created by the write scenarios, which the
+    update and delete scenarios of the same run then consume.
+    """
+
+    def __init__(self, counts: dict, seed: int):
+        self.counts = counts
+        self.rnd = random.Random(seed)
+        self.created = {}
+        self.sequence = 0
+        self.emails = []
+
+    def existing_id(self, table: str):
+        return self.rnd.randint(1, max(self.counts.get(table, 1), 1))
+
+    def next_sequence(self):
+        self.sequence += 1
+        return self.sequence
+
+
+def _federal_payload(context: Context, singular: str, parent_table: Optional[str], parent_field: Optional[str]):
+    number = context.next_sequence()
+    payload = {'title': f'Bench {singular} {number}', 'title_ne': f'बेन्च {number}', 'code': f'B{number}', 'order': number}
+    if parent_field:
+        payload[parent_field] = context.existing_id(parent_table)
+    return payload
+
+
+def _created_id(context: Context, singular: str, fallback_table: str):
+    created = context.created.get(singular)
+    if created:
+        return created.pop()
+    return context.existing_id(fallback_table)
+
+
+def federal_scenarios():
+    scenarios = []
+    for singular, plural, parent_field, parent_table in FEDERAL_LEVELS:
+        def create(context, i, singular=singular, parent_table=parent_table, parent_field=parent_field):
+            return f'/federal/{singular}/', {'json': _federal_payload(context, singular, parent_table, parent_field)}
+
+        def list_all(context, i, plural=plural):
+            return f'/federal/{plural}/', {}
+
+        def list_localized(context, i, plural=plural):
+            return f'/federal/{plural}/', {'headers': {'accept-language': ('en', 'ne')[i % 2]}}
+
+        def get_one(context, i, singular=singular):
+            return f'/federal/{singular}/{context.existing_id(singular)}/', {}
+
+        def get_many(context, i, singular=singular, plural=plural):
+            ids = ','.join(str(context.existing_id(singular)) for _ in range(BATCH_IDS))
+            return f'/federal/{plural}/?ids={ids}', {}
+
+        def lookup(context, i, singular=singular, plural=plural):
+            return f'/federal/{plural}/lookup/', {'json': {'ids': [context.existing_id(singular) for _ in range(BATCH_IDS)]}}
+
+        def put(context, i, singular=singular, parent_table=parent_table, parent_field=parent_field):
+            payload = _federal_payload(context, singular, parent_table, parent_field)
+            return f'/federal/{singular}/{context.existing_id(singular)}/', {'json': payload}
+
+        def patch(context, i, singular=singular):
+            return f'/federal/{singular}/{context.existing_id(singular)}/', {'json': {'order': context.next_sequence()}}
+
+        def delete(context, i, singular=singular):
+            return f'/federal/{singular}/{_created_id(context, singular, singular)}/', {}
+
+        scenarios += [
+            Scenario(f'create_{singular}', 'write', 'POST', f'/federal/{singular}/', create),
+            Scenario(f'get_all_{singular}', 'read', 'GET', f'/federal/{plural}/', list_all),
+            Scenario(f'get_all_localized_{singular}', 'read', 'GET', f'/federal/{plural}/?lang=', list_localized),
+            Scenario(f'get_{singular}', 'read', 'GET', f'/federal/{singular}/{{id}}/', get_one),
+            Scenario(f'get_many_{singular}', 'read', 'GET', f'/federal/{plural}/?ids=', get_many),
+            Scenario(f'lookup_{singular}', 'read', 'POST', f'/federal/{plural}/lookup/', lookup),
+            Scenario(f'update_{singular}', 'write', 'PUT', f'/federal/{singular}/{{id}}/', put),
+            Scenario(f'patch_{singular}', 'write', 'PATCH', f'/federal/{singular}/{{id}}/', patch),
+            Scenario(f'delete_{singular}', 'write', 'DELETE', f'/federal/{singular}/{{id}}/', delete),
+        ]
+
+    def list_streamed(context, i):
+        return '/federal/municipalities/?stream=true', {}
+
+    scenarios.append(
+        Scenario('get_all_streamed_municipality', 'read', 'GET', '/federal/municipalities/?stream=true', list_streamed)
+    )
+    return scenarios
+
+
+def account_scenarios():
+    def create(context, i):
+        number = context.next_sequence()
+        return '/account/', {'json': {
+            'first_name': 'Bench',
+            'last_name': f'User{number}',
+            'dob': '2000-01-01',
+            'email': f'bench.{number}.{os.getpid()}@example.com',
+            'role': 'Student',
+            'gender': 'Female',
+            'contact': f'+97798{number % 10 ** 8:08d}',
+            'country': 1,
+            'province': context.existing_id('province'),
+        }}
+
+    def list_all(context, i):
+        return '/account/', {}
+
+    def list_streamed(context, i):
+        return '/account/?stream=true', {}
+
+    def stats(context, i):
+        return '/account/stats/', {}
+
+    def get_one(context, i):
+        return f'/account/{context.existing_id("users")}/', {}
+
+    def login(context, i):
+        email = context.rnd.choice(context.emails) if context.emails else 'missing@example.com'
+        return '/account/login/', {'data': {'username': email, 'password': 'secret'}}
+
+    return [
+        Scenario('create_user', 'write', 'POST', '/account/', create),
+        Scenario('get_users', 'read', 'GET', '/account/', list_all),
+        Scenario('get_users_streamed', 'read', 'GET', '/account/?stream=true', list_streamed),
+        Scenario('get_stats', 'read', 'GET', '/account/stats/', stats),
+        Scenario('get_user', 'read', 'GET', '/account/{id}/', get_one),
+        Scenario('login', 'auth', 'POST', '/account/login/', login),
+    ]
+
+
+def all_scenarios():
+    """
+    Returns the scenarios in execution order: creates first so that deletes can consume the rows
+    they created, then reads, updates and finally deletes.
+    """
+    order = {'create': 0, 'get': 1, 'lookup': 1, 'login': 1, 'update': 2, 'patch': 2, 'delete': 3}
+    scenarios = federal_scenarios() + account_scenarios()
+    return sorted(scenarios, key=lambda scenario: order[scenario.name.split('_')[0]])
+
+
+def percentile(sorted_values, fraction: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_kb(pid: Optional[int] = None):
+    """
+    Returns the peak resident set size in KiB of this process, or of `pid` when it is given.
+    """
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, context: Context, requests: int, concurrency: int):
+    latencies = []
+    status_codes = {}
+    errors = 0
+    iterations = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in iterations:
+            path, kwargs = scenario.build(context, i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, path, **kwargs)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+            if response.status_code >= 500:
+                errors += 1
+            elif scenario.name.startswith('create_') and response.status_code < 300:
+                created_id = response.json().get('id')
+                if created_id is not None:
+                    context.created.setdefault(scenario.name[len('create_'):], []).append(created_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'scenario': scenario.name,
+        'kind': scenario.kind,
+        'method': scenario.method,
+        'route': scenario.route,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': errors,
+        # Latencies of a scenario with errors measure the error path, not the route.
+        'failed': errors > 0,
+        'status_codes': {str(code): count for code, count in sorted(status_codes.items())},
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_server(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get('/docs')
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f'uvicorn did not start on {base_url}')
+
+
+def _sample_emails(database_url: str, limit: int = 200):
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as connection:
+            return list(connection.scalars(text('SELECT email FROM users ORDER BY id LIMIT :limit'), {'limit': limit}))
+    finally:
+        engine.dispose()
+
+
+async def run_size(args, counts: dict):
+    """
+    Runs every selected scenario at every concurrency level against the database named by the
+    DATABASE_URL environment variable. Runs inside the per-size worker process.
+    """
+    server = None
+    if args.server:
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning',
+             '--workers', str(args.workers)],
+            cwd=ROOT,
+        )
+        base_url = f'http://127.0.0.1:{port}'
+        await _wait_for_server(base_url)
+        client = httpx.AsyncClient(base_url=base_url, timeout=60)
+    else:
+        sys.path.insert(0, str(ROOT))
+        import main
+        await main.app.router.startup()
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        client = httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=60)
+
+    scenarios = [
+        scenario for scenario in all_scenarios()
+        if not args.scenarios or scenario.name in args.scenarios
+    ]
+    # One context per size: its sequence keeps generated emails and codes unique across the
+    # concurrency levels, and its created ids carry over to the later delete scenarios.
+    context = Context(counts, args.seed)
+    context.emails = _sample_emails(os.environ['DATABASE_URL'])
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            for scenario in scenarios:
+                result = await run_scenario(client, scenario, context, args.requests, concurrency)
+                result['peak_rss_kb'] = peak_rss_kb(server.pid if server else None)
+                results.append(result)
+                if result['failed']:
+                    print(
+                        f"  c={concurrency:<3} {scenario.name:<24} FAILED errors={result['errors']}/{args.requests} "
+                        f"status={result['status_codes']}",
+                        file=sys.stderr,
+                    )
+                    continue
+                print(
+                    f"  c={concurrency:<3} {scenario.name:<24} {result['throughput_rps']:>9} req/s "
+                    f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms",
+                    file=sys.stderr,
+                )
+    finally:
+        await client.aclose()
+        if server:
+            server.terminate()
+            server.wait()
+        else:
+            await main.app.router.shutdown()
+    return results
+
+
+def worker_main(args):
+    counts = json.loads(args.counts)
+    results = asyncio.run(run_size(args, counts))
+    json.dump(results, sys.stdout)
+
+
+def run_main(args):
+    from sqlalchemy import create_engine
+
+    from app.core import datagen
+
+    output = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'mode': 'uvicorn' if args.server else 'asgi',
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'multiplier': args.multiplier,
+            'seed': args.seed,
+        },
+        'results': [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            path = Path(directory) / f'bench-{size}.db'
+            url = f'sqlite:///{path}'
+            print(f'generating {size} users', file=sys.stderr)
+            engine = create_engine(url)
+            counts = datagen.generate(engine, users=size, multiplier=args.multiplier, seed=args.seed)
+            engine.dispose()
+            counts['users'] = size
+            command = [
+                sys.executable, '-m', 'benchmarks.http_bench', 'worker',
+                '--counts', json.dumps(counts),
+                '--requests', str(args.requests),
+                '--concurrency', ','.join(map(str, args.concurrency)),
+                '--seed', str(args.seed),
+                '--workers', str(args.workers),
+            ]
+            if args.server:
+                command.append('--server')
+            if args.scenarios:
+                command += ['--scenarios', ','.join(args.scenarios)]
+            completed = subprocess.run(
+                command, cwd=ROOT, env={**os.environ, 'DATABASE_URL': url},
+                stdout=subprocess.PIPE, check=True,
+            )
+            for result in json.loads(completed.stdout):
+                output['results'].append({'size': size, **result})
+
+    with open(args.output, 'w') as handle:
+        json.dump(output, handle, indent=2)
+    print(f"wrote {len(output['results'])} results to {args.output}", file=sys.stderr)
+    failed = [result for result in output['results'] if result['failed']]
+    for result in failed:
+        print(
+            f"FAILED size={result['size']} c={result['concurrency']} {result['scenario']}: "
+            f"{result['errors']} errors, status {result['status_codes']}",
+            file=sys.stderr,
+        )
+    return 1 if failed else 0
+
+
+def compare_main(args):
+    """
+    Flags every (size, concurrency, scenario) whose p95 latency grew, or whose throughput dropped,
+    by more than the threshold relative to the baseline, and every scenario of the current run that
+    had errors.
+    """
+    with open(args.current) as handle:
+        current = json.load(handle)
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+
+    def key(result):
+        return result['size'], result['concurrency'], result['scenario']
+
+    baseline_results = {key(result): result for result in baseline['results']}
+    regressions = []
+    failures = []
+    for result in current['results']:
+        if result.get('failed'):
+            failures.append(key(result))
+            continue
+        previous = baseline_results.get(key(result))
+        if previous is None:
+            continue
+        for metric, worse_when_higher in (('p95_ms', True), ('p99_ms', True), ('throughput_rps', False)):
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change if worse_when_higher else -change) > args.threshold:
+                regressions.append((key(result), metric, old, new, change))
+
+    for (size, concurrency, scenario), metric, old, new, change in regressions:
+        print(f"REGRESSION size={size} c={concurrency} {scenario} {metric}: {old} -> {new} ({change:+.1%})")
+    for size, concurrency, scenario in failures:
+        print(f"FAILED size={size} c={concurrency} {scenario}: the scenario had errors")
+    if regressions or failures:
+        return 1
+    print(f"no regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+def _int_list(value: str):
+    return [int(item) for item in value.split(',') if item]
+
+
+def _str_list(value: str):
+    return [item for item in value.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_run_options(command):
+        command.add_argument('--requests', type=int, default=200, help='requests per scenario and concurrency level')
+        command.add_argument('--concurrency', type=_int_list, default=[1, 8, 32])
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--server', action='store_true', help='benchmark a real uvicorn process')
+        command.add_argument('--workers', type=int, default=1, help='uvicorn workers in --server mode')
+        command.add_argument('--scenarios', type=_str_list, default=None, help='only run these scenarios')
+
+    run = commands.add_parser('run', help='run the benchmark suite')
+    add_run_options(run)
+    run.add_argument('--sizes', type=_int_list, default=[1000, 100_000], help='user counts to benchmark')
+    run.add_argument('--multiplier', type=int, default=1, help='copies of the federal hierarchy')
+    run.add_argument('--output', default='bench_results.json')
+
+    worker = commands.add_parser('worker', help=argparse.SUPPRESS)
+    add_run_options(worker)
+    worker.add_argument('--counts', required=True)
+
+    compare = commands.add_parser('compare', help='compare results against a baseline')
+    compare.add_argument('current')
+    compare.add_argument('baseline')
+    compare.add_argument('--threshold', type=float, default=0.10, help='allowed relative regression')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return run_main(args)
+    if args.command == 'worker':
+        return worker_main(args)
+    return compare_main(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+Replay of captured request traces against the app, reporting latency distributions per route.
+
+The traces are the JSON lines written by `app.core.capture` with CAPTURE_FILE set. Requests are
+sent open-loop at their recorded arrival times divided by `--speed`, so the replay keeps the
+production mix and burstiness; `--speed 0` sends them as fast as `--max-in-flight` allows.
+Redacted values are replaced by synthetic ones of the same type, unique per request so that
+replayed account creations do not collide. Writes are replayed too: point DATABASE_URL (or the
+server) at a copy of the database.
+
+    CAPTURE_FILE=traffic.jsonl uvicorn main:app                 # capture
+    DATABASE_URL=sqlite:////tmp/copy.db python -m benchmarks.replay traffic.jsonl --speed 2
+    python -m benchmarks.replay traffic.jsonl --server          # against a local uvicorn process
+    python -m benchmarks.replay traffic.jsonl --url http://127.0.0.1:8000 --output replay.json
+
+Requires httpx from requirements-dev.txt: pip install -r requirements-dev.txt
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.http_bench import ROOT, _free_port, _wait_for_server, percentile
+
+REDACTED = '$redacted'
+# Synthetic values of redacted fields; emails get the request number to stay unique.
+SYNTHETIC = {
+    'password': 'password',
+    'dob': '1990-01-01',
+    'contact': '+9779800000000',
+}
+
+
+def load(path: str, limit: int = None):
+    """
+    Reads the traces of a capture file, skipping lines that are not traces, in arrival order.
+    """
+    traces = []
+    with open(path, encoding='utf-8') as lines:
+        for line in lines:
+            try:
+                trace = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(trace, dict) and 'method' in trace and 'path' in trace:
+                traces.append(trace)
+    traces.sort(key=lambda trace: trace.get('t', 0))
+    return traces[:limit] if limit else traces
+
+
+def fill(value, serial: int, key: str = None):
+    """
+    Returns `value` with its redaction markers replaced by synthetic values for request `serial`.
+    """
+    if isinstance(value, dict):
+        if REDACTED in value:
+            if value[REDACTED] != 'str':
+                return 0
+            if key in ('email', 'username'):
+                return f'replay-{serial}@example.com'
+            return SYNTHETIC.get(key, 'x' * max(1, value.get('length', 1)))
+        return {name: fill(item, serial, name) for name, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, serial, key) for item in value]
+    return value
+
+
+def build_request(trace: dict, serial: int):
+    """
+    Returns the method, path and httpx keyword arguments replaying one trace.
+    """
+    headers = dict(trace.get('headers') or {})
+    kwargs = {'params': [tuple(pair) for pair in fill(trace.get('query') or [], serial)], 'headers': headers}
+    body = trace.get('body') or {}
+    if 'json' in body:
+        kwargs['json'] = fill(body['json'], serial)
+    elif 'form' in body:
+        kwargs['data'] = dict(fill(pair, serial, pair[0]) for pair in body['form'])
+    elif body.get('bytes'):
+        kwargs['content'] = b'x' * body['bytes']
+    return trace['method'], trace['path'], kwargs
+
+
+async def replay(client: httpx.AsyncClient, traces: list, speed: float, max_in_flight: int):
+    """
+    Sends every trace at its recorded offset divided by `speed` and returns one result per trace.
+    """
+    slots = asyncio.Semaphore(max_in_flight)
+    results = [None] * len(traces)
+    first = traces[0].get('t', 0) if traces else 0
+
+    async def send(index: int, trace: dict, due: float):
+        method, path, kwargs = build_request(trace, index)
+        async with slots:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status_code = response.status_code
+            except httpx.HTTPError:
+                status_code = None
+            results[index] = {
+                'status': status_code,
+                'latency': time.perf_counter() - started,
+                'lag': started - due,
+            }
+
+    tasks = []
+    origin = time.perf_counter()
+    for index, trace in enumerate(traces):
+        due = origin + ((trace.get('t', first) - first) / speed if speed else 0)
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(index, trace, due)))
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - origin
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def report(traces: list, results: list):
+    """
+    Groups the replayed requests per method and route template with their latency percentiles next
+    to the recorded ones.
+    """
+    groups = {}
+    for trace, result in zip(traces, results):
+        group = groups.setdefault((trace['method'], trace.get('route') or trace['path']), {
+            'latencies': [], 'recorded': [], 'lags': [], 'status_codes': {}, 'errors': 0, 'status_changed': 0,
+        })
+        status_code = result['status']
+        group['latencies'].append(result['latency'])
+        group['lags'].append(max(0.0, result['lag']))
+        if trace.get('duration_ms') is not None:
+            group['recorded'].append(trace['duration_ms'] / 1000)
+        group['status_codes'][str(status_code)] = group['status_codes'].get(str(status_code), 0) + 1
+        if status_code is None or status_code >= 500:
+            group['errors'] += 1
+        if status_code != trace.get('status'):
+            group['status_changed'] += 1
+
+    rows = []
+    for (method, route), group in sorted(groups.items(), key=lambda item: -len(item[1]['latencies'])):
+        latencies, recorded, lags = sorted(group['latencies']), sorted(group['recorded']), sorted(group['lags'])
+        rows.append({
+            'method': method,
+            'route': route,
+            'requests': len(latencies),
+            'errors': group['errors'],
+            'status_codes': dict(sorted(group['status_codes'].items())),
+            'status_changed': group['status_changed'],
+            'p50_ms': _ms(percentile(latencies, 0.50)),
+            'p95_ms': _ms(percentile(latencies, 0.95)),
+            'p99_ms': _ms(percentile(latencies, 0.99)),
+            'max_ms': _ms(latencies[-1]),
+            'recorded_p50_ms': _ms(percentile(recorded, 0.50)),
+            'recorded_p95_ms': _ms(percentile(recorded, 0.95)),
+            'lag_p95_ms': _ms(percentile(lags, 0.95)),
+        })
+    return rows
+
+
+async def run(args):
+    traces = load(args.traces, args.limit)
+    if not traces:
+        raise SystemExit(f'no traces in {args.traces}')
+    server = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    elif args.server:
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning',
+             '--workers', str(args.workers)],
+            cwd=ROOT,
+        )
+        base_url = f'http://127.0.0.1:{port}'
+        await _wait_for_server(base_url)
+        client = httpx.AsyncClient(base_url=base_url, timeout=60)
+    else:
+        sys.path.insert(0, str(ROOT))
+        import main
+        await main.app.router.startup()
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        client = httpx.AsyncClient(transport=transport, base_url='http://replay', timeout=60)
+
+    try:
+        results, elapsed = await replay(client, traces, args.speed, args.max_in_flight)
+    finally:
+        await client.aclose()
+        if server:
+            server.terminate()
+            server.wait()
+        elif not args.url:
+            await main.app.router.shutdown()
+    recorded = traces[-1].get('t', 0) - traces[0].get('t', 0)
+    return {
+        'traces': args.traces,
+        'requests': len(traces),
+        'speed': args.speed,
+        'recorded_s': round(recorded, 3),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(traces) / elapsed, 2) if elapsed else None,
+        'routes': report(traces, results),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('traces', help='JSON lines file written with CAPTURE_FILE')
+    parser.add_argument('--speed', type=float, default=1.0, help='rate multiplier, 0 sends as fast as possible')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='requests outstanding at once')
+    parser.add_argument('--limit', type=int, default=None, help='only replay the first traces')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--server', action='store_true', help='replay against a fresh uvicorn process')
+    target.add_argument('--url', default=None, help='replay against an already running server')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers in --server mode')
+    parser.add_argument('--output', default=None, help='write the report as JSON')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print(
+        f"{result['requests']} requests recorded over {result['recorded_s']}s replayed in "
+        f"{result['elapsed_s']}s ({result['throughput_rps']} req/s)",
+        file=sys.stderr,
+    )
+    for row in result['routes']:
+        print(
+            f"  {row['method']:<6} {row['route']:<40} n={row['requests']:<6} p50={row['p50_ms']}ms "
+            f"p95={row['p95_ms']}ms p99={row['p99_ms']}ms (recorded p50={row['recorded_p50_ms']}ms "
+            f"p95={row['recorded_p95_ms']}ms) errors={row['errors']} status_changed={row['status_changed']}",
+            file=sys.stderr,
+        )
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 
 from app.account import views
+from app.core import admission, capture, compression, instrumentation, metrics, singleflight
+from app.core import views as core_views
 from app.federal import federal
 
 from app.account import models
@@ -10,5 +12,14 @@ app = FastAPI()
 
 models.Base.metadata.create_all(bind=engine)
 
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(instrumentation.QueryCountingMiddleware)
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(singleflight.SingleFlightMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(capture.CaptureMiddleware)
+
 app.include_router(views.router)
-app.include_router(federal.router)
\ No newline at end of file
+app.include_router(federal.router)
+app.include_router(core_views.router)
+app.include_router(core_views.metrics_router)
\ No newline at end of file
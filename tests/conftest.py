@@ -0,0 +1,24 @@
+"""
+Settings shared by the test modules. The application reads its configuration from the environment
+when it is first imported, so it is set here, before any test module imports the application.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DIRECTORY = Path(tempfile.mkdtemp(prefix='misdis-tests-'))
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{DIRECTORY / 'tests.db'}",
+    'QUERY_BUDGET_ENFORCE': '1',
+    'REQUEST_LOG': '0',
+    'SLOW_QUERY_MS': '-1',
+    'FEDERAL_SNAPSHOT_FILE': str(DIRECTORY / 'tests.federal-snapshot'),
+})
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: starts uvicorn workers; skip with -m "not slow"')
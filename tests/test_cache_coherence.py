@@ -0,0 +1,118 @@
+"""
+Checks that the cached federal lists stay coherent across uvicorn workers.
+
+Starts uvicorn with several workers on a generated SQLite database, warms every worker's cache,
+then repeatedly patches a municipality through one worker and keeps reading the municipality list
+on fresh connections, which the kernel spreads over the workers. The staleness of a round is the
+time between the write returning and the last response still showing the old title; it must stay
+within the poll interval plus a tolerance.
+
+    python -m pytest -q tests -m slow
+"""
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from benchmarks.http_bench import ROOT, _free_port, _wait_for_server
+
+LIST = '/federal/municipalities/'
+PID = re.compile(r'^process_info\{pid="(\d+)"\} 1$', re.MULTILINE)
+WORKERS = 2
+ROUNDS = 5
+READERS = 8
+POLL_MS = 500
+# Allowed staleness above the poll interval, for the round trips of the readers.
+TOLERANCE_MS = 250
+MUNICIPALITY = 1
+
+
+async def _title(client: httpx.AsyncClient):
+    response = await client.get(LIST, headers={'connection': 'close'})
+    response.raise_for_status()
+    for row in response.json():
+        if row['id'] == MUNICIPALITY:
+            return row['title']
+    raise AssertionError(f'municipality {MUNICIPALITY} is missing from {LIST}')
+
+
+async def _round(client: httpx.AsyncClient, number: int):
+    title = f'Coherence {number} {time.time_ns()}'
+    response = await client.patch(f'/federal/municipality/{MUNICIPALITY}/', json={'title': title})
+    response.raise_for_status()
+    written = time.monotonic()
+    last_stale = None
+    deadline = written + POLL_MS / 1000 * 3 + TOLERANCE_MS / 1000
+
+    async def reader():
+        nonlocal last_stale
+        while time.monotonic() < deadline:
+            if await _title(client) != title:
+                last_stale = time.monotonic()
+
+    await asyncio.gather(*(reader() for _ in range(READERS)))
+    return 0.0 if last_stale is None else last_stale - written
+
+
+async def _worker_pids(client: httpx.AsyncClient, attempts: int = 50):
+    # Scrapes /metrics on fresh connections until every worker has answered or the attempts run out.
+    pids = set()
+    for _ in range(attempts):
+        responses = await asyncio.gather(*(client.get('/metrics', headers={'connection': 'close'}) for _ in range(WORKERS)))
+        for response in responses:
+            pids.update(PID.findall(response.text))
+        if len(pids) >= WORKERS:
+            break
+    return pids
+
+
+async def _check(base_url: str):
+    limits = httpx.Limits(max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        # A worker that crashed at startup is not restarted; the check is only meaningful when
+        # every worker takes part.
+        pids = await _worker_pids(client)
+        assert len(pids) == WORKERS, f'only {len(pids)} of {WORKERS} workers answered'
+        await asyncio.gather(*(_title(client) for _ in range(WORKERS * 20)))
+        staleness = [await _round(client, number) for number in range(ROUNDS)]
+        survivors = await _worker_pids(client)
+        assert survivors == pids, f'workers {sorted(pids - survivors)} stopped answering during the check'
+    return staleness
+
+
+@pytest.mark.slow
+def test_cached_lists_are_stale_for_at_most_one_poll_interval(tmp_path):
+    from sqlalchemy import create_engine
+
+    from app.core import datagen
+
+    url = f"sqlite:///{tmp_path / 'coherence.db'}"
+    engine = create_engine(url)
+    datagen.generate(engine, users=100)
+    engine.dispose()
+
+    port = _free_port()
+    env = {
+        **os.environ, 'DATABASE_URL': url, 'CACHE_POLL_INTERVAL_MS': str(POLL_MS),
+        'FEDERAL_SNAPSHOT_FILE': str(tmp_path / 'coherence.federal-snapshot'),
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning',
+         '--workers', str(WORKERS)],
+        cwd=ROOT, env=env,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        asyncio.run(_wait_for_server(base_url))
+        staleness = asyncio.run(_check(base_url))
+    finally:
+        server.terminate()
+        server.wait()
+
+    bound = (POLL_MS + TOLERANCE_MS) / 1000
+    assert max(staleness) <= bound, f'stale for {[round(value * 1000, 1) for value in staleness]} ms, bound {bound * 1000:.0f} ms'
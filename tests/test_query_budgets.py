@@ -0,0 +1,133 @@
+"""
+Runs every route with a `@query_budget` against a generated database while budgets are enforced,
+so a route issuing more SQL statements than it declares fails with the statements it issued.
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q tests
+"""
+import importlib
+import os
+
+import pytest
+
+USER = {
+    'first_name': 'Budget', 'last_name': 'Test', 'dob': '2000-01-01', 'email': 'budget.test@example.com',
+    'role': 'Tutor', 'gender': 'Male', 'contact': '+9779800000000',
+    'country': 1, 'province': 1, 'district': 1, 'municipality': 1,
+}
+FEDERAL = (
+    # (singular, plural, parent field)
+    ('country', 'countries', None),
+    ('province', 'provinces', 'country'),
+    ('district', 'districts', 'province'),
+    ('municipality', 'municipalities', 'district'),
+)
+
+
+def _federal_requests():
+    requests = []
+    for singular, plural, parent in FEDERAL:
+        body = {'title': f'Budget {singular}', 'title_ne': 'बजेट', 'code': 'B', 'order': 2}
+        if parent:
+            body[parent] = 1
+        requests += [
+            ('POST', f'/federal/{singular}/', {'json': body}),
+            ('GET', f'/federal/{plural}/', {}),
+            ('GET', f'/federal/{plural}/?lang=ne&expand=' + {
+                'country': 'provinces', 'province': 'country,districts',
+                'district': 'province.country', 'municipality': 'district',
+            }[singular], {}),
+            ('GET', f'/federal/{plural}/?ids=1,2,3', {}),
+            ('POST', f'/federal/{plural}/lookup/', {'json': {'ids': [1, 2, 3]}}),
+            ('GET', f'/federal/{singular}/1/', {}),
+            ('PUT', f'/federal/{singular}/1/', {'json': body}),
+            ('PATCH', f'/federal/{singular}/1/', {'json': {'order': 7}}),
+        ]
+    return requests
+
+
+REQUESTS = [
+    *_federal_requests(),
+    # Reparenting updates move whole subtrees in the closure table.
+    ('PATCH', '/federal/district/2/', {'json': {'province': 3}}),
+    ('PUT', '/federal/municipality/2/', {'json': {'title': 'm', 'title_ne': 'm', 'code': 'c', 'order': 1, 'district': 5}}),
+    ('GET', '/federal/province/1/descendants/?level=municipality', {}),
+    ('GET', '/federal/municipality/3/ancestors/', {}),
+    ('POST', '/federal/batch/', {'json': {'operations': [
+        {'op': 'create', 'table': 'district', 'ref': 'd', 'data': {'title': 'Batch', 'province': 1}},
+        {'op': 'create', 'table': 'municipality', 'ref': 'm', 'data': {'title': 'Batch', 'district': 'd'}},
+        {'op': 'patch', 'table': 'municipality', 'id': 4, 'data': {'district': 'd'}},
+        {'op': 'update', 'table': 'district', 'id': 'd', 'data': {'title': 'Batch', 'province': 2}},
+        {'op': 'delete', 'table': 'municipality', 'id': 'm'},
+        {'op': 'delete', 'table': 'municipality', 'id': 5},
+    ]}}),
+    ('GET', '/federal/changes/', {}),
+    ('GET', '/federal/changes/?since=0', {}),
+    ('POST', '/account/', {'json': USER}),
+    ('GET', '/account/', {}),
+    ('GET', '/account/?region=district:2', {}),
+    ('GET', '/account/?stream=true', {}),
+    ('GET', '/account/stats/', {}),
+    ('GET', '/account/5/', {}),
+    # An unknown email: the known ones reach the password check, which needs a password column.
+    ('POST', '/account/login/', {'data': {'username': 'nobody@example.com', 'password': 'secret'}}),
+    ('DELETE', '/federal/municipality/6/', {}),
+    ('DELETE', '/federal/district/7/', {}),
+    ('DELETE', '/federal/province/7/', {}),
+    ('DELETE', '/federal/country/1/', {}),
+]
+
+
+@pytest.fixture(scope='module')
+def app():
+    # The environment, with budgets enforced, is set in conftest.py.
+    url = os.environ['DATABASE_URL']
+    from sqlalchemy import create_engine
+
+    from app.core import datagen
+
+    engine = create_engine(url)
+    datagen.generate(engine, users=500)
+    engine.dispose()
+    return importlib.import_module('main').app
+
+
+@pytest.fixture(scope='module')
+def client(app):
+    from fastapi.testclient import TestClient
+
+    return TestClient(app)
+
+
+def test_every_budgeted_route_is_exercised(app):
+    from fastapi.routing import APIRoute
+    from starlette.routing import Match
+
+    missing = []
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or getattr(route.endpoint, 'query_budget', None) is None:
+            continue
+        exercised = any(
+            route.matches({'type': 'http', 'method': method, 'path': path.split('?')[0]})[0] == Match.FULL
+            for method, path, _ in REQUESTS
+        )
+        if not exercised:
+            missing.append(f"{','.join(sorted(route.methods))} {route.path}")
+    assert not missing, f'routes without a request in REQUESTS: {missing}'
+
+
+@pytest.mark.parametrize('method,path,kwargs', REQUESTS, ids=[f'{method} {path}' for method, path, _ in REQUESTS])
+def test_route_stays_within_its_budget(client, method, path, kwargs):
+    response = client.request(method, path, **kwargs)
+    assert response.status_code < 500, response.text
+
+
+def test_batch_operations_are_checked_against_their_own_budget(client, monkeypatch):
+    from app.core.querybudget import QueryBudgetExceeded
+    from app.federal import utils
+
+    monkeypatch.setitem(utils.BATCH_BUDGETS, 'create', 1)
+    with pytest.raises(QueryBudgetExceeded, match='operation 0'):
+        client.post('/federal/batch/', json={'operations': [
+            {'op': 'create', 'table': 'district', 'data': {'title': 'Over budget', 'province': 1}},
+        ]})
@@ -0,0 +1,85 @@
+"""
+Checks which GET responses the single-flight middleware shares with concurrent identical requests.
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q tests
+"""
+import asyncio
+
+from app.core.singleflight import SingleFlightMiddleware
+
+START = {'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]}
+
+
+def _scope():
+    return {'type': 'http', 'method': 'GET', 'path': '/federal/municipalities/', 'query_string': b'stream=true',
+            'headers': []}
+
+
+async def _receive():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+def test_buffered_response_is_shared():
+    calls = []
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        calls.append(scope)
+        await release.wait()
+        await send(START)
+        await send({'type': 'http.response.body', 'body': b'[1,2]'})
+
+    async def run():
+        middleware = SingleFlightMiddleware(app)
+        leader_sent, follower_sent = [], []
+        leader = asyncio.create_task(middleware(_scope(), _receive, _append(leader_sent)))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(middleware(_scope(), _receive, _append(follower_sent)))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(leader, follower)
+        return leader_sent, follower_sent
+
+    leader_sent, follower_sent = asyncio.run(run())
+    assert len(calls) == 1
+    assert follower_sent == leader_sent
+
+
+def test_streamed_response_is_not_buffered():
+    calls = []
+    finish = asyncio.Event()
+
+    async def app(scope, receive, send):
+        calls.append(scope)
+        await send(START)
+        await send({'type': 'http.response.body', 'body': b'[1', 'more_body': True})
+        if len(calls) == 1:
+            await finish.wait()
+        await send({'type': 'http.response.body', 'body': b',2]', 'more_body': False})
+
+    async def run():
+        middleware = SingleFlightMiddleware(app)
+        leader_sent, follower_sent = [], []
+        leader = asyncio.create_task(middleware(_scope(), _receive, _append(leader_sent)))
+        await asyncio.sleep(0)
+        # The first chunk is out, so the stream is no longer recorded nor waited on.
+        assert middleware.in_flight == {}
+        # A request arriving mid-stream runs on its own and completes while the first one is still
+        # streaming.
+        await asyncio.wait_for(middleware(_scope(), _receive, _append(follower_sent)), timeout=5)
+        assert not leader.done()
+        finish.set()
+        await leader
+        return leader_sent, follower_sent
+
+    leader_sent, follower_sent = asyncio.run(run())
+    assert len(calls) == 2
+    assert b''.join(message.get('body', b'') for message in follower_sent) == b'[1,2]'
+    assert b''.join(message.get('body', b'') for message in leader_sent) == b'[1,2]'
+
+
+def _append(sent):
+    async def send(message):
+        sent.append(message)
+    return send